@@ -18,6 +18,91 @@ class Settings(BaseSettings):
     embedding_base_url: str = "https://api.openai.com/v1"  
     embedding_model_name: str = "text-embedding-3-small"  
     embedding_dimensions: int = 1536  # Default for text-embedding-3-small
+    embedding_batch_size: int = 64  # Chunks per embedding request during ingestion
+    embedding_encoding_format: str = "base64"  # "float" for providers that cannot return base64
+    embedding_cache_size: int = 1024  # query embeddings kept in memory (0 disables)
+    embedding_index_dimensions: int = 0  # >0: HNSW-index a truncated prefix (Matryoshka models), rescore with full vectors
+    embedding_rescore_oversampling: float = 4.0  # candidates fetched per requested result before rescoring
+    
+    # Cache backend for query embeddings and provider rate limits: "memory://" per process,
+    # "sqlite:////dev/shm/twerlo-cache.db" shared by the workers of a host, or "redis://host:6379/0"
+    cache_url: str = "memory://"
+    cache_max_entries: int = 100000
+    cache_max_bytes: int = 32 * 1024 * 1024  # SQLite: cached values, must fit /dev/shm (Docker default 64MB)
+    embedding_cache_ttl_seconds: int = 86400  # shared cache only; the in-process LRU keeps entries until evicted
+    
+    # Duplicate chunks within a user's documents are stored once and collapsed in search results
+    dedup_enabled: bool = True
+    dedup_similarity_threshold: float = 0.9  # estimated Jaccard similarity of 5-word shingles (1.0 = exact only)
+    
+    # Outbound provider budgets (match the quotas of your provider account)
+    llm_requests_per_minute: int = 500
+    llm_tokens_per_minute: int = 200000
+    llm_max_concurrency: int = 8
+    embedding_requests_per_minute: int = 3000
+    embedding_tokens_per_minute: int = 1000000
+    embedding_max_concurrency: int = 8
+    provider_max_retries: int = 5
+    
+    # /ask time budget (seconds); clients may request a different budget up to the max
+    ask_timeout_seconds: float = 30.0
+    ask_max_timeout_seconds: float = 120.0
+    embedding_timeout_seconds: float = 10.0
+    search_timeout_seconds: float = 5.0
+    llm_timeout_seconds: float = 60.0
+    
+    # Model cascade: answer with a fast model first, escalate to llm_model_name when unsure
+    llm_fast_model_name: str = ""  # empty disables the cascade
+    llm_fast_timeout_seconds: float = 10.0  # escalate when the fast tier takes longer
+    llm_cascade_min_retrieval_score: float = 0.3  # skip the fast tier when the best chunk scores lower
+    llm_cascade_confidence_check: bool = True  # fast tier rates its own answer
+    llm_cascade_min_confidence: float = 0.7
+    
+    # Tracing: exporter is "none", "memory", "file" or a "module:Class" path
+    tracing_exporter: str = "none"
+    tracing_file_path: str = "traces.jsonl"
+    tracing_sample_ratio: float = 1.0  # head sampling
+    tracing_tail_latency_ms: float = 0  # also keep unsampled traces slower than this (0 = off)
+    tracing_keep_errors: bool = True
+    
+    # Logging: JSON lines on stdout written from a background thread
+    log_level: str = "INFO"
+    log_levels: str = ""  # per-module overrides, e.g. "app.endpoints.ask=DEBUG,uvicorn.access=WARNING"
+    log_debug_sample_rate: float = 0.01  # fraction of DEBUG records kept
+    log_queue_size: int = 10000  # records beyond this are dropped instead of blocking
+    
+    # Query analytics rollups (daily rollups are kept)
+    analytics_minute_retention_days: int = 2
+    analytics_hour_retention_days: int = 90
+    analytics_max_buckets: int = 1440  # per /analytics request
+    analytics_flush_seconds: float = 5.0  # how often each worker writes its pending rollup increments
+    analytics_admin_emails: str = ""  # comma-separated users allowed to read global analytics
+    
+    # Query logs: archived to compressed JSONL files, then expired by a TTL index
+    query_log_retention_days: int = 0  # raw logs kept in MongoDB (0 keeps them forever)
+    query_log_archive_after_days: int = 0  # older days are moved to archive files (0 disables)
+    query_log_archive_dir: str = ""  # existing directory on persistent storage; nothing is archived without it
+    
+    # /ask retrieval depth: fetch up to max_chunks, keep what the score distribution supports
+    retrieval_adaptive: bool = True  # false: always the top 5 above the minimum score
+    retrieval_max_chunks: int = 8
+    retrieval_min_chunks: int = 1
+    retrieval_relative_threshold: float = 0.75  # drop chunks scoring below this fraction of the top score
+    retrieval_min_gap: float = 0.08  # a score drop this large between neighbours ends the context
+    retrieval_min_score: float = 0.1  # floor for embedding models without a calibrated one
+    retrieval_min_scores: str = ""  # per model, e.g. "text-embedding-3-small=0.2,text-embedding-3-large=0.25"
+    
+    # Response compression (br needs the brotli package, else only gzip is offered)
+    response_compression: str = "br,gzip"  # encodings in order of preference ("" disables)
+    response_compression_min_bytes: int = 1024  # smaller bodies are sent as is
+    
+    # HTML index: browsers reuse it this long, then revalidate with its ETag (0 = always revalidate)
+    frontend_cache_seconds: int = 300
+    
+    # Readiness: /health/ready passes once dependencies are connected and warmed up
+    warm_up_providers: str = "connect"  # none | connect (list models) | call (one embedding and 1-token completion)
+    health_check_timeout_seconds: float = 5.0
+    health_retry_seconds: float = 5.0  # between warm-up attempts while a dependency is down
     
     # JWT
     jwt_secret_key: str
@@ -30,7 +115,9 @@ class Settings(BaseSettings):
     
     # Qdrant
     qdrant_url: str  
-    qdrant_collection_name: str = "documents"
+    qdrant_collection_name: str = "documents"  # alias in front of the versioned collections
+    vector_index_refresh_seconds: float = 30.0  # how quickly workers follow an alias swap
+    reconcile_interval_seconds: float = 21600  # Mongo/Qdrant orphan cleanup (0 disables)
     
     # App
     app_host: str = "0.0.0.0"
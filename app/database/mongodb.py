@@ -1,10 +1,40 @@
-from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import IndexModel, ASCENDING
 from app.config import settings
+from typing import TYPE_CHECKING, List
 import asyncio
+import logging
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+logger = logging.getLogger(__name__)
+
+# Indexes the request paths rely on, by collection; readiness waits for them
+REQUIRED_INDEXES = {
+    "users": ("email_1",),
+    "query_logs": ("user_id_1_timestamp_-1",),
+    "documents": ("user_id_1",),
+    "chunk_fingerprints": ("user_id_1_content_hash_1", "user_id_1_bands_1"),
+    "query_rollups": ("granularity_1_user_id_1_bucket_1",),
+}
+
+# Indexes earlier versions created that nothing uses any more; dropped once per
+# deploy by `python -m app.tools.indexes` (start.sh), not by every worker
+OBSOLETE_INDEXES = {
+    # Superseded by the (user_id, timestamp) compound index
+    "query_logs": ("user_id_1",),
+}
+
+# Server errors of a concurrent worker having created or dropped the same index
+INDEX_NOT_FOUND = 27
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+
+# Largest expiry MongoDB accepts (~68 years): "never" for an index that already expires,
+# so turning retention off is an in-place change too
+TTL_NEVER = 2147483647
 
 class MongoDB:
-    client: AsyncIOMotorClient = None
+    client: "AsyncIOMotorClient" = None
     database = None
 
 mongodb = MongoDB()
@@ -14,21 +44,86 @@ async def get_database():
 
 async def connect_to_mongo():
     """Create database connection"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    
     mongodb.client = AsyncIOMotorClient(settings.mongodb_url)
     mongodb.database = mongodb.client[settings.database_name]
     
     # Create indexes
     await create_indexes()
-    print(f"Connecting to MongoDB at: {settings.mongodb_url}")
+    logger.info("Connected to MongoDB", extra={"database": settings.database_name})
 
 async def close_mongo_connection():
     """Close database connection"""
     if mongodb.client:
         mongodb.client.close()
-        print("Disconnected from MongoDB")
+        logger.info("Disconnected from MongoDB")
+
+async def sync_ttl_index(collection, field: str, expire_after_seconds):
+    """Make the ascending index on `field` expire documents after the given seconds (None = never)
+
+    Every worker runs this at start-up, concurrently. A missing index is
+    created (a conflict means another worker just did), and an existing one
+    has its expiry changed in place with collMod: no drop, no rebuild.
+    """
+    from pymongo import ASCENDING
+    from pymongo.errors import OperationFailure
+    
+    name = f"{field}_1"
+    current = (await collection.index_information()).get(name)
+    if current is None:
+        options = {} if expire_after_seconds is None else {"expireAfterSeconds": expire_after_seconds}
+        try:
+            await collection.create_index([(field, ASCENDING)], **options)
+            return
+        except OperationFailure as e:
+            if e.code not in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+                raise
+            current = (await collection.index_information()).get(name, {})
+    
+    expiry = current.get("expireAfterSeconds")
+    if expire_after_seconds is None:
+        if expiry is None or expiry == TTL_NEVER:
+            return
+        expire_after_seconds = TTL_NEVER
+    elif expiry == expire_after_seconds:
+        return
+    try:
+        # Adding an expiry to a plain index needs MongoDB 5.1+
+        await mongodb.database.command(
+            "collMod", collection.name,
+            index={"keyPattern": {field: 1}, "expireAfterSeconds": expire_after_seconds}
+        )
+    except OperationFailure as e:
+        logger.error(
+            "Could not change the expiry of %s.%s: %s", collection.name, name, e,
+            extra={"expire_after_seconds": expire_after_seconds}
+        )
+        return
+    logger.info("Synced TTL index", extra={"collection": collection.name, "field": field, "expire_after_seconds": expire_after_seconds})
+
+async def drop_obsolete_indexes() -> List[str]:
+    """Drop OBSOLETE_INDEXES that still exist; returns collection.index_name of those dropped"""
+    from pymongo.errors import OperationFailure
+    
+    dropped = []
+    for collection, names in OBSOLETE_INDEXES.items():
+        existing = await mongodb.database[collection].index_information()
+        for name in names:
+            if name not in existing:
+                continue
+            try:
+                await mongodb.database[collection].drop_index(name)
+            except OperationFailure as e:
+                if e.code != INDEX_NOT_FOUND:
+                    raise
+                continue
+            dropped.append(f"{collection}.{name}")
+    return dropped
 
 async def create_indexes():
     """Create necessary indexes for better performance"""
+    from pymongo import IndexModel, ASCENDING, DESCENDING
     
     # Users collection indexes
     users_collection = mongodb.database.users
@@ -37,18 +132,46 @@ async def create_indexes():
     ]
     await users_collection.create_indexes(user_indexes)
     
-    # Query logs collection indexes  
+    # Query logs collection indexes: per-user history, and expiry by timestamp
     logs_collection = mongodb.database.query_logs
     log_indexes = [
-        IndexModel([("user_id", ASCENDING)]),
-        IndexModel([("timestamp", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)]),
     ]
     await logs_collection.create_indexes(log_indexes)
+    retention_days = settings.query_log_retention_days
+    await sync_ttl_index(logs_collection, "timestamp", retention_days * 86400 if retention_days > 0 else None)
     
     # Documents collection indexes
     documents_collection = mongodb.database.documents
     doc_indexes = [
         IndexModel([("user_id", ASCENDING)]),
         IndexModel([("filename", ASCENDING)]),
+        # Newest-first listing and upload date filters on search
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
     ]
     await documents_collection.create_indexes(doc_indexes)
+    
+    # Duplicate detection: exact matches by hash, near-duplicates by LSH band key
+    await mongodb.database.chunk_fingerprints.create_indexes([
+        IndexModel([("user_id", ASCENDING), ("content_hash", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("bands", ASCENDING)]),
+        IndexModel([("document_id", ASCENDING)]),
+    ])
+    await mongodb.database.chunk_references.create_indexes([
+        IndexModel([("document_id", ASCENDING)]),
+        IndexModel([("point_id", ASCENDING)]),
+    ])
+    
+    # Analytics rollups: range reads per scope, minute/hour buckets expire
+    await mongodb.database.query_rollups.create_indexes([
+        IndexModel([("granularity", ASCENDING), ("user_id", ASCENDING), ("bucket", ASCENDING)]),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ])
+
+async def missing_indexes() -> List[str]:
+    """Required indexes not present in the database, as collection.index_name"""
+    missing = []
+    for collection, names in REQUIRED_INDEXES.items():
+        existing = await mongodb.database[collection].index_information()
+        missing.extend(f"{collection}.{name}" for name in names if name not in existing)
+    return missing
@@ -1,22 +1,84 @@
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
-from qdrant_client.http import models
 from app.config import settings
-from typing import List, Dict, Any, Optional
+from app.services.tracing import traced
+from app.utils.lazy import LazyModule
+from app.utils.minhash import collapse_duplicates
+from app.utils.vectors import VectorLike, as_matrix, to_list, truncate
+from typing import TYPE_CHECKING, Iterable, List, Dict, Any, Optional, Union
+import numpy as np
+import hashlib
+import logging
+import math
 import uuid
 import time
 
+if TYPE_CHECKING:
+    from qdrant_client import QdrantClient
+
+logger = logging.getLogger(__name__)
+
+# qdrant_client takes most of the app's import time; it is loaded on first use
+models = LazyModule("qdrant_client.http.models")
+
+# Named vectors used when a truncated prefix is indexed (two-stage search)
+SHORT_VECTOR = "short"
+FULL_VECTOR = "full"
+
+# Namespace for content-addressed chunk point ids: re-indexing a chunk overwrites
+# its point and unchanged chunks keep their id across document versions
+POINT_ID_NAMESPACE = uuid.UUID("6f1c1c0e-4b1a-4f43-9a53-2f0c5d9e7a10")
+
+# Payload fields with keyword indexes, so filtered searches skip non-matching points
+INDEXED_PAYLOAD_FIELDS = ("user_id", "document_id")
+
 class QdrantDB:
-    client: QdrantClient = None
+    client: "QdrantClient" = None
+    # Active collection; settings.qdrant_collection_name is the alias that points at it
     collection_name: str = settings.qdrant_collection_name
+    # Indexed prefix size per collection as found in Qdrant (0 = single full vector)
+    layouts: Dict[str, int] = {}
 
 qdrant_db = QdrantDB()
 
+def two_stage_enabled() -> bool:
+    """Whether settings ask for a truncated index plus full-vector rescoring"""
+    return 0 < settings.embedding_index_dimensions < settings.embedding_dimensions
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_point_id(document_id: str, content_hash: str) -> str:
+    """Stable point id for a chunk of a document, derived from its content hash"""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{document_id}:{content_hash}"))
+
+def _point_vectors(embeddings: VectorLike, index_dimensions: int) -> Union[List, Dict[str, List]]:
+    """Vectors for one point (1-D input) or a batch (2-D); lists are only built here, at the API boundary"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if not index_dimensions:
+        return embeddings.tolist()
+    return {
+        SHORT_VECTOR: truncate(embeddings, index_dimensions).tolist(),
+        FULL_VECTOR: embeddings.tolist()
+    }
+
+def _payload(text_chunk: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "text": text_chunk,
+        "user_id": metadata.get("user_id"),
+        "document_id": metadata.get("document_id"),
+        "filename": metadata.get("filename"),
+        "chunk_index": metadata.get("chunk_index", 0),
+        "start_char": metadata.get("start_char"),
+        "end_char": metadata.get("end_char"),
+        "created_at": metadata.get("created_at")
+    }
+
 async def get_qdrant_client():
     return qdrant_db.client
 
 def connect_to_qdrant():
     """Create Qdrant connection"""
+    from qdrant_client import QdrantClient
+
     qdrant_db.client = QdrantClient(
         url=settings.qdrant_url,
         prefer_grpc=False,
@@ -25,60 +87,126 @@ def connect_to_qdrant():
         timeout=30.0  # Increased timeout for Railway
     )
 
-    print(f"Connected to Qdrant at: {settings.qdrant_url}")
+    logger.info("Connected to Qdrant", extra={"qdrant_url": settings.qdrant_url})
 
 def close_qdrant_connection():
     """Close Qdrant connection"""
     if qdrant_db.client:
         qdrant_db.client.close()
-        print("Disconnected from Qdrant")
+        logger.info("Disconnected from Qdrant")
 
-def ensure_collection_exists():
-    """Ensure collection exists, create if needed"""
-    try:
-        collections = qdrant_db.client.get_collections()
-        collection_names = [col.name for col in collections.collections]
-        
-        if qdrant_db.collection_name not in collection_names:
-            from app.config import settings
-            qdrant_db.client.create_collection(
-                collection_name=qdrant_db.collection_name,
-                vectors_config=VectorParams(
-                    size=settings.embedding_dimensions,
-                    distance=Distance.COSINE
-                )
+def _vectors_config(dimensions: int, index_dimensions: int):
+    if not 0 < index_dimensions < dimensions:
+        return models.VectorParams(size=dimensions, distance=models.Distance.COSINE)
+    return {
+        # Short prefix carries the HNSW graph and stays in RAM
+        SHORT_VECTOR: models.VectorParams(size=index_dimensions, distance=models.Distance.COSINE),
+        # Full vectors are only read for rescoring: on disk, no graph
+        FULL_VECTOR: models.VectorParams(
+            size=dimensions,
+            distance=models.Distance.COSINE,
+            on_disk=True,
+            hnsw_config=models.HnswConfigDiff(m=0)
+        )
+    }
+
+def ensure_payload_indexes(collection_name: str, existing: Iterable[str] = ()):
+    """Keyword-index the payload fields every search filters on (tenant, and document scope)"""
+    for field_name in INDEXED_PAYLOAD_FIELDS:
+        if field_name not in existing:
+            qdrant_db.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=models.PayloadSchemaType.KEYWORD
             )
+
+def create_collection(collection_name: str, dimensions: int, index_dimensions: int = 0):
+    """Create a collection for the given embedding size (and optional indexed prefix)"""
+    qdrant_db.client.create_collection(
+        collection_name=collection_name,
+        vectors_config=_vectors_config(dimensions, index_dimensions)
+    )
+    ensure_payload_indexes(collection_name)
+    qdrant_db.layouts[collection_name] = index_dimensions if 0 < index_dimensions < dimensions else 0
+
+def collection_exists(collection_name: str) -> bool:
+    collections = qdrant_db.client.get_collections()
+    return collection_name in [col.name for col in collections.collections]
+
+def ensure_collection_exists(collection_name: Optional[str] = None) -> int:
+    """Ensure collection exists, create if needed; returns its indexed prefix size (0 = full vectors)"""
+    collection_name = collection_name or qdrant_db.collection_name
+    if collection_name in qdrant_db.layouts:
+        return qdrant_db.layouts[collection_name]
+    try:
+        if not collection_exists(collection_name):
+            create_collection(collection_name, settings.embedding_dimensions, settings.embedding_index_dimensions)
+        else:
+            info = qdrant_db.client.get_collection(collection_name)
+            # Collections created before payload indexes get them on first use
+            ensure_payload_indexes(collection_name, info.payload_schema or {})
+            vectors = info.config.params.vectors
+            two_stage = isinstance(vectors, dict) and SHORT_VECTOR in vectors
+            qdrant_db.layouts[collection_name] = vectors[SHORT_VECTOR].size if two_stage else 0
+        return qdrant_db.layouts[collection_name]
     except Exception as e:
-        print(f"Failed to ensure collection exists: {e}")
+        logger.error("Failed to ensure collection exists: %s", e)
         raise
 
+def get_alias_target(alias: str) -> Optional[str]:
+    """Collection an alias currently points at, or None if there is no such alias"""
+    for description in qdrant_db.client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+def swap_alias(alias: str, collection_name: str, replace_collection: bool = False):
+    """Point `alias` at `collection_name` in one atomic alias update
+
+    A pre-alias deployment has a real collection under the alias name; it
+    must be dropped before the alias can exist, which is not atomic and
+    therefore needs `replace_collection`.
+    """
+    operations = []
+    if get_alias_target(alias) is not None:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    elif collection_exists(alias):
+        if not replace_collection:
+            raise ValueError(
+                f"'{alias}' is a collection, not an alias; replacing it drops the old vectors"
+            )
+        logger.warning("Dropping pre-alias collection to create the alias", extra={"collection": alias})
+        qdrant_db.client.delete_collection(alias)
+        qdrant_db.layouts.pop(alias, None)
+    operations.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)
+    ))
+    qdrant_db.client.update_collection_aliases(change_aliases_operations=operations)
+
+def count_document_points(document_id: str, collection_name: Optional[str] = None) -> int:
+    return qdrant_db.client.count(
+        collection_name=collection_name or qdrant_db.collection_name,
+        count_filter=models.Filter(must=[models.FieldCondition(key="document_id", match=models.MatchValue(value=document_id))]),
+        exact=True
+    ).count
+
 def store_embeddings(
-    embeddings: List[float],
+    embeddings: VectorLike,
     text_chunk: str,
     metadata: Dict[str, Any]
 ) -> str:
     """Store embeddings in Qdrant"""
     try:
         # Ensure collection exists before storing
-        ensure_collection_exists()
+        index_dimensions = ensure_collection_exists()
         
         point_id = str(uuid.uuid4())
         
-        # Prepare payload with metadata
-        payload = {
-            "text": text_chunk,
-            "user_id": metadata.get("user_id"),
-            "document_id": metadata.get("document_id"), 
-            "filename": metadata.get("filename"),
-            "chunk_index": metadata.get("chunk_index", 0),
-            "created_at": metadata.get("created_at")
-        }
-        
         # Create point
-        point = PointStruct(
+        point = models.PointStruct(
             id=point_id,
-            vector=embeddings,
-            payload=payload
+            vector=_point_vectors(embeddings, index_dimensions),
+            payload=_payload(text_chunk, metadata)
         )
         
         # Upload point
@@ -90,38 +218,97 @@ def store_embeddings(
         return point_id
         
     except Exception as e:
-        print(f"Error storing embeddings: {e}")
+        logger.error("Error storing embeddings: %s", e)
         raise
 
+@traced("qdrant.upsert")
+def store_embeddings_batch(
+    embeddings: VectorLike,
+    text_chunks: List[str],
+    metadatas: List[Dict[str, Any]],
+    point_ids: Optional[List[str]] = None,
+    collection_name: Optional[str] = None
+) -> List[str]:
+    """Store a batch of embeddings (a float32 matrix, one row per chunk) with a single upsert
+
+    Existing points with the same ids are overwritten. Writes go to the
+    active collection unless `collection_name` is given.
+    """
+    try:
+        collection_name = collection_name or qdrant_db.collection_name
+        index_dimensions = ensure_collection_exists(collection_name)
+        
+        matrix = as_matrix(embeddings)
+        ids = point_ids or [str(uuid.uuid4()) for _ in range(len(matrix))]
+        
+        # Columnar batch built without validation: the vectors are already
+        # float32-derived Python floats, and per-point models would re-check
+        # every component
+        batch = models.Batch.model_construct(
+            ids=ids,
+            vectors=_point_vectors(matrix, index_dimensions),
+            payloads=[_payload(text, metadata) for text, metadata in zip(text_chunks, metadatas)]
+        )
+        qdrant_db.client.upsert(
+            collection_name=collection_name,
+            points=batch
+        )
+        
+        return ids
+        
+    except Exception as e:
+        logger.error("Error storing embeddings batch: %s", e)
+        raise
+
+@traced("qdrant.search_similar_chunks")
 def search_similar_chunks(
-    query_embedding: List[float],
+    query_embedding: VectorLike,
     user_id: str,
     limit: int = 5,
-    score_threshold: float = 0.7
+    score_threshold: float = 0.7,
+    document_ids: Optional[List[str]] = None,
+    point_ids: Optional[List[str]] = None
 ) -> List[Dict[str, Any]]:
-    """Search for similar text chunks for a specific user"""
+    """Search for similar text chunks for a specific user
+
+    `document_ids` restricts the search to those documents' points;
+    `point_ids` adds points they only reference (duplicates owned elsewhere).
+    """
     try:
         # Ensure collection exists before searching
-        ensure_collection_exists()
+        index_dimensions = ensure_collection_exists()
         
         # Filter by user_id to ensure data isolation
-        user_filter = Filter(
+        user_filter = models.Filter(
             must=[
-                FieldCondition(
+                models.FieldCondition(
                     key="user_id",
-                    match=MatchValue(value=user_id)
+                    match=models.MatchValue(value=user_id)
                 )
             ]
         )
+        if document_ids is not None:
+            if not document_ids and not point_ids:
+                return []
+            scope = [models.FieldCondition(key="document_id", match=models.MatchAny(any=document_ids))]
+            if point_ids:
+                scope.append(models.HasIdCondition(has_id=point_ids))
+            user_filter.must.append(models.Filter(should=scope))
+        
+        # Fetch spares for the near-duplicates collapsed below
+        fetch_limit = limit * 2 if settings.dedup_enabled else limit
         
         # Search
-        search_result = qdrant_db.client.search(
-            collection_name=qdrant_db.collection_name,
-            query_vector=query_embedding,
-            query_filter=user_filter,
-            limit=limit,
-            score_threshold=score_threshold
-        )
+        if index_dimensions:
+            search_result = _search_two_stage(query_embedding, index_dimensions, user_filter, fetch_limit, score_threshold)
+        else:
+            search_result = qdrant_db.client.search(
+                collection_name=qdrant_db.collection_name,
+                query_vector=to_list(query_embedding),
+                query_filter=user_filter,
+                limit=fetch_limit,
+                score_threshold=score_threshold
+            )
         
         # Format results
         results = []
@@ -132,25 +319,166 @@ def search_similar_chunks(
                 "metadata": {
                     "document_id": hit.payload.get("document_id"),
                     "filename": hit.payload.get("filename"),
-                    "chunk_index": hit.payload.get("chunk_index")
+                    "chunk_index": hit.payload.get("chunk_index"),
+                    # Character range in the document's text (absent for points stored before offsets)
+                    "start_char": hit.payload.get("start_char"),
+                    "end_char": hit.payload.get("end_char")
                 }
             })
+        
+        if settings.dedup_enabled:
+            # Copies stored before duplicate detection, or of different documents' passages
+            results = collapse_duplicates(results, settings.dedup_similarity_threshold)
             
-        return results
+        return results[:limit]
         
     except Exception as e:
-        print(f"Error searching similar chunks: {e}")
+        logger.error("Error searching similar chunks: %s", e)
         raise
 
+def _search_two_stage(
+    query_embedding: VectorLike,
+    index_dimensions: int,
+    user_filter: "models.Filter",
+    limit: int,
+    score_threshold: Optional[float]
+):
+    """Candidate search on the short vectors, then exact rescoring with full vectors
+
+    No threshold is applied to the first stage: truncated cosine scores are
+    not comparable with full-length ones, so the caller's threshold only
+    applies to the rescored results.
+    """
+    candidates = qdrant_db.client.search(
+        collection_name=qdrant_db.collection_name,
+        query_vector=(SHORT_VECTOR, truncate(query_embedding, index_dimensions).tolist()),
+        query_filter=user_filter,
+        limit=max(limit, math.ceil(limit * settings.embedding_rescore_oversampling)),
+        with_payload=False
+    )
+    if not candidates:
+        return []
+    
+    rescore_filter = models.Filter(must=[*user_filter.must, models.HasIdCondition(has_id=[hit.id for hit in candidates])])
+    return qdrant_db.client.search(
+        collection_name=qdrant_db.collection_name,
+        query_vector=(FULL_VECTOR, to_list(query_embedding)),
+        query_filter=rescore_filter,
+        limit=limit,
+        score_threshold=score_threshold,
+        search_params=models.SearchParams(exact=True)
+    )
+
+def update_document_points(
+    document_id: str,
+    removed_ids: List[str],
+    positions: Dict[str, Dict[str, Any]],
+    payload: Optional[Dict[str, Any]] = None
+):
+    """Delete removed chunks, move kept chunks to their new position and update shared payload, in one request
+
+    `positions` maps point ids to their new chunk_index, start_char and end_char.
+    """
+    operations = []
+    if removed_ids:
+        operations.append(models.DeleteOperation(delete=models.PointIdsList(points=removed_ids)))
+    for point_id, position in positions.items():
+        operations.append(models.SetPayloadOperation(
+            set_payload=models.SetPayload(payload=position, points=[point_id])
+        ))
+    if payload:
+        document_filter = models.Filter(must=[models.FieldCondition(key="document_id", match=models.MatchValue(value=document_id))])
+        operations.append(models.SetPayloadOperation(
+            set_payload=models.SetPayload(payload=payload, filter=document_filter)
+        ))
+    if operations:
+        qdrant_db.client.batch_update_points(
+            collection_name=qdrant_db.collection_name,
+            update_operations=operations
+        )
+
+def set_point_payloads(payloads: Dict[str, Dict[str, Any]]):
+    """Overwrite payload fields of individual points, in one request"""
+    if not payloads:
+        return
+    qdrant_db.client.batch_update_points(
+        collection_name=qdrant_db.collection_name,
+        update_operations=[
+            models.SetPayloadOperation(set_payload=models.SetPayload(payload=payload, points=[point_id]))
+            for point_id, payload in payloads.items()
+        ]
+    )
+
+def delete_points(point_ids: List[str], collection_name: Optional[str] = None):
+    if point_ids:
+        qdrant_db.client.delete(
+            collection_name=collection_name or qdrant_db.collection_name,
+            points_selector=models.PointIdsList(points=point_ids)
+        )
+
+def scroll_points(
+    offset=None, limit: int = 1000, fields: Optional[List[str]] = None, collection_name: Optional[str] = None
+):
+    """One page of points with the given payload fields; returns (points, next_offset)"""
+    return qdrant_db.client.scroll(
+        collection_name=collection_name or qdrant_db.collection_name,
+        offset=offset,
+        limit=limit,
+        with_payload=fields or False,
+        with_vectors=False
+    )
+
+def scroll_document_points(
+    document_ids: List[str], fields: Optional[List[str]] = None, collection_name: Optional[str] = None
+) -> List:
+    """All points of the given documents, with the given payload fields"""
+    document_filter = models.Filter(
+        must=[models.FieldCondition(key="document_id", match=models.MatchAny(any=document_ids))]
+    )
+    points, offset = [], None
+    while True:
+        page, offset = qdrant_db.client.scroll(
+            collection_name=collection_name or qdrant_db.collection_name,
+            scroll_filter=document_filter,
+            offset=offset,
+            limit=1000,
+            with_payload=fields or False,
+            with_vectors=False
+        )
+        points.extend(page)
+        if offset is None:
+            return points
+
+def existing_point_ids(point_ids: List[str]) -> set:
+    if not point_ids:
+        return set()
+    records = qdrant_db.client.retrieve(
+        collection_name=qdrant_db.collection_name,
+        ids=point_ids,
+        with_payload=False
+    )
+    return {str(record.id) for record in records}
+
+def delete_document_points(document_id: str, keep_ids: Optional[List[str]] = None):
+    """Delete the chunks of a document, except for `keep_ids`"""
+    document_filter = models.Filter(
+        must=[models.FieldCondition(key="document_id", match=models.MatchValue(value=document_id))],
+        must_not=[models.HasIdCondition(has_id=keep_ids)] if keep_ids else None
+    )
+    qdrant_db.client.delete(
+        collection_name=qdrant_db.collection_name,
+        points_selector=models.FilterSelector(filter=document_filter)
+    )
+
 def delete_user_documents(user_id: str) -> bool:
     """Delete all documents for a specific user"""
     try:
         # Filter by user_id
-        user_filter = Filter(
+        user_filter = models.Filter(
             must=[
-                FieldCondition(
+                models.FieldCondition(
                     key="user_id", 
-                    match=MatchValue(value=user_id)
+                    match=models.MatchValue(value=user_id)
                 )
             ]
         )
@@ -164,5 +492,5 @@ def delete_user_documents(user_id: str) -> bool:
         return True
         
     except Exception as e:
-        print(f"Error deleting user documents: {e}")
+        logger.error("Error deleting user documents: %s", e)
         return False
@@ -0,0 +1,85 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from datetime import datetime
+from typing import Literal, Optional
+import logging
+
+from app.config import settings
+from app.schemas.analytics import UsageBucket, UsageResponse, UsageStats
+from app.schemas.user import UserInDB
+from app.services.analytics import GRANULARITIES, analytics_service, summarize
+from app.services.auth import get_current_active_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+Granularity = Literal["minute", "hour", "day"]
+
+def _admin_emails() -> set:
+    return {email.strip().lower() for email in settings.analytics_admin_emails.split(",") if email.strip()}
+
+async def _usage(
+    scope: str,
+    user_id: Optional[str],
+    granularity: str,
+    start: Optional[datetime],
+    end: Optional[datetime]
+) -> UsageResponse:
+    # Naive UTC throughout, like the query log timestamps
+    end = (end or datetime.utcnow()).replace(tzinfo=None)
+    step = GRANULARITIES[granularity]
+    start = (start.replace(tzinfo=None) if start else end - step * 24)
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must be before end")
+    if (end - start) / step > settings.analytics_max_buckets:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range spans more than {settings.analytics_max_buckets} {granularity} buckets; use a coarser granularity"
+        )
+
+    try:
+        rollups = await analytics_service.usage(user_id, granularity, start, end)
+    except Exception as e:
+        logger.error("Error reading query rollups: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to load analytics"
+        )
+
+    return UsageResponse(
+        scope=scope,
+        granularity=granularity,
+        start=start,
+        end=end,
+        total=UsageStats(**summarize(rollups)),
+        buckets=[UsageBucket(bucket=rollup["bucket"], **summarize([rollup])) for rollup in rollups]
+    )
+
+@router.get("/usage", response_model=UsageResponse)
+async def my_usage(
+    granularity: Granularity = "hour",
+    start: Optional[datetime] = Query(default=None, description="UTC; defaults to 24 buckets before end"),
+    end: Optional[datetime] = Query(default=None, description="UTC; defaults to now"),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Question volume, latency and retrieval stats for the current user
+
+    - **granularity**: minute, hour or day buckets (minute buckets are kept for a few days)
+    - Returns: totals for the range and one entry per bucket with traffic
+    """
+    return await _usage("user", str(current_user.id), granularity, start, end)
+
+@router.get("/usage/global", response_model=UsageResponse)
+async def global_usage(
+    granularity: Granularity = "hour",
+    start: Optional[datetime] = Query(default=None, description="UTC; defaults to 24 buckets before end"),
+    end: Optional[datetime] = Query(default=None, description="UTC; defaults to now"),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    The same stats across all users (restricted to ANALYTICS_ADMIN_EMAILS)
+    """
+    if current_user.email.lower() not in _admin_emails():
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to read global analytics")
+    return await _usage("global", None, granularity, start, end)
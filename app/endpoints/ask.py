@@ -1,91 +1,177 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+import asyncio
+import logging
 import time
 
-from app.schemas.query import QuestionRequest, AnswerResponse, RetrievedChunk
+from app.config import settings
+from app.schemas.query import QuestionRequest, AnswerResponse, chunk_fields
 from app.schemas.user import UserInDB
 from app.services.auth import get_current_active_user
 from app.services.embedding_service import embedding_service
-from app.services.llm_service import llm_service
 from app.services.logging_service import logging_service
+from app.services.metrics import ASK_ROUTE, observe_stage
+from app.services.model_cascade import CascadeTimeout, model_cascade
+from app.services.retrieval_policy import retrieval_policy
+from app.services.search_scope import resolve_scope
 from app.database.qdrant_client import search_similar_chunks
+from app.utils.serialization import ModelResponse
+from app.utils.deadline import (
+    Deadline, DeadlineExceeded, ClientDisconnected, current_deadline, cancel_on_disconnect
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Non-standard status used by nginx & co. for requests the client abandoned
+CLIENT_CLOSED_REQUEST = 499
+
 @router.post("/ask", response_model=AnswerResponse)
 async def ask_question(
     question_request: QuestionRequest,
+    request: Request,
     current_user: UserInDB = Depends(get_current_active_user)
 ):
     """
     Ask a question and get an AI-generated answer based on uploaded documents
-    
+
     - **question**: The question to ask (1-1000 characters)
-    - Returns: AI-generated answer with context and metadata
+    - **timeout_seconds**: Optional time budget for this request (capped server-side)
+    - **filters**: Optional scope: `document_ids`, `filenames` (glob patterns) and
+      `uploaded_after` / `uploaded_before`; all given criteria must match
+    - **chunk_format**: `text` (default) returns the retrieved chunks in full;
+      `reference` returns document id, chunk index, score and character offsets only
+    - Returns: AI-generated answer with context and metadata. If generation runs
+      out of time the retrieved chunks are returned with `answer: null`.
     """
-    
+
     start_time = time.time()
-    
+
+    timeout_seconds = min(
+        question_request.timeout_seconds or settings.ask_timeout_seconds,
+        settings.ask_max_timeout_seconds
+    )
+    deadline = Deadline(timeout_seconds)
+    current_deadline.set(deadline)
+
     try:
-        # Generate embedding for the question
-        question_embedding = await embedding_service.generate_embedding(
-            question_request.question
+        return ModelResponse(await cancel_on_disconnect(
+            request,
+            _answer_question(question_request, current_user, deadline, start_time)
+        ))
+
+    except ClientDisconnected:
+        logger.info("Client disconnected, abandoned question", extra={"user_id": str(current_user.id)})
+        raise HTTPException(
+            status_code=CLIENT_CLOSED_REQUEST,
+            detail="Client closed request"
         )
-        
-        # Search for similar chunks in user's documents
-        similar_chunks = search_similar_chunks(
-            query_embedding=question_embedding,
-            user_id=str(current_user.id),
-            limit=5,  
-            score_threshold=0.1  # lower threshold for text-embedding-3-small model
+    except DeadlineExceeded as e:
+        logger.warning("Question timed out during %s", e.stage, extra={"timeout_seconds": timeout_seconds})
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"Timed out while {e.stage}"
         )
-        
-        print(f"DEBUG: User {current_user.id} asked: '{question_request.question}'")
-        print(f"DEBUG: Found {len(similar_chunks)} chunks with scores: {[chunk.get('score', 0) for chunk in similar_chunks]}")
-        
-        # Generate answer using LLM
-        answer = await llm_service.generate_answer(
-            question=question_request.question,
-            context_chunks=similar_chunks
+    except Exception as e:
+        logger.exception("Error processing question: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to process question and generate answer"
+        )
+
+async def _answer_question(
+    question_request: QuestionRequest,
+    current_user: UserInDB,
+    deadline: Deadline,
+    start_time: float
+) -> AnswerResponse:
+    """Run the retrieval and generation stages within the request deadline"""
+
+    # Generate embedding for the question
+    with observe_stage(ASK_ROUTE, "embedding"):
+        question_embedding, cache_hit = await deadline.run(
+            embedding_service.generate_embedding_cached(question_request.question),
+            stage="embedding the question",
+            stage_timeout=settings.embedding_timeout_seconds
+        )
+
+    # Search for similar chunks in user's documents (sync client, run off the loop)
+    min_score = retrieval_policy.min_score(embedding_service.model)
+    with observe_stage(ASK_ROUTE, "search"):
+        scope = await deadline.run(
+            resolve_scope(str(current_user.id), question_request.filters),
+            stage="searching documents",
+            stage_timeout=settings.search_timeout_seconds
         )
-        
-        # Format retrieved chunks for response
-        retrieved_chunks = [
-            RetrievedChunk(
-                text=chunk["text"],
-                score=chunk["score"],
-                metadata=chunk["metadata"]
+        similar_chunks = await deadline.run(
+            asyncio.to_thread(
+                search_similar_chunks,
+                query_embedding=question_embedding,
+                user_id=str(current_user.id),
+                limit=retrieval_policy.fetch_limit,
+                score_threshold=min_score,
+                document_ids=scope.document_ids,
+                point_ids=scope.point_ids
+            ),
+            stage="searching documents",
+            stage_timeout=settings.search_timeout_seconds
+        )
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Retrieved chunks for question",
+            extra={
+                "user_id": str(current_user.id),
+                "question_length": len(question_request.question),
+                "scores": [chunk.get("score", 0) for chunk in similar_chunks]
+            }
+        )
+
+    # Keep only as many chunks as the score distribution supports
+    similar_chunks, retrieval = retrieval_policy.select(similar_chunks, min_score)
+
+    # Generate answer using the model cascade; on timeout fall back to returning the chunks only
+    try:
+        with observe_stage(ASK_ROUTE, "llm"):
+            answer, cascade = await model_cascade.answer(
+                question=question_request.question,
+                chunks=similar_chunks,
+                deadline=deadline
             )
-            for chunk in similar_chunks
-        ]
-        
-        # Calculate response time
-        end_time = time.time()
-        response_time_ms = int((end_time - start_time) * 1000)
-        
-        # Log the query 
-        try:
+    except CascadeTimeout as e:
+        answer, cascade = None, e.decision
+    # Also set when an escalated fast answer is returned because the strong tier ran out of time
+    timed_out = cascade.timed_out
+
+    # Calculate response time
+    end_time = time.time()
+    response_time_ms = int((end_time - start_time) * 1000)
+
+    # Log the query
+    try:
+        with observe_stage(ASK_ROUTE, "logging"):
             await logging_service.log_query(
                 user_id=str(current_user.id),
                 question=question_request.question,
-                answer=answer,
+                answer=answer or "",
                 response_time_ms=response_time_ms,
-                retrieved_chunks_count=len(retrieved_chunks)
+                retrieved_chunks_count=len(similar_chunks),
+                timed_out=timed_out,
+                cache_hit=cache_hit,
+                retrieval=retrieval.to_dict(),
+                cascade=cascade.to_dict()
             )
-        except Exception as log_error:
-            print(f"Error logging query: {log_error}")
-            # Continue without raising error
-        
-        # Return response
-        return AnswerResponse(
-            question=question_request.question,
-            answer=answer,
-            retrieved_chunks=retrieved_chunks,
-            response_time_ms=response_time_ms
-        )
-        
-    except Exception as e:
-        print(f"Error processing question: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to process question and generate answer"
-        )
+    except Exception as log_error:
+        logger.error("Error logging query: %s", log_error)
+        # Continue without raising error
+
+    # Return response
+    return AnswerResponse(
+        question=question_request.question,
+        answer=answer,
+        **chunk_fields(similar_chunks, question_request.chunk_format),
+        response_time_ms=response_time_ms,
+        timed_out=timed_out,
+        model_tier=cascade.tier if answer is not None else None,
+        low_confidence=cascade.low_confidence
+    )
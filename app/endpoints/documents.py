@@ -1,15 +1,22 @@
 from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, status, Path
 from typing import List
+import asyncio
+import logging
 
-from app.schemas.document import DocumentResponse
+from app.schemas.document import DocumentResponse, DocumentUpdateResponse
 from app.schemas.user import UserInDB
-from app.schemas.document import RetrievedChunk, DocumentListResponse, DeleteResponse, TestRetrievalRequest, TestRetrievalResponse
+from app.schemas.document import DocumentListResponse, DeleteResponse, TestRetrievalRequest, TestRetrievalResponse
+from app.schemas.query import chunk_fields
 
 from app.services.auth import get_current_active_user
 from app.services.document_processor import document_processor
+from app.services.search_scope import resolve_scope
 from app.database.mongodb import get_database
 from app.services.embedding_service import embedding_service
 from app.database.qdrant_client import search_similar_chunks
+from app.utils.serialization import ModelResponse
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -47,7 +54,7 @@ async def list_user_documents(
         return documents
         
     except Exception as e:
-        print(f"Error listing documents: {e}")
+        logger.error("Error listing documents: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to list documents"
@@ -81,6 +88,39 @@ async def upload_document(
         )
 
 
+@router.put("/{document_id}", response_model=DocumentUpdateResponse)
+async def update_document(
+    document_id: str = Path(..., description="ID of the document to update"),
+    file: UploadFile = File(..., description="New version of the document (PDF or TXT format)"),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Replace a document with a new version
+    
+    - **document_id**: The ID of the document to update
+    - **file**: New version of the document (PDF or TXT format)
+    - Returns: Document information and how many chunks were re-embedded
+    
+    Only chunks whose text changed are embedded again; unchanged chunks keep their vectors.
+    """
+    
+    try:
+        return await document_processor.update_document(
+            document_id=document_id,
+            file=file,
+            user_id=str(current_user.id)
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error updating document: %s", e, extra={"document_id": document_id})
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update document"
+        )
+
+
 @router.delete("/{document_id}", response_model=DeleteResponse)
 async def delete_document(
     document_id: str = Path(..., description="ID of the document to delete"),
@@ -122,27 +162,7 @@ async def delete_document(
             )
         
         # Delete associated chunks from Qdrant
-        from app.database.qdrant_client import qdrant_db
-        from qdrant_client.models import Filter, FieldCondition, MatchValue
-        from qdrant_client.http import models
-        
-        document_filter = Filter(
-            must=[
-                FieldCondition(
-                    key="user_id",
-                    match=MatchValue(value=str(current_user.id))
-                ),
-                FieldCondition(
-                    key="document_id",
-                    match=MatchValue(value=document_id)
-                )
-            ]
-        )
-        
-        qdrant_db.client.delete(
-            collection_name=qdrant_db.collection_name,
-            points_selector=models.FilterSelector(filter=document_filter)
-        )
+        await document_processor.delete_document_vectors(document_id)
         
         return DeleteResponse(
             message="Document deleted successfully",
@@ -152,7 +172,7 @@ async def delete_document(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting document: {e}")
+        logger.error("Error deleting document: %s", e, extra={"document_id": document_id})
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to delete document"
@@ -168,6 +188,8 @@ async def test_retrieval(
     Test retrieval system without LLM generation - for debugging
     
     - **query**: The query to test retrieval for
+    - **filters**: Optional scope by `document_ids`, `filenames` (glob patterns) and upload dates
+    - **chunk_format**: `text` (default) or `reference` (ids, scores and offsets without the chunk text)
     - Returns: Detailed retrieval information including embeddings and scores
     """
     
@@ -181,35 +203,29 @@ async def test_retrieval(
         score_threshold = test_request.score_threshold
         limit = test_request.limit 
         
-        # Search for similar chunks in user's documents
-        similar_chunks = search_similar_chunks(
+        # Search for similar chunks in user's documents (sync client, run off the loop)
+        scope = await resolve_scope(str(current_user.id), test_request.filters)
+        similar_chunks = await asyncio.to_thread(
+            search_similar_chunks,
             query_embedding=query_embedding,
             user_id=str(current_user.id),
             limit=limit,  # Get more results for testing
-            score_threshold=score_threshold
+            score_threshold=score_threshold,
+            document_ids=scope.document_ids,
+            point_ids=scope.point_ids
         )
         
-        # Format retrieved chunks for response
-        retrieved_chunks = [
-            RetrievedChunk(
-                text=chunk["text"],
-                score=chunk["score"],
-                metadata=chunk["metadata"]
-            )
-            for chunk in similar_chunks
-        ]
-        
         # Return test response
-        return TestRetrievalResponse(
+        return ModelResponse(TestRetrievalResponse(
             query=test_request.query,
-            embedding_preview=query_embedding[:5],  # First 5 values
-            chunks_found=len(retrieved_chunks),
-            retrieved_chunks=retrieved_chunks,
+            embedding_preview=query_embedding[:5].tolist(),  # First 5 values
+            chunks_found=len(similar_chunks),
+            **chunk_fields(similar_chunks, test_request.chunk_format),
             score_threshold_used=score_threshold
-        )
+        ))
         
     except Exception as e:
-        print(f"Error testing retrieval: {e}")
+        logger.error("Error testing retrieval: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to test retrieval: {str(e)}"
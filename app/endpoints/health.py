@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.services.health import readiness, check_ready
+
+router = APIRouter()
+
+@router.get("/live", include_in_schema=False)
+async def live():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@router.get("/ready", include_in_schema=False)
+async def ready():
+    """Readiness: dependencies connected and warmed up; 503 until then and while shutting down"""
+    ok = await check_ready()
+    status = readiness.status if readiness.status != "ready" or ok else "unavailable"
+    return JSONResponse(
+        status_code=200 if ok else 503,
+        content={"status": status, "checks": readiness.checks}
+    )
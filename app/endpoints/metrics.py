@@ -0,0 +1,10 @@
+from fastapi import APIRouter, Response
+
+from app.services.metrics import CONTENT_TYPE_LATEST, render_metrics
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Expose Prometheus metrics in the text exposition format"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
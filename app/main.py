@@ -1,30 +1,78 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from contextlib import asynccontextmanager
-import time
+import asyncio
+import functools
+import logging
+
+from app.utils.logger import configure_logging, shutdown_logging, RequestIdMiddleware
+
+# Configure logging before the service modules are imported and log their setup
+configure_logging()
+logger = logging.getLogger(__name__)
 
 from app.database.mongodb import connect_to_mongo, close_mongo_connection
 from app.database.qdrant_client import connect_to_qdrant, close_qdrant_connection
+from app.config import settings
+from app.services.cache import connect_cache, close_cache
+from app.services.metrics import PrometheusMiddleware, mark_worker_stopped
+from app.services.tracing import TracingMiddleware
+from app.services.vector_index import refresh_active_index, run_index_refresher
+from app.services.reconciler import run_reconciler
+from app.services.log_archive import run_log_archiver
+from app.services.analytics import run_rollup_flusher
+from app.services.health import readiness, warm_up
+from app.utils.compression import CompressionMiddleware
+from app.utils.static_assets import StaticAsset
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    print("Starting up Twerlo API...")
-    await connect_to_mongo()
-    connect_to_qdrant()
+    logger.info("Starting up Twerlo API")
+    # Each worker process opens its own connections here, never at import time
+    await connect_cache()
+    # Importing qdrant_client is CPU-bound; overlap it with MongoDB's index round trips
+    await asyncio.gather(connect_to_mongo(), asyncio.to_thread(connect_to_qdrant))
+    try:
+        await refresh_active_index()
+    except Exception as e:
+        logger.warning("Could not resolve the active vector index, using configured collection: %s", e)
+    # Render and compress the index page before the first visitor asks for it
+    await asyncio.to_thread(index_page)
+    background_tasks = [
+        asyncio.create_task(run_index_refresher(settings.vector_index_refresh_seconds)),
+        asyncio.create_task(run_rollup_flusher(settings.analytics_flush_seconds)),
+        # /health/live passes right away; /health/ready once this has checked every dependency
+        asyncio.create_task(warm_up())
+    ]
+    if settings.reconcile_interval_seconds > 0:
+        background_tasks.append(asyncio.create_task(run_reconciler(settings.reconcile_interval_seconds)))
+    if settings.query_log_archive_after_days > 0 and settings.query_log_archive_dir:
+        # Archives whole days, so checking hourly is plenty
+        background_tasks.append(asyncio.create_task(run_log_archiver(3600)))
     yield
     # Shutdown
-    print("Shutting down Twerlo API...")
+    logger.info("Shutting down Twerlo API")
+    readiness.draining = True
+    for task in background_tasks:
+        task.cancel()
+    # Let them finish (the rollup flusher writes its pending counts) before connections close
+    await asyncio.gather(*background_tasks, return_exceptions=True)
     await close_mongo_connection()
     close_qdrant_connection()
+    await close_cache()
+    mark_worker_stopped()
+    shutdown_logging()
 
 app = FastAPI(
     title="Twerlo AI-Powered Q&A API",
     description="A simple AI-powered question-answering API service using LLM and vector database",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson for every JSON response; /ask and /documents/query render their models directly
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -34,19 +82,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "X-Request-ID"],
+)
+
+# br/gzip for clients that accept it; inside the metrics and tracing middleware so they time it
+app.add_middleware(
+    CompressionMiddleware,
+    encodings=[encoding.strip() for encoding in settings.response_compression.split(",") if encoding.strip()],
+    minimum_size=settings.response_compression_min_bytes
 )
 
+# Request id for log correlation, returned in the X-Request-ID header
+app.add_middleware(RequestIdMiddleware)
+
+# Request latency and in-flight metrics
+app.add_middleware(PrometheusMiddleware)
+
+# Per-request trace spans; trace id returned in the X-Trace-Id header
+app.add_middleware(TracingMiddleware)
+
 # Static files and templates
 templates = Jinja2Templates(directory="app/templates")
 
-# Root redirect to HTML index
-@app.get("/", response_class=HTMLResponse, include_in_schema=False)
+@functools.lru_cache(maxsize=1)
+def index_page() -> StaticAsset:
+    """The HTML index rendered once (it has no per-request content) and precompressed"""
+    html = templates.get_template("index.html").render()
+    return StaticAsset.build(html.encode("utf-8"), "text/html; charset=utf-8")
+
+# HTML index; repeat visits revalidate against the ETag and get a 304
+@app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse, include_in_schema=False)
 async def serve_index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    max_age = settings.frontend_cache_seconds
+    cache_control = f"public, max-age={max_age}" if max_age > 0 else "no-cache"
+    return index_page().response(request, cache_control)
 
 
 # Include routers
-from app.endpoints import ask, auth, documents
+from app.endpoints import analytics, ask, auth, documents, health, metrics
 app.include_router(auth.router, tags=["Authentication"])
 app.include_router(documents.router, prefix="/documents", tags=["Documents"])
 app.include_router(ask.router, tags=["Ask"])
+app.include_router(analytics.router, prefix="/analytics", tags=["Analytics"])
+app.include_router(metrics.router, tags=["Monitoring"])
+app.include_router(health.router, prefix="/health", tags=["Monitoring"])
@@ -0,0 +1,24 @@
+from pydantic import BaseModel
+from typing import Optional, List
+from datetime import datetime
+
+class UsageStats(BaseModel):
+    requests: int
+    timed_out: int
+    avg_response_time_ms: Optional[float]
+    p50_response_time_ms: Optional[float]
+    p95_response_time_ms: Optional[float]
+    chunks_retrieved: int
+    avg_chunks_retrieved: Optional[float]
+    cache_hit_ratio: Optional[float]
+
+class UsageBucket(UsageStats):
+    bucket: datetime
+
+class UsageResponse(BaseModel):
+    scope: str  # "user" or "global"
+    granularity: str
+    start: datetime
+    end: datetime
+    total: UsageStats
+    buckets: List[UsageBucket]
@@ -2,7 +2,7 @@ from pydantic import BaseModel, Field, ConfigDict, field_validator
 from typing import Optional, List
 from datetime import datetime
 from bson import ObjectId
-from app.schemas.query import RetrievedChunk
+from app.schemas.query import ChunkFormat, ChunkReference, DocumentFilter, RetrievedChunk
 
 class DocumentUpload(BaseModel):
     filename: str
@@ -51,6 +51,13 @@ class DocumentResponse(BaseModel):
     chunks_count: int
     created_at: datetime
 
+class DocumentUpdateResponse(DocumentResponse):
+    updated_at: datetime
+    version: int
+    chunks_added: int
+    chunks_removed: int
+    chunks_unchanged: int
+
 class DocumentListResponse(BaseModel):
     id: str
     filename: str
@@ -68,10 +75,13 @@ class TestRetrievalRequest(BaseModel):
     query: str
     score_threshold: Optional[float] = 0.01
     limit: Optional[int] = 10
+    chunk_format: ChunkFormat = "text"
+    filters: Optional[DocumentFilter] = None
 
 class TestRetrievalResponse(BaseModel):
     query: str
     embedding_preview: List[float]  
     chunks_found: int
     retrieved_chunks: List[RetrievedChunk]
+    chunk_references: Optional[List[ChunkReference]] = None  # set in "reference" chunk format
     score_threshold_used: float
\ No newline at end of file
@@ -1,21 +1,68 @@
 from pydantic import BaseModel, Field, ConfigDict, field_validator
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
 from bson import ObjectId
 
+# "text" returns retrieved chunks in full; "reference" only says where they are
+ChunkFormat = Literal["text", "reference"]
+
+class DocumentFilter(BaseModel):
+    """Restricts retrieval to some of the user's documents; all given criteria must match"""
+    document_ids: Optional[List[str]] = Field(default=None, max_length=1000)
+    # Glob patterns (* and ?), case-insensitive; a document matching any of them qualifies
+    filenames: Optional[List[str]] = Field(default=None, min_length=1, max_length=50)
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
 class QuestionRequest(BaseModel):
     question: str = Field(..., min_length=1, max_length=1000)
+    timeout_seconds: Optional[float] = Field(default=None, gt=0)
+    chunk_format: ChunkFormat = "text"
+    filters: Optional[DocumentFilter] = None
 
 class RetrievedChunk(BaseModel):
     text: str
     score: float
     metadata: Dict[str, Any]
 
+class ChunkReference(BaseModel):
+    """A retrieved chunk without its text; offsets index the document's original text"""
+    document_id: Optional[str]
+    chunk_index: Optional[int]
+    score: float
+    start_char: Optional[int] = None
+    end_char: Optional[int] = None
+
+def chunk_fields(chunks: List[Dict[str, Any]], chunk_format: ChunkFormat) -> Dict[str, Any]:
+    """Response fields for search results, as plain dicts: pydantic-core validates those fastest"""
+    if chunk_format == "reference":
+        return {
+            "retrieved_chunks": [],
+            "chunk_references": [
+                {
+                    "document_id": chunk["metadata"].get("document_id"),
+                    "chunk_index": chunk["metadata"].get("chunk_index"),
+                    "score": chunk["score"],
+                    "start_char": chunk["metadata"].get("start_char"),
+                    "end_char": chunk["metadata"].get("end_char")
+                }
+                for chunk in chunks
+            ]
+        }
+    return {"retrieved_chunks": chunks}
+
 class AnswerResponse(BaseModel):
     question: str
-    answer: str
+    answer: Optional[str]
     retrieved_chunks: List[RetrievedChunk]
+    # Filled instead of retrieved_chunks (left empty) when chunk_format is "reference"
+    chunk_references: Optional[List[ChunkReference]] = None
     response_time_ms: int
+    timed_out: bool = False
+    # Model cascade tier that answered ("fast" or "strong"); None when timed out without an answer
+    model_tier: Optional[str] = None
+    # The fast tier's answer, returned unconfirmed because escalating to the strong tier timed out
+    low_confidence: bool = False
 
 class QueryLogInDB(BaseModel):
     model_config = ConfigDict(
@@ -30,6 +77,10 @@ class QueryLogInDB(BaseModel):
     answer: str
     response_time_ms: int
     retrieved_chunks_count: int
+    timed_out: bool = False
+    cache_hit: Optional[bool] = None
+    retrieval: Optional[Dict[str, Any]] = None  # retrieval policy decision
+    cascade: Optional[Dict[str, Any]] = None  # model tier that answered and escalation reason
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     
     @field_validator('id', mode='before')
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.config import settings
+from app.database.mongodb import get_database
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS = "query_rollups"
+
+GRANULARITIES = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+# Response time histogram bounds (ms); percentiles are interpolated within a bucket
+LATENCY_BOUNDS_MS = (50, 100, 250, 500, 1000, 2000, 3000, 5000, 8000, 13000, 20000, 30000, 60000, 120000)
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _latency_key(response_time_ms: float) -> str:
+    for bound in LATENCY_BOUNDS_MS:
+        if response_time_ms <= bound:
+            return str(bound)
+    return "inf"
+
+def _expires_at(bucket: datetime, granularity: str) -> Optional[datetime]:
+    days = {
+        "minute": settings.analytics_minute_retention_days,
+        "hour": settings.analytics_hour_retention_days,
+    }.get(granularity, 0)
+    return bucket + timedelta(days=days) if days > 0 else None
+
+def _rollup_id(granularity: str, user_id: Optional[str], bucket: datetime) -> str:
+    return f"{granularity}:{user_id or '*'}:{bucket.isoformat()}"
+
+def _increments(log: Dict[str, Any]) -> Dict[str, Any]:
+    increments = {
+        "requests": 1,
+        "timed_out": int(bool(log.get("timed_out"))),
+        "response_time_ms_sum": log["response_time_ms"],
+        "chunks_retrieved_sum": log.get("retrieved_chunks_count", 0),
+        f"latency.{_latency_key(log['response_time_ms'])}": 1,
+    }
+    # Logs written before cache tracking don't count towards the hit ratio
+    if log.get("cache_hit") is not None:
+        increments["cache_lookups"] = 1
+        increments["cache_hits"] = int(log["cache_hit"])
+    return increments
+
+def _merge(target: Dict[str, Any], increments: Dict[str, Any]):
+    for field, value in increments.items():
+        target[field] = target.get(field, 0) + value
+
+class AnalyticsService:
+    """
+    Time-bucketed query log rollups, maintained as logs are written
+
+    Each logged question increments one document per granularity
+    (minute, hour, day) for its user and one for all users. Increments are
+    summed in memory and written by `flush` in one bulk write, so the
+    request path never waits for MongoDB. Response times go into a fixed
+    histogram so percentiles can be read from any range of buckets. Minute
+    and hour rollups expire through a TTL index; daily ones are kept.
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._keys: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, log: Dict[str, Any]):
+        """Count a logged question towards its rollups at the next flush"""
+        for granularity in GRANULARITIES:
+            bucket = bucket_start(log["timestamp"], granularity)
+            for user_id in (log["user_id"], None):
+                rollup_id = _rollup_id(granularity, user_id, bucket)
+                _merge(self._pending.setdefault(rollup_id, {}), _increments(log))
+                self._keys[rollup_id] = {
+                    "granularity": granularity,
+                    "user_id": user_id,
+                    "bucket": bucket,
+                    "expires_at": _expires_at(bucket, granularity)
+                }
+
+    async def flush(self) -> int:
+        """Write the pending increments; returns the rollups updated"""
+        if not self._pending:
+            return 0
+        from pymongo import UpdateOne
+
+        pending, keys = self._pending, self._keys
+        self._pending, self._keys = {}, {}
+        updates = [
+            UpdateOne(
+                {"_id": rollup_id},
+                {"$inc": increments, "$setOnInsert": keys[rollup_id]},
+                upsert=True
+            )
+            for rollup_id, increments in pending.items()
+        ]
+        try:
+            db = await get_database()
+            await db[ROLLUPS].bulk_write(updates, ordered=False)
+        except BaseException:
+            # Keep the counts for the next flush
+            for rollup_id, increments in pending.items():
+                _merge(self._pending.setdefault(rollup_id, {}), increments)
+                self._keys.setdefault(rollup_id, keys[rollup_id])
+            raise
+        return len(updates)
+
+    async def rebuild(self, logs: AsyncIterator[Dict[str, Any]]) -> int:
+        """Recompute the rollups covering `logs` (e.g. after a backfill); returns the rollups written"""
+        rollups: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        keys: Dict[str, Dict[str, Any]] = {}
+        async for log in logs:
+            for granularity in GRANULARITIES:
+                bucket = bucket_start(log["timestamp"], granularity)
+                for user_id in (log["user_id"], None):
+                    rollup_id = _rollup_id(granularity, user_id, bucket)
+                    _merge(rollups[rollup_id], _increments(log))
+                    keys[rollup_id] = {
+                        "granularity": granularity,
+                        "user_id": user_id,
+                        "bucket": bucket,
+                        "expires_at": _expires_at(bucket, granularity)
+                    }
+
+        if not rollups:
+            return 0
+        from pymongo import UpdateOne
+
+        db = await get_database()
+        updates = []
+        for rollup_id, counters in rollups.items():
+            latency = {key.split(".", 1)[1]: value for key, value in counters.items() if key.startswith("latency.")}
+            fields = {key: value for key, value in counters.items() if not key.startswith("latency.")}
+            updates.append(UpdateOne(
+                {"_id": rollup_id},
+                {"$set": {**keys[rollup_id], **fields, "latency": latency}},
+                upsert=True
+            ))
+        await db[ROLLUPS].bulk_write(updates, ordered=False)
+        logger.info("Rebuilt query rollups", extra={"rollups": len(updates)})
+        return len(updates)
+
+    async def usage(
+        self,
+        user_id: Optional[str],
+        granularity: str,
+        start: datetime,
+        end: datetime
+    ) -> List[Dict[str, Any]]:
+        """Rollups for one user (or all users with None) in [start, end), oldest first"""
+        db = await get_database()
+        return await db[ROLLUPS].find(
+            {
+                "granularity": granularity,
+                "user_id": user_id,
+                "bucket": {"$gte": bucket_start(start, granularity), "$lt": end}
+            },
+            sort=[("bucket", 1)]
+        ).to_list(None)
+
+async def run_rollup_flusher(interval: float):
+    """Write each worker's pending rollup increments every `interval` seconds, and once more on shutdown"""
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await analytics_service.flush()
+            except Exception as e:
+                logger.warning("Error updating query rollups: %s", e)
+    except asyncio.CancelledError:
+        try:
+            await analytics_service.flush()
+        except Exception as e:
+            logger.warning("Error updating query rollups on shutdown: %s", e)
+        raise
+
+def percentile(latency: Dict[str, int], q: float) -> Optional[float]:
+    """Approximate percentile (ms) from a response time histogram"""
+    total = sum(latency.values())
+    if not total:
+        return None
+    rank = q * total
+    seen, lower = 0, 0
+    for bound in LATENCY_BOUNDS_MS + (None,):
+        count = latency.get(str(bound) if bound else "inf", 0)
+        if count and seen + count >= rank:
+            upper = bound or lower
+            return round(lower + (upper - lower) * (rank - seen) / count, 1)
+        seen += count
+        lower = bound or lower
+    return float(lower)
+
+def summarize(rollups: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine rollup documents into request counts, averages and percentiles"""
+    totals: Dict[str, Any] = {}
+    latency: Dict[str, int] = {}
+    for rollup in rollups:
+        for field in ("requests", "timed_out", "response_time_ms_sum", "chunks_retrieved_sum", "cache_lookups", "cache_hits"):
+            totals[field] = totals.get(field, 0) + rollup.get(field, 0)
+        for key, count in (rollup.get("latency") or {}).items():
+            latency[key] = latency.get(key, 0) + count
+
+    requests = totals.get("requests", 0)
+    lookups = totals.get("cache_lookups", 0)
+    return {
+        "requests": requests,
+        "timed_out": totals.get("timed_out", 0),
+        "avg_response_time_ms": round(totals["response_time_ms_sum"] / requests, 1) if requests else None,
+        "p50_response_time_ms": percentile(latency, 0.5),
+        "p95_response_time_ms": percentile(latency, 0.95),
+        "chunks_retrieved": totals.get("chunks_retrieved_sum", 0),
+        "avg_chunks_retrieved": round(totals["chunks_retrieved_sum"] / requests, 2) if requests else None,
+        "cache_hit_ratio": round(totals["cache_hits"] / lookups, 4) if lookups else None,
+    }
+
+# Singleton instance
+analytics_service = AnalyticsService()
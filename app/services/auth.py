@@ -1,9 +1,11 @@
 from typing import Optional
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, Request, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.database.mongodb import get_database
 from app.schemas.user import UserCreate, UserInDB, UserResponse, UserLogin
 from app.utils.security import get_password_hash, verify_password, verify_token
+from app.services.metrics import observe_stage
+from app.services.tracing import traced
 from datetime import datetime
 
 security = HTTPBearer()
@@ -60,6 +62,7 @@ class AuthService:
         # Return user object
         return UserInDB(**user_doc)
     
+    @traced("mongodb.users.find_one")
     async def get_user_by_email(self, email: str) -> Optional[UserInDB]:
         """Get user by email"""
         db = await get_database()
@@ -82,9 +85,20 @@ class AuthService:
 
 auth_service = AuthService()
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserInDB:
+@traced("auth.get_current_user")
+async def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> UserInDB:
     """Get current authenticated user"""
     
+    route = getattr(request.scope.get("route"), "path", request.url.path)
+    with observe_stage(route, "auth"):
+        return await _authenticate(credentials)
+
+async def _authenticate(credentials: HTTPAuthorizationCredentials) -> UserInDB:
+    """Resolve the bearer token to an active database user"""
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
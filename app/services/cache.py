@@ -0,0 +1,333 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (bucket name, amount to take, capacity per minute, fraction of capacity to leave untouched)
+BucketClaim = Tuple[str, float, float, float]
+
+def _refill(tokens: float, updated_at: float, capacity: float, now: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated_at) * capacity / 60.0)
+
+def _claim(states: Sequence[Tuple[float, float]], claims: Sequence[BucketClaim]) -> Tuple[float, list]:
+    """All-or-nothing take from refilled (tokens, capacity) states; returns (delay, new tokens)"""
+    delay, remaining = 0.0, []
+    for (tokens, capacity), (_, amount, _, reserve) in zip(states, claims):
+        needed = min(amount, capacity) + reserve * capacity
+        if tokens < needed:
+            delay = max(delay, (needed - tokens) / (capacity / 60.0))
+    for (tokens, capacity), (_, amount, _, _) in zip(states, claims):
+        remaining.append(tokens if delay > 0 else tokens - min(amount, capacity))
+    return delay, remaining
+
+class CacheBackend:
+    """
+    Key/value cache plus per-minute token buckets
+
+    `shared` backends are visible to every worker process (and, for Redis,
+    every host), so the query embedding cache and the provider rate limits
+    hold for the deployment rather than per process.
+    """
+
+    shared = False
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def take(self, claims: Sequence[BucketClaim]) -> float:
+        """Take from all buckets or none; returns 0 on success, else seconds until it would succeed"""
+        raise NotImplementedError
+
+    async def drain(self, bucket: str):
+        """Empty a bucket after the provider reported the quota exhausted"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class MemoryCache(CacheBackend):
+    """In-process LRU; the default for a single worker"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self._entries[key] = (value, time.time() + ttl if ttl else None)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def take(self, claims: Sequence[BucketClaim]) -> float:
+        now = time.time()
+        states = []
+        for name, _, capacity, _ in claims:
+            tokens, updated_at = self._buckets.get(name, (capacity, now))
+            states.append((_refill(tokens, updated_at, capacity, now), capacity))
+        delay, remaining = _claim(states, claims)
+        for (name, *_), tokens in zip(claims, remaining):
+            self._buckets[name] = (tokens, now)
+        return delay
+
+    async def drain(self, bucket: str):
+        tokens, _ = self._buckets.get(bucket, (0.0, 0.0))
+        self._buckets[bucket] = (min(tokens, 0.0), time.time())
+
+def _connect_sqlite(path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=OFF")  # a cache: losing the tail on power loss is fine
+    # Checkpoint every ~1MB and truncate the WAL back to that, so it stays small on tmpfs
+    db.execute("PRAGMA wal_autocheckpoint=256")
+    db.execute(f"PRAGMA journal_size_limit={1024 * 1024}")
+    return db
+
+class SQLiteCache(CacheBackend):
+    """
+    SQLite files shared by the workers of one host
+
+    Put them on tmpfs (/dev/shm) and they are effectively shared memory.
+    WAL mode lets readers proceed during writes; bucket claims run in an
+    IMMEDIATE transaction so two workers never spend the same tokens.
+
+    Cached values are bounded by `max_bytes` as well as `max_entries`, and
+    the file is capped a little above that, so the cache cannot fill the
+    tmpfs. The token buckets live in a file of their own ("-buckets"): a
+    full cache never stops rate limiting.
+    """
+
+    shared = True
+
+    # Expired and surplus rows are trimmed every this many writes
+    TRIM_EVERY = 512
+    # File cap above max_bytes: pages are not full, and rows land between trims
+    SIZE_HEADROOM = 1.5
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._buckets_lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = _connect_sqlite(path)
+        page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+        self._db.execute(f"PRAGMA max_page_count = {int(max_bytes * self.SIZE_HEADROOM) // page_size + 64}")
+        self._db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+        root, extension = os.path.splitext(path)
+        self._buckets_db = _connect_sqlite(f"{root}-buckets{extension}")
+        self._buckets_db.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated_at REAL)"
+        )
+
+    def _run(self, fn, *args, lock: Optional[threading.Lock] = None):
+        # One connection per file and process; the lock serialises the worker threads using it
+        lock = lock or self._lock
+        def locked():
+            with lock:
+                return fn(*args)
+        return asyncio.to_thread(locked)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        def get():
+            row = self._db.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+            ).fetchone()
+            return row[0] if row else None
+        return await self._run(get)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        def insert():
+            self._db.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl if ttl else None)
+            )
+
+        def set_():
+            try:
+                insert()
+            except sqlite3.OperationalError as e:
+                # Reached the file cap before the next scheduled trim
+                if "full" not in str(e):
+                    raise
+                self._trim()
+                insert()
+            self._writes += 1
+            if self._writes % self.TRIM_EVERY == 0:
+                self._trim()
+        await self._run(set_)
+
+    def _trim(self):
+        """Drop expired rows, then the oldest ones beyond max_entries or max_bytes"""
+        self._db.execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+        # Newest first, keep rows while both running totals fit; INSERT OR REPLACE
+        # gives rewritten keys a new rowid, so rowid order is insertion order
+        self._db.execute(
+            """DELETE FROM kv WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid,
+                           ROW_NUMBER() OVER (ORDER BY rowid DESC) AS newer_rows,
+                           SUM(LENGTH(value)) OVER (ORDER BY rowid DESC) AS newer_bytes
+                    FROM kv
+                ) WHERE newer_rows > ? OR newer_bytes > ?
+            )""",
+            (self.max_entries, self.max_bytes)
+        )
+
+    async def delete(self, key: str):
+        await self._run(lambda: self._db.execute("DELETE FROM kv WHERE key = ?", (key,)))
+
+    async def take(self, claims: Sequence[BucketClaim]) -> float:
+        db = self._buckets_db
+
+        def take():
+            db.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            try:
+                states = []
+                for name, _, capacity, _ in claims:
+                    row = db.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+                    tokens, updated_at = row if row else (capacity, now)
+                    states.append((_refill(tokens, updated_at, capacity, now), capacity))
+                delay, remaining = _claim(states, claims)
+                db.executemany(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                    [(name, tokens, now) for (name, *_), tokens in zip(claims, remaining)]
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return delay
+        return await self._run(take, lock=self._buckets_lock)
+
+    async def drain(self, bucket: str):
+        await self._run(lambda: self._buckets_db.execute(
+            "UPDATE buckets SET tokens = MIN(tokens, 0), updated_at = ? WHERE name = ?", (time.time(), bucket)
+        ), lock=self._buckets_lock)
+
+    async def close(self):
+        await self._run(self._db.close)
+        await self._run(self._buckets_db.close, lock=self._buckets_lock)
+
+# Refill, check and take every bucket atomically; ARGV = now, then (amount, capacity, reserve) per key
+_TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local delay = 0
+local states = {}
+for i = 1, #KEYS do
+  local amount = tonumber(ARGV[i * 3 - 1])
+  local capacity = tonumber(ARGV[i * 3])
+  local reserve = tonumber(ARGV[i * 3 + 1])
+  local rate = capacity / 60
+  local data = redis.call('HMGET', KEYS[i], 'tokens', 'updated_at')
+  local tokens = tonumber(data[1]) or capacity
+  local updated_at = tonumber(data[2]) or now
+  tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+  local take = math.min(amount, capacity)
+  if tokens < take + reserve * capacity then
+    delay = math.max(delay, (take + reserve * capacity - tokens) / rate)
+  end
+  states[i] = {tokens, take}
+end
+for i = 1, #KEYS do
+  local tokens = states[i][1]
+  if delay == 0 then tokens = tokens - states[i][2] end
+  redis.call('HSET', KEYS[i], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+  redis.call('EXPIRE', KEYS[i], 120)
+end
+return tostring(delay)
+"""
+
+class RedisCache(CacheBackend):
+    """Any Redis-compatible server (Redis, Valkey, KeyDB, ...); shared across hosts"""
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "twerlo:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("CACHE_URL points at Redis but the redis package is not installed")
+        self.prefix = prefix
+        self._client = redis.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        # Without a TTL, eviction is left to the server's maxmemory policy
+        await self._client.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, key: str):
+        await self._client.delete(self.prefix + key)
+
+    async def take(self, claims: Sequence[BucketClaim]) -> float:
+        args = [time.time()]
+        for _, amount, capacity, reserve in claims:
+            args.extend((amount, capacity, reserve))
+        keys = [f"{self.prefix}bucket:{name}" for name, *_ in claims]
+        return float(await self._take(keys=keys, args=args))
+
+    async def drain(self, bucket: str):
+        await self._client.hset(f"{self.prefix}bucket:{bucket}", mapping={"tokens": 0, "updated_at": time.time()})
+
+    async def close(self):
+        await self._client.aclose()
+
+def create_cache_backend(url: str) -> CacheBackend:
+    """memory://, sqlite:///relative.db, sqlite:////absolute.db or redis://host:6379/0 (rediss:// for TLS)"""
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return MemoryCache(settings.cache_max_entries)
+    if parsed.scheme == "sqlite":
+        return SQLiteCache(parsed.path[1:], settings.cache_max_entries, settings.cache_max_bytes)
+    if parsed.scheme in ("redis", "rediss", "unix"):
+        return RedisCache(url)
+    raise ValueError(f"Unsupported CACHE_URL scheme: {parsed.scheme!r}")
+
+class SharedCache:
+    backend: CacheBackend = MemoryCache(settings.cache_max_entries)
+
+shared_cache = SharedCache()
+
+async def connect_cache():
+    """Open the configured backend; called per worker from the app lifespan"""
+    shared_cache.backend = create_cache_backend(settings.cache_url)
+    logger.info("Cache backend ready", extra={"backend": type(shared_cache.backend).__name__})
+
+async def close_cache():
+    await shared_cache.backend.close()
+    shared_cache.backend = MemoryCache(settings.cache_max_entries)
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+
+from app.config import settings
+from app.database.mongodb import get_database
+from app.database.qdrant_client import chunk_hash, chunk_point_id, set_point_payloads
+from app.services.metrics import DUPLICATE_CHUNKS
+from app.utils.file_parser import text_chunker
+from app.utils.minhash import band_keys, signature, similarity
+
+logger = logging.getLogger(__name__)
+
+# One fingerprint per stored point: content hash, MinHash signature and LSH band keys
+FINGERPRINTS = "chunk_fingerprints"
+# Chunks stored as a pointer to another document's point instead of a vector
+REFERENCES = "chunk_references"
+
+@dataclass
+class ChunkPlan:
+    """How the chunks of one document version are stored"""
+    # Chunks that need a vector; each carries its "point_id" and "fingerprint"
+    to_embed: List[Dict[str, Any]] = field(default_factory=list)
+    references: List[Dict[str, Any]] = field(default_factory=list)
+
+class ChunkDeduplicator:
+    """
+    Finds chunks that repeat content already stored for the same user
+
+    Exact duplicates are found by content hash, near-duplicates by MinHash
+    signatures bucketed with LSH band keys (a multikey Mongo index does the
+    bucketing). Matches become references to the existing point, so the
+    user's index holds one vector per distinct passage. Near-duplicates are
+    only matched across documents: within a document, a slightly edited
+    passage must keep its own text.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+
+    async def plan(self, user_id: str, document_id: str, chunks: List[Dict[str, Any]]) -> ChunkPlan:
+        plan = ChunkPlan()
+        if not settings.dedup_enabled:
+            plan.to_embed = [
+                {**chunk, "point_id": chunk_point_id(document_id, chunk_hash(chunk["text"]))} for chunk in chunks
+            ]
+            return plan
+        if not chunks:
+            return plan
+
+        hashes = [chunk_hash(chunk["text"]) for chunk in chunks]
+        signatures = [signature(chunk["text"]) for chunk in chunks]
+        bands = [band_keys(sig) for sig in signatures]
+
+        db = await get_database()
+        existing = await db[FINGERPRINTS].find(
+            {
+                "user_id": user_id,
+                "$or": [
+                    {"content_hash": {"$in": list(set(hashes))}},
+                    {"bands": {"$in": list({key for keys in bands for key in keys})}}
+                ]
+            },
+            projection={"document_id": 1, "content_hash": 1, "signature": 1, "bands": 1}
+        ).to_list(None)
+
+        by_hash = {fingerprint["content_hash"]: fingerprint for fingerprint in existing}
+        by_band = defaultdict(list)
+        for fingerprint in existing:
+            for key in fingerprint["bands"]:
+                by_band[key].append(fingerprint)
+
+        referenced = set()
+        for chunk, content_hash, sig, keys in zip(chunks, hashes, signatures, bands):
+            if content_hash in referenced:
+                continue
+            canonical = by_hash.get(content_hash)
+            kind = "exact"
+            if canonical is None:
+                canonical, kind = self._nearest(sig, keys, by_band, document_id), "near"
+
+            if canonical is None:
+                point_id = chunk_point_id(document_id, content_hash)
+                fingerprint = {
+                    "_id": point_id,
+                    "user_id": user_id,
+                    "document_id": document_id,
+                    "chunk_index": chunk["chunk_index"],
+                    "content_hash": content_hash,
+                    "signature": sig,
+                    "bands": keys
+                }
+                plan.to_embed.append({**chunk, "point_id": point_id, "fingerprint": fingerprint})
+                by_hash[content_hash] = fingerprint
+            elif canonical["document_id"] == document_id:
+                # Repeated passage within the document: its first occurrence is the point
+                continue
+            else:
+                referenced.add(content_hash)
+                plan.references.append({
+                    "_id": f"{document_id}:{content_hash}",
+                    "user_id": user_id,
+                    "document_id": document_id,
+                    **text_chunker.position(chunk),
+                    "content_hash": content_hash,
+                    "point_id": canonical["_id"]
+                })
+                DUPLICATE_CHUNKS.labels(kind).inc()
+
+        return plan
+
+    def _nearest(self, sig, keys, by_band, document_id: str) -> Optional[Dict[str, Any]]:
+        best, best_similarity = None, self.threshold
+        candidates = {fp["_id"]: fp for key in keys for fp in by_band.get(key, ()) if fp["document_id"] != document_id}
+        for candidate in candidates.values():
+            estimate = similarity(sig, candidate["signature"])
+            if estimate >= best_similarity:
+                best, best_similarity = candidate, estimate
+        return best
+
+    async def record(self, fingerprints: List[Dict[str, Any]]):
+        """Register points once their vectors are stored"""
+        if not fingerprints:
+            return
+        from pymongo import UpdateOne
+
+        db = await get_database()
+        await db[FINGERPRINTS].bulk_write(
+            [UpdateOne({"_id": fp["_id"]}, {"$set": fp}, upsert=True) for fp in fingerprints],
+            ordered=False
+        )
+
+    async def add_references(self, references: List[Dict[str, Any]]):
+        if not references:
+            return
+        from pymongo import UpdateOne
+
+        db = await get_database()
+        await db[REFERENCES].bulk_write(
+            [UpdateOne({"_id": ref["_id"]}, {"$set": ref}, upsert=True) for ref in references],
+            ordered=False
+        )
+
+    async def owned_points(self, document_id: str) -> Dict[str, str]:
+        """content_hash -> point id for points that belong to the document"""
+        db = await get_database()
+        fingerprints = await db[FINGERPRINTS].find(
+            {"document_id": document_id}, projection={"content_hash": 1}
+        ).to_list(None)
+        return {fingerprint["content_hash"]: fingerprint["_id"] for fingerprint in fingerprints}
+
+    async def references_of(self, document_id: str) -> List[Dict[str, Any]]:
+        db = await get_database()
+        return await db[REFERENCES].find({"document_id": document_id}).to_list(None)
+
+    async def move_references(self, positions: Dict[str, Dict[str, int]]):
+        """Update the position of kept references (reference id -> new chunk index and offsets)"""
+        if not positions:
+            return
+        from pymongo import UpdateOne
+
+        db = await get_database()
+        await db[REFERENCES].bulk_write(
+            [UpdateOne({"_id": ref_id}, {"$set": position}) for ref_id, position in positions.items()],
+            ordered=False
+        )
+
+    async def remove_references(self, document_id: str, reference_ids: Optional[Iterable[str]] = None):
+        db = await get_database()
+        query: Dict[str, Any] = {"document_id": document_id}
+        if reference_ids is not None:
+            query["_id"] = {"$in": list(reference_ids)}
+        await db[REFERENCES].delete_many(query)
+
+    async def release(self, document_id: str, point_ids: Optional[List[str]] = None) -> List[str]:
+        """Give up points owned by a document; returns the ids that nothing else uses
+
+        Points still referenced by other documents are handed over to one of
+        them (payload and fingerprint are re-pointed) instead of being deleted.
+        """
+        db = await get_database()
+        query: Dict[str, Any] = {"document_id": document_id}
+        if point_ids is not None:
+            query["_id"] = {"$in": point_ids}
+        owned = [fp["_id"] for fp in await db[FINGERPRINTS].find(query, projection={"_id": 1}).to_list(None)]
+        if not owned:
+            return list(point_ids or [])
+
+        heirs: Dict[str, Dict[str, Any]] = {}
+        references = await db[REFERENCES].find(
+            {"point_id": {"$in": owned}, "document_id": {"$ne": document_id}},
+            sort=[("document_id", 1), ("chunk_index", 1)]
+        ).to_list(None)
+        for reference in references:
+            heirs.setdefault(reference["point_id"], reference)
+
+        if heirs:
+            documents = await db.documents.find(
+                {"_id": {"$in": list({heir["document_id"] for heir in heirs.values()})}},
+                projection={"filename": 1}
+            ).to_list(None)
+            filenames = {doc["_id"]: doc["filename"] for doc in documents}
+            await asyncio.to_thread(set_point_payloads, {
+                point_id: {
+                    "document_id": heir["document_id"],
+                    "filename": filenames.get(heir["document_id"]),
+                    "chunk_index": heir["chunk_index"],
+                    "start_char": heir.get("start_char"),
+                    "end_char": heir.get("end_char")
+                }
+                for point_id, heir in heirs.items()
+            })
+            for point_id, heir in heirs.items():
+                await db[FINGERPRINTS].update_one(
+                    {"_id": point_id},
+                    {"$set": {
+                        "document_id": heir["document_id"],
+                        "chunk_index": heir["chunk_index"],
+                        "content_hash": heir["content_hash"]
+                    }}
+                )
+                await db[REFERENCES].delete_one({"_id": heir["_id"]})
+
+        released = [point_id for point_id in owned if point_id not in heirs]
+        await db[FINGERPRINTS].delete_many({"_id": {"$in": released}})
+        orphans = [point_id for point_id in (point_ids or []) if point_id not in owned]
+        return released + orphans
+
+# Singleton instance
+chunk_deduplicator = ChunkDeduplicator(settings.dedup_similarity_threshold)
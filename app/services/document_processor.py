@@ -1,15 +1,26 @@
 from fastapi import UploadFile, HTTPException, status
 from typing import List, Dict, Any
 from datetime import datetime
+import asyncio
+import logging
 import uuid
 
 from app.database.mongodb import get_database
-from app.schemas.document import DocumentInDB, DocumentResponse
+from app.schemas.document import DocumentInDB, DocumentResponse, DocumentUpdateResponse
 from app.utils.file_parser import file_parser, text_chunker
 from app.services.embedding_service import embedding_service
-from app.database.qdrant_client import store_embeddings
+from app.services.deduplication import chunk_deduplicator
+from app.services.scheduler import Priority
+from app.services.metrics import UPLOAD_ROUTE, observe_stage
+from app.services.tracing import tracer
+from app.database.qdrant_client import (
+    chunk_hash, chunk_point_id, delete_document_points, delete_points, store_embeddings_batch,
+    update_document_points
+)
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 class DocumentProcessor:
     
     async def process_and_store_document(
@@ -23,23 +34,7 @@ class DocumentProcessor:
         await self._validate_file(file)
         
         try:
-            # Extract text from file
-            original_text = await file_parser.extract_text_from_file(file)
-            
-            if not original_text.strip():
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="No text content found in the uploaded file"
-                )
-            
-            # Chunk the text
-            chunks = text_chunker.chunk_text(original_text)
-            
-            if not chunks:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Failed to create text chunks from the document"
-                )
+            original_text, chunks = await self._extract_chunks(file)
             
             # Create document record
             document_id = str(uuid.uuid4())
@@ -51,20 +46,36 @@ class DocumentProcessor:
                 "file_size": file.size if file.size else len(original_text),
                 "original_text": original_text,
                 "chunks_count": len(chunks),
+                "chunk_hashes": [chunk_hash(chunk["text"]) for chunk in chunks],
+                "version": 1,
                 "created_at": datetime.utcnow()
             }
             
             # Store document in MongoDB
-            db = await get_database()
-            await db.documents.insert_one(document_data)
+            with tracer.span("ingest.store_document"):
+                db = await get_database()
+                await db.documents.insert_one(document_data)
             
-            # Generate and store embeddings for each chunk
-            await self._store_document_embeddings(
-                chunks=chunks,
+            # Passages already stored for this user become references instead of vectors
+            with observe_stage(UPLOAD_ROUTE, "dedup"), tracer.span("ingest.dedup"):
+                plan = await chunk_deduplicator.plan(user_id, document_id, chunks)
+            
+            # Generate and store embeddings for each new chunk
+            stored = await self._store_document_embeddings(
+                chunks=plan.to_embed,
                 document_id=document_id,
                 user_id=user_id,
                 filename=file.filename
             )
+            if stored < len(plan.to_embed):
+                # A partially searchable document is not kept; the client can retry the upload
+                await self.delete_document_vectors(document_id)
+                await db.documents.delete_one({"_id": document_id})
+                raise HTTPException(
+                    status_code=status.HTTP_502_BAD_GATEWAY,
+                    detail=f"Failed to embed {len(plan.to_embed) - stored} of {len(chunks)} chunks; the document was not stored"
+                )
+            await chunk_deduplicator.add_references(plan.references)
             
             # Return document response
             return DocumentResponse(
@@ -84,6 +95,208 @@ class DocumentProcessor:
                 detail=f"Failed to process document: {str(e)}"
             )
     
+    async def update_document(
+        self,
+        document_id: str,
+        file: UploadFile,
+        user_id: str
+    ) -> DocumentUpdateResponse:
+        """Replace a document with a new version, embedding only chunks whose content changed"""
+        
+        await self._validate_file(file)
+        
+        db = await get_database()
+        document = await db.documents.find_one(
+            {"_id": document_id, "user_id": user_id},
+            projection={"original_text": 0}
+        )
+        if not document:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found or access denied"
+            )
+        
+        plan = None
+        committed = False
+        try:
+            original_text, chunks = await self._extract_chunks(file)
+            
+            hashes = [chunk_hash(chunk["text"]) for chunk in chunks]
+            
+            # Unique chunk contents, each with the first chunk it appears as
+            first_chunks: Dict[str, Dict[str, Any]] = {}
+            for content_hash, chunk in zip(hashes, chunks):
+                first_chunks.setdefault(content_hash, chunk)
+            new_indexes = {content_hash: chunk["chunk_index"] for content_hash, chunk in first_chunks.items()}
+            
+            # Documents stored before content hashes have other point ids: all chunks are new
+            old_hashes = document.get("chunk_hashes")
+            old_indexes: Dict[str, int] = {}
+            for index, content_hash in enumerate(old_hashes or []):
+                old_indexes.setdefault(content_hash, index)
+            
+            # Old chunks either own a point or reference another document's point
+            owned = await chunk_deduplicator.owned_points(document_id)
+            references = {ref["content_hash"]: ref for ref in await chunk_deduplicator.references_of(document_id)}
+            
+            def point_of(content_hash: str) -> str:
+                return owned.get(content_hash) or chunk_point_id(document_id, content_hash)
+            
+            added = [
+                chunk for content_hash, chunk in zip(hashes, chunks)
+                if content_hash not in old_indexes and new_indexes[content_hash] == chunk["chunk_index"]
+            ]
+            removed = [content_hash for content_hash in old_indexes if content_hash not in new_indexes]
+            kept = [content_hash for content_hash in new_indexes if content_hash in old_indexes]
+            # Kept chunks get their new position: character offsets shift with any
+            # edit before them, even when the chunk index stays the same
+            moved_points = {
+                point_of(content_hash): text_chunker.position(first_chunks[content_hash])
+                for content_hash in kept
+                if content_hash not in references
+            }
+            moved_references = {
+                references[content_hash]["_id"]: text_chunker.position(first_chunks[content_hash])
+                for content_hash in kept
+                if content_hash in references
+            }
+            
+            plan = await chunk_deduplicator.plan(user_id, document_id, added)
+            
+            # Embed and store new chunks before the Mongo update below. They are
+            # searchable as soon as they are stored, so if the update does not
+            # commit they are removed again rather than mixed into the old version
+            stored = await self._store_document_embeddings(
+                chunks=plan.to_embed,
+                document_id=document_id,
+                user_id=user_id,
+                filename=file.filename
+            )
+            if stored < len(plan.to_embed):
+                await self._discard_points(document_id, plan.to_embed)
+                raise HTTPException(
+                    status_code=status.HTTP_502_BAD_GATEWAY,
+                    detail="Failed to embed the changed chunks; the previous version is kept"
+                )
+            
+            updated_at = datetime.utcnow()
+            version = document.get("version", 1)
+            result = await db.documents.update_one(
+                # Concurrent updates: only the first one based on this version wins
+                {"_id": document_id, "user_id": user_id, "version": document.get("version")},
+                {"$set": {
+                    "filename": file.filename,
+                    "content_type": file.content_type,
+                    "file_size": file.size if file.size else len(original_text),
+                    "original_text": original_text,
+                    "chunks_count": len(chunks),
+                    "chunk_hashes": hashes,
+                    "version": version + 1,
+                    "updated_at": updated_at
+                }}
+            )
+            if result.matched_count == 0:
+                await self._discard_points(document_id, plan.to_embed)
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Document was modified concurrently; retry the update"
+                )
+            committed = True
+            
+            await chunk_deduplicator.add_references(plan.references)
+            await chunk_deduplicator.move_references(moved_references)
+            await chunk_deduplicator.remove_references(
+                document_id, [references[content_hash]["_id"] for content_hash in removed if content_hash in references]
+            )
+            # Removed points other documents still reference are handed over, not deleted
+            deleted = await chunk_deduplicator.release(
+                document_id, [point_of(content_hash) for content_hash in removed if content_hash not in references]
+            )
+            
+            if old_hashes is None:
+                keep = [chunk["point_id"] for chunk in plan.to_embed]
+                await asyncio.to_thread(delete_document_points, document_id, keep)
+            await asyncio.to_thread(
+                update_document_points,
+                document_id,
+                deleted,
+                moved_points,
+                {"filename": file.filename} if file.filename != document["filename"] else None
+            )
+            
+            logger.info(
+                "Document updated",
+                extra={
+                    "document_id": document_id,
+                    "chunks_added": len(added),
+                    "chunks_removed": len(removed),
+                    "chunks_unchanged": len(kept),
+                    "chunks_deduplicated": len(plan.references)
+                }
+            )
+            
+            return DocumentUpdateResponse(
+                id=document_id,
+                filename=file.filename,
+                content_type=file.content_type,
+                file_size=file.size if file.size else len(original_text),
+                chunks_count=len(chunks),
+                created_at=document["created_at"],
+                updated_at=updated_at,
+                version=version + 1,
+                chunks_added=len(added),
+                chunks_removed=len(removed),
+                chunks_unchanged=len(kept)
+            )
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            if plan is not None and not committed:
+                await self._discard_points(document_id, plan.to_embed)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to update document: {str(e)}"
+            )
+    
+    async def _discard_points(self, document_id: str, chunks: List[Dict[str, Any]]):
+        """Remove the points and fingerprints stored for an update that did not commit
+
+        Points another upload has started referencing meanwhile are handed over
+        to it by `release`, like on delete.
+        """
+        try:
+            released = await chunk_deduplicator.release(document_id, [chunk["point_id"] for chunk in chunks])
+            await asyncio.to_thread(delete_points, released)
+        except Exception as e:
+            # Left for the reconciler to clean up
+            logger.error("Error discarding uncommitted points: %s", e, extra={"document_id": document_id})
+    
+    async def _extract_chunks(self, file: UploadFile):
+        """Extract and chunk the text of an uploaded file"""
+        
+        # Extract text from file
+        with observe_stage(UPLOAD_ROUTE, "parse"), tracer.span("ingest.parse"):
+            original_text = await file_parser.extract_text_from_file(file)
+        
+        if not original_text.strip():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No text content found in the uploaded file"
+            )
+        
+        # Chunk the text
+        with observe_stage(UPLOAD_ROUTE, "chunk"), tracer.span("ingest.chunk"):
+            chunks = text_chunker.chunk_text(original_text)
+        
+        if not chunks:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Failed to create text chunks from the document"
+            )
+        
+        return original_text, chunks
+    
     async def _validate_file(self, file: UploadFile):
         """Validate uploaded file"""
         
@@ -115,34 +328,67 @@ class DocumentProcessor:
         document_id: str,
         user_id: str,
         filename: str
-    ):
+    ) -> int:
         """Generate embeddings and store in vector database"""
         
-        for chunk in chunks:
-            try:
-                # Generate embedding for chunk text
-                embedding = await embedding_service.generate_embedding(chunk["text"])
-                
-                # Prepare metadata
-                metadata = {
+        batch_size = max(1, settings.embedding_batch_size)
+        batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+        
+        # Batches are submitted together; the outbound scheduler paces them to the
+        # provider budget at background priority so interactive /ask calls go first
+        results = await asyncio.gather(*[
+            self._store_chunk_batch(batch, document_id, user_id, filename)
+            for batch in batches
+        ])
+        
+        return sum(results)
+    
+    async def _store_chunk_batch(
+        self,
+        batch: List[Dict[str, Any]],
+        document_id: str,
+        user_id: str,
+        filename: str
+    ) -> int:
+        """Embed and store one batch of chunks, returning the number stored"""
+        
+        try:
+            texts = [chunk["text"] for chunk in batch]
+            with observe_stage(UPLOAD_ROUTE, "embed"), tracer.span("ingest.embed", chunks=len(batch)):
+                embeddings = await embedding_service.generate_embeddings_batch(
+                    texts,
+                    priority=Priority.BACKGROUND
+                )
+            
+            created_at = datetime.utcnow().isoformat()
+            metadatas = [
+                {
                     "user_id": user_id,
                     "document_id": document_id,
                     "filename": filename,
-                    "chunk_index": chunk["chunk_index"],
-                    "created_at": datetime.utcnow().isoformat()
+                    **text_chunker.position(chunk),
+                    "created_at": created_at
                 }
-                
-                # Store in Qdrant
-                store_embeddings(
-                    embeddings=embedding,
-                    text_chunk=chunk["text"],
-                    metadata=metadata
-                )
-                
-            except Exception as e:
-                print(f"Error storing embedding for chunk {chunk['chunk_index']}: {e}")
-                # Continue with other chunks even if one fails
-                continue
+                for chunk in batch
+            ]
+            
+            # Content-addressed ids: unchanged chunks keep their point across versions
+            point_ids = [chunk["point_id"] for chunk in batch]
+            
+            # Qdrant client is synchronous; keep the upsert off the event loop
+            with observe_stage(UPLOAD_ROUTE, "upsert"), tracer.span("ingest.upsert", chunks=len(batch)):
+                await asyncio.to_thread(store_embeddings_batch, embeddings, texts, metadatas, point_ids)
+            await chunk_deduplicator.record([chunk["fingerprint"] for chunk in batch if "fingerprint" in chunk])
+            return len(batch)
+            
+        except Exception as e:
+            logger.error(
+                "Error storing embeddings for chunks %d-%d: %s",
+                batch[0]["chunk_index"], batch[-1]["chunk_index"], e,
+                extra={"document_id": document_id}
+            )
+            # Retries are exhausted at this point; continue with other batches
+            return 0
     
     async def get_user_documents(self, user_id: str) -> List[DocumentResponse]:
         """Get all documents for a user"""
@@ -166,6 +412,14 @@ class DocumentProcessor:
         
         return documents
     
+    async def delete_document_vectors(self, document_id: str):
+        """Delete a document's points and references from the vector index"""
+        
+        # Passages other documents reference are handed over to them, not deleted
+        await chunk_deduplicator.release(document_id)
+        await chunk_deduplicator.remove_references(document_id)
+        await asyncio.to_thread(delete_document_points, document_id)
+    
     async def delete_document(self, document_id: str, user_id: str) -> bool:
         """Delete a document and its embeddings"""
         
@@ -184,13 +438,13 @@ class DocumentProcessor:
             # Delete from MongoDB
             await db.documents.delete_one({"_id": document_id})
             
-            # TODO: Delete from Qdrant (we'll implement this when we add the delete functionality)
-            # For now, we'll leave the embeddings - they're filtered by user_id anyway
+            # Vectors left behind by a failure here are removed by the reconciler
+            await self.delete_document_vectors(document_id)
             
             return True
             
         except Exception as e:
-            print(f"Error deleting document: {e}")
+            logger.error("Error deleting document: %s", e, extra={"document_id": document_id})
             return False
 
 # Singleton instance
@@ -1,72 +1,213 @@
-import openai
-from typing import List
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import numpy as np
 from app.config import settings
+from app.services.cache import shared_cache
+from app.services.metrics import CACHE_ERRORS, record_cache_lookup
+from app.services.scheduler import embedding_scheduler, Priority, estimate_tokens
+from app.services.tracing import traced
+from app.utils.vectors import Vector, decode_embedding
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingLRU:
+    """Small in-process LRU of query embeddings keyed by text"""
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Vector]" = OrderedDict()
+    
+    def get(self, text: str) -> Optional[Vector]:
+        vector = self._entries.get(text)
+        if vector is not None:
+            self._entries.move_to_end(text)
+        record_cache_lookup("query_embedding", vector is not None)
+        return vector
+    
+    def put(self, text: str, vector: Vector):
+        if self.max_size <= 0:
+            return
+        # Cached arrays are shared between requests, so freeze them
+        vector.setflags(write=False)
+        self._entries[text] = vector
+        self._entries.move_to_end(text)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        self._entries.clear()
 
 class EmbeddingService:
     
     def __init__(self):
-        # Configure OpenAI-compatible client with separate embedding API key
-        self.client = openai.OpenAI(
-            api_key=settings.embedding_api_key,  # Separate API key for embedding provider
-            base_url=settings.embedding_base_url  # Dynamic base URL for any OpenAI-compatible API
-        )
+        # The OpenAI client is created on first use (see `client`)
+        self._client = None
         
         # Dynamic model configuration from environment
         self.model = settings.embedding_model_name
         self.dimensions = settings.embedding_dimensions
+        # base64 ships raw float32 bytes instead of JSON numbers; "float" for providers without it
+        self.encoding_format = settings.embedding_encoding_format
+        self.cache = EmbeddingLRU(settings.embedding_cache_size)
+        
+        logger.info(
+            "Embedding Service initialized",
+            extra={"provider": settings.embedding_base_url, "model": self.model, "dimensions": self.dimensions}
+        )
+    
+    @property
+    def client(self):
+        if self._client is None:
+            import openai
+            
+            # Configure OpenAI-compatible client with separate embedding API key
+            self._client = openai.AsyncOpenAI(
+                api_key=settings.embedding_api_key,  # Separate API key for embedding provider
+                base_url=settings.embedding_base_url,  # Dynamic base URL for any OpenAI-compatible API
+                max_retries=0  # Retries and backoff are handled by the outbound scheduler
+            )
+        return self._client
+    
+    @client.setter
+    def client(self, client):
+        self._client = client
+    
+    async def generate_embedding(
+        self,
+        text: str,
+        priority: Priority = Priority.INTERACTIVE
+    ) -> Vector:
+        """Generate embedding for given text as a float32 array (cached per text)"""
         
-        print(f"Embedding Service initialized with provider: {settings.embedding_base_url}")
-        print(f"Using model: {self.model} (dimensions: {self.dimensions})")
+        embedding, _ = await self.generate_embedding_cached(text, priority)
+        return embedding
     
-    async def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for given text"""
+    @traced("embedding.generate_embedding")
+    async def generate_embedding_cached(
+        self,
+        text: str,
+        priority: Priority = Priority.INTERACTIVE
+    ) -> Tuple[Vector, bool]:
+        """Like generate_embedding, also returning whether the embedding came from a cache"""
         
         if not text or not text.strip():
             raise ValueError("Text cannot be empty")
         
+        text = text.strip()
+        
+        cached = self.cache.get(text)
+        if cached is None:
+            cached = await self._shared_get(text)
+        if cached is not None:
+            return cached, True
+        
         try:
             # Create embedding using OpenAI-compatible API
-            response = self.client.embeddings.create(
-                model=self.model,
-                input=text.strip()
+            response = await embedding_scheduler.run(
+                lambda: self.client.embeddings.create(
+                    model=self.model, input=text, encoding_format=self.encoding_format
+                ),
+                cost_tokens=estimate_tokens(text),
+                priority=priority
             )
             
             # Extract embedding vector
-            embedding = response.data[0].embedding
+            embedding = decode_embedding(response.data[0].embedding)
+            self.cache.put(text, embedding)
+            await self._shared_put(text, embedding)
             
-            return embedding
+            return embedding, False
             
         except Exception as e:
-            print(f"Error generating embedding: {e}")
+            logger.error("Error generating embedding: %s", e)
             raise ValueError(f"Failed to generate embedding: {str(e)}")
     
-    async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts in batch"""
+    @traced("embedding.generate_embeddings_batch")
+    async def generate_embeddings_batch(
+        self,
+        texts: List[str],
+        priority: Priority = Priority.BACKGROUND,
+        model: Optional[str] = None
+    ) -> np.ndarray:
+        """Generate embeddings for multiple texts in batch as a (len(texts), dimensions) float32 matrix
         
-        if not texts:
-            return []
+        `model` overrides the serving model (used when re-indexing for a new one).
+        Row i always belongs to texts[i]; blank texts are rejected rather than skipped.
+        """
         
-        # Filter out empty texts
-        valid_texts = [text.strip() for text in texts if text and text.strip()]
+        if not texts:
+            return np.empty((0, self.dimensions), dtype=np.float32)
         
-        if not valid_texts:
-            raise ValueError("No valid texts provided")
+        valid_texts = [text.strip() if text else "" for text in texts]
+        blank = [i for i, text in enumerate(valid_texts) if not text]
+        if blank:
+            raise ValueError(f"Texts at positions {blank} are empty")
         
         try:
             # Create embeddings in batch using OpenAI-compatible API
-            response = self.client.embeddings.create(
-                model=self.model,
-                input=valid_texts
+            response = await embedding_scheduler.run(
+                lambda: self.client.embeddings.create(
+                    model=model or self.model, input=valid_texts, encoding_format=self.encoding_format
+                ),
+                cost_tokens=estimate_tokens(*valid_texts),
+                priority=priority
             )
             
-            # Extract embedding vectors
-            embeddings = [data.embedding for data in response.data]
+            # One contiguous matrix; rows follow the input order
+            rows = sorted(response.data, key=lambda data: data.index)
+            if [data.index for data in rows] != list(range(len(valid_texts))):
+                raise ValueError(f"Expected {len(valid_texts)} embeddings, got indexes {[data.index for data in rows]}")
+            embeddings = np.stack([decode_embedding(data.embedding) for data in rows])
             
             return embeddings
             
         except Exception as e:
-            print(f"Error generating batch embeddings: {e}")
+            logger.error("Error generating batch embeddings: %s", e, extra={"batch_size": len(valid_texts)})
             raise ValueError(f"Failed to generate batch embeddings: {str(e)}")
 
+    def _shared_key(self, text: str) -> str:
+        # Model and dimensions in the key: workers mid-migration never mix vectors
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"embedding:{self.model}:{self.dimensions}:{digest}"
+    
+    async def _shared_get(self, text: str) -> Optional[Vector]:
+        """Look in the cross-worker cache and keep a hit in the local LRU"""
+        if not shared_cache.backend.shared or self.cache.max_size <= 0:
+            return None
+        try:
+            data = await shared_cache.backend.get(self._shared_key(text))
+        except Exception as e:
+            CACHE_ERRORS.labels("get").inc()
+            logger.warning("Shared embedding cache unavailable: %s", e)
+            return None
+        record_cache_lookup("query_embedding_shared", data is not None)
+        if data is None:
+            return None
+        embedding = np.frombuffer(data, dtype=np.float32)
+        self.cache.put(text, embedding)
+        return embedding
+    
+    async def _shared_put(self, text: str, embedding: Vector):
+        if not shared_cache.backend.shared or self.cache.max_size <= 0:
+            return
+        try:
+            await shared_cache.backend.set(
+                self._shared_key(text), embedding.astype(np.float32).tobytes(), ttl=settings.embedding_cache_ttl_seconds
+            )
+        except Exception as e:
+            CACHE_ERRORS.labels("set").inc()
+            logger.warning("Shared embedding cache unavailable: %s", e)
+    
+    def use_model(self, model: str, dimensions: int):
+        """Switch the model used for queries; cached embeddings from the old model are dropped"""
+        if (model, dimensions) == (self.model, self.dimensions):
+            return
+        self.model = model
+        self.dimensions = dimensions
+        self.cache.clear()
+        logger.info("Embedding model switched", extra={"model": model, "dimensions": dimensions})
+
 # Singleton instance
 embedding_service = EmbeddingService()
@@ -0,0 +1,121 @@
+import asyncio
+import importlib
+import logging
+from typing import Awaitable, Callable, Dict
+
+from app.config import settings
+from app.database.mongodb import mongodb, missing_indexes
+from app.database.qdrant_client import qdrant_db, ensure_collection_exists
+from app.services.embedding_service import embedding_service
+from app.services.llm_service import llm_service
+from app.services.model_cascade import model_cascade
+from app.services.scheduler import llm_scheduler, Priority
+
+logger = logging.getLogger(__name__)
+
+# Client libraries imported lazily on first use; imported during warm-up instead
+WARM_UP_MODULES = ("openai", "PyPDF2")
+
+WARM_UP_MODES = ("none", "connect", "call")
+
+class Readiness:
+    """Start-up state behind /health/ready"""
+
+    def __init__(self):
+        self.warmed_up = False
+        self.draining = False
+        # Check name -> "ok", "skipped" or the last error
+        self.checks: Dict[str, str] = {}
+
+    @property
+    def status(self) -> str:
+        if self.draining:
+            return "draining"
+        return "ready" if self.warmed_up else "starting"
+
+    def reset(self):
+        self.warmed_up = False
+        self.draining = False
+        self.checks = {}
+
+readiness = Readiness()
+
+async def check_mongodb():
+    await mongodb.database.command("ping")
+    missing = await missing_indexes()
+    if missing:
+        raise RuntimeError(f"missing indexes: {', '.join(missing)}")
+
+def _check_qdrant():
+    # Creates the collection when absent, as the first upload would
+    ensure_collection_exists()
+    qdrant_db.client.get_collection(qdrant_db.collection_name)
+
+async def check_qdrant():
+    await asyncio.to_thread(_check_qdrant)
+
+async def check_embedding_provider():
+    if settings.warm_up_providers == "call":
+        await embedding_service.generate_embedding("warm-up", priority=Priority.BACKGROUND)
+    else:
+        await embedding_service.client.models.list()
+
+async def check_llm_provider():
+    if settings.warm_up_providers == "call":
+        # Every cascade tier, so a misconfigured model name fails readiness
+        for tier in model_cascade.tiers:
+            await llm_scheduler.run(
+                lambda: llm_service.client.chat.completions.create(
+                    model=tier.model, messages=[{"role": "user", "content": "ping"}], max_tokens=1
+                ),
+                cost_tokens=2,
+                priority=Priority.BACKGROUND
+            )
+    else:
+        await llm_service.client.models.list()
+
+async def _run_check(name: str, check: Callable[[], Awaitable[None]]) -> bool:
+    try:
+        await asyncio.wait_for(check(), timeout=settings.health_check_timeout_seconds)
+    except Exception as e:
+        readiness.checks[name] = f"error: {str(e) or type(e).__name__}"
+        return False
+    readiness.checks[name] = "ok"
+    return True
+
+def _warm_up_checks() -> Dict[str, Callable[[], Awaitable[None]]]:
+    checks = {"mongodb": check_mongodb, "qdrant": check_qdrant}
+    if settings.warm_up_providers not in WARM_UP_MODES:
+        logger.warning("Unknown WARM_UP_PROVIDERS %r, skipping provider warm-up", settings.warm_up_providers)
+    elif settings.warm_up_providers != "none":
+        checks.update(embedding=check_embedding_provider, llm=check_llm_provider)
+    return checks
+
+async def warm_up():
+    """Import deferred modules and check every dependency until all pass, then mark the worker ready"""
+    await asyncio.to_thread(lambda: [importlib.import_module(name) for name in WARM_UP_MODULES])
+    pending = _warm_up_checks()
+    if "embedding" not in pending:
+        readiness.checks.update(embedding="skipped", llm="skipped")
+    while pending:
+        results = await asyncio.gather(*(_run_check(name, check) for name, check in pending.items()))
+        pending = {name: check for (name, check), ok in zip(pending.items(), results) if not ok}
+        if pending:
+            logger.warning("Warm-up waiting on dependencies", extra={"checks": readiness.checks})
+            await asyncio.sleep(settings.health_retry_seconds)
+    readiness.warmed_up = True
+    logger.info("Worker ready", extra={"checks": readiness.checks})
+
+async def check_ready() -> bool:
+    """Re-check the storage connections of a warmed-up worker
+
+    Provider outages are not re-checked: every replica would drop out of the
+    load balancer at once, while /ask already reports them per request.
+    """
+    if not readiness.warmed_up or readiness.draining:
+        return False
+    results = await asyncio.gather(
+        _run_check("mongodb", lambda: mongodb.database.command("ping")),
+        _run_check("qdrant", lambda: asyncio.to_thread(qdrant_db.client.get_collection, qdrant_db.collection_name))
+    )
+    return all(results)
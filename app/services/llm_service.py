@@ -1,28 +1,58 @@
-import openai
-from typing import List, Dict, Any
+import logging
+from typing import List, Dict, Any, Optional
 from app.config import settings
+from app.services.scheduler import llm_scheduler, Priority, estimate_tokens
+from app.services.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+# Appended to the prompt of cascade tiers that self-report confidence (see model_cascade)
+CONFIDENCE_INSTRUCTION = (
+    "After your answer, add a final line of the form \"CONFIDENCE: <number between 0 and 1>\" "
+    "rating how fully the context supports your answer."
+)
 
 class LLMService:
     
     def __init__(self):
-        # Configure OpenAI-compatible client with separate LLM API key
-        self.client = openai.OpenAI(
-            api_key=settings.llm_api_key,  # Separate API key for LLM provider
-            base_url=settings.llm_base_url  # Dynamic base URL for any OpenAI-compatible API
-        )
+        # The OpenAI client is created on first use (see `client`)
+        self._client = None
         
         # Dynamic model configuration from environment
         self.model = settings.llm_model_name
         self.max_tokens = settings.llm_max_tokens
         self.temperature = settings.llm_temperature
         
-        print(f"LLM Service initialized with provider: {settings.llm_base_url}")
-        print(f"Using model: {self.model}")
+        logger.info(
+            "LLM Service initialized",
+            extra={"provider": settings.llm_base_url, "model": self.model}
+        )
     
+    @property
+    def client(self):
+        if self._client is None:
+            import openai
+            
+            # Configure OpenAI-compatible client with separate LLM API key
+            self._client = openai.AsyncOpenAI(
+                api_key=settings.llm_api_key,  # Separate API key for LLM provider
+                base_url=settings.llm_base_url,  # Dynamic base URL for any OpenAI-compatible API
+                max_retries=0  # Retries and backoff are handled by the outbound scheduler
+            )
+        return self._client
+    
+    @client.setter
+    def client(self, client):
+        self._client = client
+    
+    @traced("llm.generate_answer")
     async def generate_answer(
         self, 
         question: str, 
-        context_chunks: List[Dict[str, Any]]
+        context_chunks: List[Dict[str, Any]],
+        priority: Priority = Priority.INTERACTIVE,
+        model: Optional[str] = None,
+        report_confidence: bool = False
     ) -> str:
         """
         Generate answer based on question and retrieved context chunks
@@ -30,6 +60,9 @@ class LLMService:
         Args:
             question: User's question
             context_chunks: List of relevant text chunks with metadata
+            priority: Scheduling priority for the provider call
+            model: Model to use instead of the configured one
+            report_confidence: Ask for a trailing "CONFIDENCE: x" line
             
         Returns:
             Generated answer string
@@ -44,17 +77,25 @@ class LLMService:
             
             # Create user prompt with context and question
             user_prompt = self._create_user_prompt(question, context_text)
+            if report_confidence:
+                user_prompt = f"{user_prompt}\n\n{CONFIDENCE_INSTRUCTION}"
+            
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
             
             # Generate response using OpenAI-compatible API
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                stream=False
+            response = await llm_scheduler.run(
+                lambda: self.client.chat.completions.create(
+                    model=model or self.model,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    stream=False
+                ),
+                cost_tokens=estimate_tokens(system_prompt, user_prompt) + self.max_tokens,
+                priority=priority
             )
             
             # Extract answer
@@ -63,7 +104,7 @@ class LLMService:
             return answer
             
         except Exception as e:
-            print(f"Error generating answer: {e}")
+            logger.error("Error generating answer: %s", e)
             raise ValueError(f"Failed to generate answer: {str(e)}")
     
     def _prepare_context(self, context_chunks: List[Dict[str, Any]]) -> str:
@@ -0,0 +1,207 @@
+import asyncio
+import glob
+import gzip
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from bson import json_util
+
+from app.config import settings
+from app.database.mongodb import get_database
+from app.services.reconciler import acquire_lease
+
+try:
+    import zstandard
+except ImportError:  # archives fall back to gzip
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "query_logs-"
+ZSTD_LEVEL = 10
+PAGE_SIZE = 1000
+
+def _extension() -> str:
+    return ".jsonl.zst" if zstandard is not None else ".jsonl.gz"
+
+def _open(path: str, mode: str):
+    """Text-mode handle on an archive file; the codec follows the extension"""
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL) if "w" in mode else None
+        return zstandard.open(path, mode, cctx=cctx, encoding="utf-8")
+    return gzip.open(path, mode, encoding="utf-8")
+
+def _archive_path(directory: str, day: datetime) -> str:
+    """query_logs-YYYY-MM-DD.jsonl.zst, or -YYYY-MM-DD.N.jsonl.zst when late logs of an archived day are archived again"""
+    base = os.path.join(directory, f"{ARCHIVE_PREFIX}{day:%Y-%m-%d}")
+    suffix, part = "", 0
+    while any(os.path.exists(base + suffix + extension) for extension in (".jsonl.zst", ".jsonl.gz")):
+        part += 1
+        suffix = f".{part}"
+    return base + suffix + _extension()
+
+def _archive_day(path: str) -> Optional[datetime]:
+    name = os.path.basename(path)[len(ARCHIVE_PREFIX):]
+    try:
+        return datetime.strptime(name[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
+
+def archive_files(directory: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[str]:
+    """Archive files whose day overlaps [start, end), oldest first"""
+    files = []
+    for path in sorted(glob.glob(os.path.join(glob.escape(directory), f"{ARCHIVE_PREFIX}*.jsonl.*"))):
+        day = _archive_day(path)
+        if day is None or path.endswith(".tmp"):
+            continue
+        if (start and day + timedelta(days=1) <= start) or (end and day >= end):
+            continue
+        files.append(path)
+    return files
+
+def read_archive(path: str) -> Iterator[Dict[str, Any]]:
+    with _open(path, "rt") as f:
+        for line in f:
+            if line.strip():
+                yield json_util.loads(line)
+
+def search_archives(
+    directory: str,
+    user_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Iterator[Dict[str, Any]]:
+    """Archived logs matching the user and [start, end), in file order"""
+    for path in archive_files(directory, start, end):
+        for log in read_archive(path):
+            if user_id is not None and log.get("user_id") != user_id:
+                continue
+            if (start and log["timestamp"] < start) or (end and log["timestamp"] >= end):
+                continue
+            yield log
+
+@dataclass
+class ArchiveReport:
+    days: int = 0
+    logs: int = 0
+    files: List[str] = field(default_factory=list)
+
+class LogArchiver:
+    """
+    Moves whole days of old query logs from MongoDB to compressed JSONL files
+
+    Logs are streamed a page at a time into a temporary file that is renamed
+    once complete; only then are they deleted from MongoDB, by id, so a
+    crash leaves either both copies or only the database one. Extended JSON
+    keeps ObjectIds and dates intact for re-import. The directory is never
+    created: it must already exist (a mounted persistent volume), otherwise
+    nothing is archived or deleted.
+    """
+
+    def __init__(self, directory: str, archive_after_days: int):
+        self.directory = directory
+        self.archive_after_days = archive_after_days
+
+    def cutoff(self, now: Optional[datetime] = None) -> datetime:
+        today = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - timedelta(days=self.archive_after_days)
+
+    async def run(self, now: Optional[datetime] = None) -> ArchiveReport:
+        report = ArchiveReport()
+        db = await get_database()
+        cutoff = self.cutoff(now)
+        if not self.directory or not os.path.isdir(self.directory):
+            logger.error(
+                "Query log archive directory %r does not exist; no logs archived or deleted", self.directory
+            )
+            return report
+
+        while True:
+            oldest = await db.query_logs.find(
+                {"timestamp": {"$lt": cutoff}}, projection={"timestamp": 1}, sort=[("timestamp", 1)]
+            ).limit(1).to_list(1)
+            if not oldest:
+                break
+            day = oldest[0]["timestamp"].replace(hour=0, minute=0, second=0, microsecond=0)
+            path, count = await self._archive_day(day)
+            report.days += 1
+            report.logs += count
+            report.files.append(path)
+
+        if report.logs:
+            logger.info("Archived query logs", extra={"days": report.days, "logs": report.logs})
+        return report
+
+    async def _archive_day(self, day: datetime):
+        db = await get_database()
+        path = _archive_path(self.directory, day)
+        tmp_path = path + ".tmp"
+        cursor = db.query_logs.find(
+            {"timestamp": {"$gte": day, "$lt": day + timedelta(days=1)}}, sort=[("timestamp", 1)]
+        )
+        archived = []
+        f = await asyncio.to_thread(_open, tmp_path, "wt")
+        try:
+            page = []
+            async for log in cursor:
+                page.append(log)
+                if len(page) >= PAGE_SIZE:
+                    archived.extend(await self._write(f, page))
+                    page = []
+            if page:
+                archived.extend(await self._write(f, page))
+        finally:
+            await asyncio.to_thread(f.close)
+        os.replace(tmp_path, path)
+
+        for i in range(0, len(archived), PAGE_SIZE):
+            await db.query_logs.delete_many({"_id": {"$in": archived[i:i + PAGE_SIZE]}})
+        return path, len(archived)
+
+    @staticmethod
+    async def _write(f, page: List[Dict[str, Any]]) -> List[Any]:
+        data = "".join(json_util.dumps(log) + "\n" for log in page)
+        await asyncio.to_thread(f.write, data)
+        return [log["_id"] for log in page]
+
+async def restore_logs(logs: Iterator[Dict[str, Any]]) -> int:
+    """Re-import archived logs; already present ones are left untouched"""
+    from pymongo import UpdateOne
+
+    db = await get_database()
+    restored, batch = 0, []
+    for log in logs:
+        batch.append(UpdateOne(
+            {"_id": log["_id"]},
+            {"$setOnInsert": {key: value for key, value in log.items() if key != "_id"}},
+            upsert=True
+        ))
+        if len(batch) >= PAGE_SIZE:
+            await db.query_logs.bulk_write(batch, ordered=False)
+            restored, batch = restored + len(batch), []
+    if batch:
+        await db.query_logs.bulk_write(batch, ordered=False)
+        restored += len(batch)
+    return restored
+
+async def run_log_archiver(interval: float):
+    """Periodic archival; one worker per interval does the work"""
+    if 0 < settings.query_log_retention_days <= settings.query_log_archive_after_days:
+        logger.warning(
+            "QUERY_LOG_RETENTION_DAYS expires logs before they are archived",
+            extra={"retention_days": settings.query_log_retention_days,
+                   "archive_after_days": settings.query_log_archive_after_days}
+        )
+    archiver = LogArchiver(settings.query_log_archive_dir, settings.query_log_archive_after_days)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await acquire_lease("archive_query_logs", interval * 0.9):
+                await archiver.run()
+        except Exception as e:
+            logger.warning("Query log archival failed: %s", e)
@@ -1,15 +1,26 @@
 from datetime import datetime
+from typing import Any, Dict, Optional
+import logging
 from app.database.mongodb import get_database
+from app.services.analytics import analytics_service
+from app.services.tracing import traced
+
+logger = logging.getLogger(__name__)
 
 class LoggingService:
     
+    @traced("mongodb.query_logs.log_query")
     async def log_query(
         self,
         user_id: str,
         question: str,
         answer: str,
         response_time_ms: int,
-        retrieved_chunks_count: int
+        retrieved_chunks_count: int,
+        timed_out: bool = False,
+        cache_hit: Optional[bool] = None,
+        retrieval: Optional[Dict[str, Any]] = None,
+        cascade: Optional[Dict[str, Any]] = None
     ) -> str:
         """
         Log a query and response to the database
@@ -20,6 +31,10 @@ class LoggingService:
             answer: The generated answer
             response_time_ms: Time taken to generate response in milliseconds
             retrieved_chunks_count: Number of chunks retrieved for context
+            timed_out: Whether generation ran out of time and no answer was returned
+            cache_hit: Whether the question embedding came from the query cache
+            retrieval: How many chunks the retrieval policy fetched and kept, and why
+            cascade: Which model tier answered, and why it escalated if it did
             
         Returns:
             ID of the logged query
@@ -33,6 +48,10 @@ class LoggingService:
                 "answer": answer,
                 "response_time_ms": response_time_ms,
                 "retrieved_chunks_count": retrieved_chunks_count,
+                "timed_out": timed_out,
+                "cache_hit": cache_hit,
+                "retrieval": retrieval,
+                "cascade": cascade,
                 "timestamp": datetime.utcnow()
             }
             
@@ -40,10 +59,13 @@ class LoggingService:
             db = await get_database()
             result = await db.query_logs.insert_one(log_data)
             
+            # Rollups are written in the background by run_rollup_flusher
+            analytics_service.record(log_data)
+            
             return str(result.inserted_id)
             
         except Exception as e:
-            print(f"Error logging query: {e}")
+            logger.error("Error logging query: %s", e)
             # Don't raise exception for logging failures - just log and continue
             return None
     
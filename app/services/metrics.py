@@ -0,0 +1,160 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+# Buckets span fast in-process stages (ms) up to slow provider calls (tens of s)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+ASK_ROUTE = "/ask"
+UPLOAD_ROUTE = "/documents/upload"
+
+STAGE_DURATION = Histogram(
+    "twerlo_stage_duration_seconds",
+    "Time spent in each stage of a request pipeline",
+    ["route", "stage"],
+    buckets=LATENCY_BUCKETS
+)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "twerlo_http_request_duration_seconds",
+    "End-to-end HTTP request latency",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+# multiprocess_mode says how gauges of several workers combine (see render_metrics)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "twerlo_http_requests_in_flight",
+    "HTTP requests currently being served",
+    multiprocess_mode="livesum"
+)
+
+PROVIDER_REQUESTS_IN_FLIGHT = Gauge(
+    "twerlo_provider_requests_in_flight",
+    "Outbound provider calls currently running",
+    ["provider"],
+    multiprocess_mode="livesum"
+)
+
+PROVIDER_CONCURRENCY_LIMIT = Gauge(
+    "twerlo_provider_concurrency_limit",
+    "Current adaptive concurrency limit of the outbound scheduler",
+    ["provider"],
+    multiprocess_mode="liveall"
+)
+
+PROVIDER_ERRORS = Counter(
+    "twerlo_provider_errors_total",
+    "Failed outbound provider calls",
+    ["provider", "status"]
+)
+
+PROVIDER_RETRIES = Counter(
+    "twerlo_provider_retries_total",
+    "Retried outbound provider calls",
+    ["provider"]
+)
+
+CACHE_REQUESTS = Counter(
+    "twerlo_cache_requests_total",
+    "Cache lookups by outcome; hit ratio = hit / (hit + miss)",
+    ["cache", "result"]
+)
+
+LLM_ANSWERS = Counter(
+    "twerlo_llm_answers_total",
+    "/ask answers by model cascade tier and escalation reason",
+    ["tier", "reason"]
+)
+
+CACHE_ERRORS = Counter(
+    "twerlo_cache_errors_total",
+    "Failed shared cache operations; a failed take means rate limiting failed open",
+    ["operation"]
+)
+
+DUPLICATE_CHUNKS = Counter(
+    "twerlo_duplicate_chunks_total",
+    "Ingested chunks stored as references to an existing point instead of a new vector",
+    ["kind"]
+)
+
+INDEX_DRIFT = Gauge(
+    "twerlo_index_drift",
+    "Inconsistencies between MongoDB and Qdrant found by the last reconciliation",
+    ["kind"],
+    multiprocess_mode="mostrecent"
+)
+
+
+@contextmanager
+def observe_stage(route: str, stage: str):
+    """Record the duration of a pipeline stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(route, stage).observe(time.perf_counter() - start)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def multiprocess_enabled() -> bool:
+    """Several workers write their samples to PROMETHEUS_MULTIPROC_DIR (set by start.sh)"""
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def render_metrics() -> bytes:
+    if multiprocess_enabled():
+        # Whichever worker serves /metrics reports the samples of all of them
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+def mark_worker_stopped():
+    """Drop the live gauges of this worker from the combined metrics"""
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class PrometheusMiddleware:
+    """ASGI middleware recording request latency and in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope; use its template
+            # so path parameters such as document ids don't explode cardinality
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"], route_path, str(status_code)
+            ).observe(time.perf_counter() - start)
+
@@ -0,0 +1,192 @@
+import logging
+import re
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.llm_service import llm_service
+from app.services.metrics import LLM_ANSWERS
+from app.utils.deadline import Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# Answers saying the context does not support one
+INSUFFICIENT_CONTEXT = re.compile(
+    r"(does not|doesn't|do not|don't) (contain|include|provide|have) (enough|sufficient|any relevant)"
+    r"|not enough information|insufficient (context|information)"
+    r"|(cannot|can't|unable to) (answer|determine|find the answer)",
+    re.IGNORECASE
+)
+
+# Trailing line requested by CONFIDENCE_INSTRUCTION
+CONFIDENCE_LINE = re.compile(r"\s*\**CONFIDENCE\**:\s*\**([01](?:\.\d+)?)\**\s*$", re.IGNORECASE)
+
+@dataclass
+class LLMTier:
+    name: str
+    model: str
+    timeout_seconds: float
+
+@dataclass
+class CascadeDecision:
+    """Which tier answered and why; stored with the query log"""
+    tier: str
+    model: str
+    # low_retrieval_score | insufficient_context | low_confidence | fast_tier_failed
+    escalation_reason: Optional[str] = None
+    # Self-reported by the fast tier
+    confidence: Optional[float] = None
+    # Time spent in the fast tier before escalating
+    fast_tier_ms: Optional[int] = None
+    # The request deadline ran out in `tier`
+    timed_out: bool = False
+    # An escalated fast answer returned because the strong tier ran out of time
+    low_confidence: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+class CascadeTimeout(DeadlineExceeded):
+    """The deadline ran out before any tier answered; carries the decision so far"""
+
+    def __init__(self, stage: str, decision: CascadeDecision):
+        super().__init__(stage)
+        self.decision = decision
+
+def split_confidence(answer: str) -> Tuple[str, Optional[float]]:
+    """Strip the trailing confidence line; None when the model left it out"""
+    match = CONFIDENCE_LINE.search(answer)
+    if match is None:
+        return answer, None
+    return answer[:match.start()].rstrip(), float(match.group(1))
+
+class ModelCascade:
+    """
+    Answers with a fast model first and escalates to the strong one when unsure
+
+    The fast tier is skipped when the best retrieved chunk scores below
+    `min_retrieval_score`. Its answer is replaced by the strong tier's when
+    it says the context is insufficient, reports a confidence below
+    `min_confidence`, fails or exceeds its own timeout. Without retrieved
+    chunks the strong tier could not do better, so the fast answer stands.
+    If the request deadline runs out while escalating, the fast answer is
+    returned after all, flagged as low-confidence.
+    """
+
+    def __init__(
+        self,
+        fast: Optional[LLMTier],
+        strong: LLMTier,
+        min_retrieval_score: float,
+        confidence_check: bool,
+        min_confidence: float
+    ):
+        self.fast = fast
+        self.strong = strong
+        self.min_retrieval_score = min_retrieval_score
+        self.confidence_check = confidence_check
+        self.min_confidence = min_confidence
+
+    @property
+    def tiers(self) -> List[LLMTier]:
+        return [tier for tier in (self.fast, self.strong) if tier is not None]
+
+    async def _generate(self, tier: LLMTier, question: str, chunks: List[Dict[str, Any]], deadline: Deadline) -> str:
+        return await deadline.run(
+            llm_service.generate_answer(
+                question=question,
+                context_chunks=chunks,
+                model=tier.model,
+                report_confidence=tier is self.fast and self.confidence_check
+            ),
+            stage="generating the answer",
+            stage_timeout=tier.timeout_seconds
+        )
+
+    def _escalation_reason(self, answer: str, confidence: Optional[float]) -> Optional[str]:
+        if INSUFFICIENT_CONTEXT.search(answer):
+            return "insufficient_context"
+        if confidence is not None and confidence < self.min_confidence:
+            return "low_confidence"
+        return None
+
+    async def answer(
+        self,
+        question: str,
+        chunks: List[Dict[str, Any]],
+        deadline: Deadline
+    ) -> Tuple[str, CascadeDecision]:
+        """Answer from `chunks` (best first); CascadeTimeout when the request runs out of time"""
+        decision = CascadeDecision(tier=self.strong.name, model=self.strong.model)
+        if self.fast is None:
+            return await self._answer_strong(question, chunks, deadline, decision, None)
+
+        fast_answer = None
+        if chunks and chunks[0]["score"] < self.min_retrieval_score:
+            decision.escalation_reason = "low_retrieval_score"
+        else:
+            started = time.perf_counter()
+            try:
+                answer = await self._generate(self.fast, question, chunks, deadline)
+            except DeadlineExceeded as e:
+                if deadline.expired:
+                    decision.tier, decision.model, decision.timed_out = self.fast.name, self.fast.model, True
+                    raise CascadeTimeout(e.stage, decision) from e
+                decision.escalation_reason = "fast_tier_failed"
+            except Exception as e:
+                logger.warning("Fast tier failed: %s", e, extra={"model": self.fast.model})
+                decision.escalation_reason = "fast_tier_failed"
+            else:
+                if self.confidence_check:
+                    answer, decision.confidence = split_confidence(answer)
+                if chunks:
+                    decision.escalation_reason = self._escalation_reason(answer, decision.confidence)
+                if decision.escalation_reason is None:
+                    decision.tier, decision.model = self.fast.name, self.fast.model
+                    return answer, self._record(decision)
+                fast_answer = answer
+            decision.fast_tier_ms = int((time.perf_counter() - started) * 1000)
+
+        logger.info(
+            "Escalating question to the %s tier", self.strong.name,
+            extra={"reason": decision.escalation_reason, "confidence": decision.confidence}
+        )
+        return await self._answer_strong(question, chunks, deadline, decision, fast_answer)
+
+    async def _answer_strong(
+        self,
+        question: str,
+        chunks: List[Dict[str, Any]],
+        deadline: Deadline,
+        decision: CascadeDecision,
+        fast_answer: Optional[str]
+    ) -> Tuple[str, CascadeDecision]:
+        try:
+            answer = await self._generate(self.strong, question, chunks, deadline)
+        except DeadlineExceeded as e:
+            decision.timed_out = True
+            if fast_answer is None:
+                raise CascadeTimeout(e.stage, decision) from e
+            logger.warning(
+                "The %s tier ran out of time; returning the escalated %s answer", self.strong.name, self.fast.name,
+                extra={"reason": decision.escalation_reason, "confidence": decision.confidence}
+            )
+            decision.tier, decision.model, decision.low_confidence = self.fast.name, self.fast.model, True
+            return fast_answer, self._record(decision)
+        return answer, self._record(decision)
+
+    @staticmethod
+    def _record(decision: CascadeDecision) -> CascadeDecision:
+        LLM_ANSWERS.labels(tier=decision.tier, reason=decision.escalation_reason or "none").inc()
+        return decision
+
+# Singleton instance; without LLM_FAST_MODEL_NAME every question goes to LLM_MODEL_NAME
+model_cascade = ModelCascade(
+    fast=LLMTier("fast", settings.llm_fast_model_name, settings.llm_fast_timeout_seconds)
+    if settings.llm_fast_model_name else None,
+    strong=LLMTier("strong", settings.llm_model_name, settings.llm_timeout_seconds),
+    min_retrieval_score=settings.llm_cascade_min_retrieval_score,
+    confidence_check=settings.llm_cascade_confidence_check,
+    min_confidence=settings.llm_cascade_min_confidence
+)
@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import Counter, defaultdict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List
+
+
+from app.config import settings
+from app.database.mongodb import get_database
+from app.database.qdrant_client import (
+    chunk_point_id, delete_points, existing_point_ids, qdrant_db, scroll_document_points, scroll_points
+)
+from app.services.deduplication import FINGERPRINTS, REFERENCES, chunk_deduplicator
+from app.services.metrics import INDEX_DRIFT
+
+logger = logging.getLogger(__name__)
+
+LOCKS = "maintenance_locks"
+
+# Documents this recent may still be embedding; their counts are checked next time
+INGEST_GRACE = timedelta(minutes=10)
+
+@dataclass
+class ReconcileReport:
+    collection: str
+    dry_run: bool
+    points_scanned: int = 0
+    orphan_points: int = 0
+    orphan_documents: int = 0
+    points_deleted: int = 0
+    points_handed_over: int = 0
+    documents_checked: int = 0
+    documents_missing_chunks: int = 0
+    chunks_missing: int = 0
+    # Points of live documents whose content is no longer in the document
+    extra_points: int = 0
+    documents_with_extra_points: int = 0
+    counts_fixed: int = 0
+    dangling_references: int = 0
+    stale_fingerprints: int = 0
+    duration_seconds: float = 0.0
+
+    @property
+    def drift(self) -> int:
+        return (
+            self.orphan_points + self.extra_points + self.chunks_missing
+            + self.dangling_references + self.stale_fingerprints
+        )
+
+class Reconciler:
+    """
+    Cross-checks the active Qdrant collection against MongoDB
+
+    Qdrant is scrolled in pages and the document ids on each page are looked
+    up in one `$in` query. Points of deleted documents are removed (or handed
+    over when another document references them), as are points of live
+    documents whose content is not in their `chunk_hashes` (left by an update
+    that did not finish). Chunk counts are corrected from what is actually
+    searchable, and references or fingerprints whose point no longer exists
+    are dropped.
+    """
+
+    def __init__(self, page_size: int = 1000, dry_run: bool = False):
+        self.page_size = page_size
+        self.dry_run = dry_run
+
+    async def run(self) -> ReconcileReport:
+        started = time.perf_counter()
+        report = ReconcileReport(collection=qdrant_db.collection_name, dry_run=self.dry_run)
+
+        await self._scan_points(report)
+        await self._check_documents(report)
+        await self._check_references(report)
+        await self._check_fingerprints(report)
+
+        report.duration_seconds = round(time.perf_counter() - started, 3)
+        for kind in ("orphan_points", "extra_points", "chunks_missing", "dangling_references", "stale_fingerprints"):
+            INDEX_DRIFT.labels(kind).set(getattr(report, kind))
+        logger.info("Reconciliation finished", extra=asdict(report))
+        return report
+
+    async def _scan_points(self, report: ReconcileReport):
+        """Remove points of documents that no longer exist"""
+        db = await get_database()
+        offset = None
+        while True:
+            points, offset = await asyncio.to_thread(
+                scroll_points, offset, self.page_size, ["document_id"]
+            )
+            report.points_scanned += len(points)
+
+            by_document: Dict[Any, List[str]] = defaultdict(list)
+            for point in points:
+                by_document[(point.payload or {}).get("document_id")].append(str(point.id))
+            known = {
+                doc["_id"] for doc in await db.documents.find(
+                    {"_id": {"$in": [doc_id for doc_id in by_document if doc_id is not None]}},
+                    projection={"_id": 1}
+                ).to_list(None)
+            }
+
+            for document_id, point_ids in by_document.items():
+                if document_id in known:
+                    continue
+                report.orphan_documents += 1
+                report.orphan_points += len(point_ids)
+                if not self.dry_run:
+                    await self._remove_points(document_id, point_ids, report)
+
+            if offset is None:
+                return
+
+    async def _remove_points(self, document_id, point_ids: List[str], report: ReconcileReport):
+        """Delete points a document gave up, handing over those other documents reference"""
+        deletable = await chunk_deduplicator.release(document_id, point_ids) if document_id else point_ids
+        report.points_handed_over += len(point_ids) - len(deletable)
+        await asyncio.to_thread(delete_points, deletable)
+        report.points_deleted += len(deletable)
+
+    async def _check_references(self, report: ReconcileReport):
+        """Drop references to points that are gone or from documents that are gone"""
+        db = await get_database()
+        cursor = db[REFERENCES].find({}, projection={"document_id": 1, "point_id": 1})
+        async for page in self._pages(cursor):
+            alive = await asyncio.to_thread(existing_point_ids, list({ref["point_id"] for ref in page}))
+            documents = {
+                doc["_id"] for doc in await db.documents.find(
+                    {"_id": {"$in": list({ref["document_id"] for ref in page})}}, projection={"_id": 1}
+                ).to_list(None)
+            }
+            dangling = [
+                ref["_id"] for ref in page
+                if ref["point_id"] not in alive or ref["document_id"] not in documents
+            ]
+            report.dangling_references += len(dangling)
+            if dangling and not self.dry_run:
+                await db[REFERENCES].delete_many({"_id": {"$in": dangling}})
+
+    async def _check_fingerprints(self, report: ReconcileReport):
+        """Drop fingerprints of points that are gone, so new chunks never reference them"""
+        db = await get_database()
+        cursor = db[FINGERPRINTS].find({}, projection={"_id": 1})
+        async for page in self._pages(cursor):
+            ids = [fingerprint["_id"] for fingerprint in page]
+            alive = await asyncio.to_thread(existing_point_ids, ids)
+            stale = [point_id for point_id in ids if point_id not in alive]
+            report.stale_fingerprints += len(stale)
+            if stale and not self.dry_run:
+                await db[FINGERPRINTS].delete_many({"_id": {"$in": stale}})
+
+    async def _check_documents(self, report: ReconcileReport):
+        """Compare each document's points with its chunk hashes, and its chunk count with what is searchable"""
+        db = await get_database()
+        cutoff = datetime.utcnow() - INGEST_GRACE
+        cursor = db.documents.find(
+            {"created_at": {"$lt": cutoff}},
+            projection={"chunk_hashes": 1, "chunks_count": 1, "chunks_total": 1, "updated_at": 1}
+        )
+        async for page in self._pages(cursor):
+            page = [doc for doc in page if not (doc.get("updated_at") and doc["updated_at"] >= cutoff)]
+            if not page:
+                continue
+            document_ids = [doc["_id"] for doc in page]
+            references = Counter(
+                ref["document_id"] for ref in await db[REFERENCES].find(
+                    {"document_id": {"$in": document_ids}}, projection={"document_id": 1}
+                ).to_list(None)
+            )
+            # Content hash of each owned point; handed-over points keep the id of their first document
+            fingerprints = {
+                fp["_id"]: fp["content_hash"] for fp in await db[FINGERPRINTS].find(
+                    {"document_id": {"$in": document_ids}}, projection={"content_hash": 1}
+                ).to_list(None)
+            }
+            points = await asyncio.to_thread(scroll_document_points, document_ids, ["document_id", "created_at"])
+            points_of: Dict[str, List] = defaultdict(list)
+            for point in points:
+                points_of[point.payload["document_id"]].append(point)
+
+            for doc in page:
+                report.documents_checked += 1
+                hashes = doc.get("chunk_hashes")
+                point_ids = [str(point.id) for point in points_of[doc["_id"]]]
+                extras = self._extra_points(doc["_id"], hashes, points_of[doc["_id"]], fingerprints) if hashes else []
+                if extras:
+                    report.documents_with_extra_points += 1
+                    report.extra_points += len(extras)
+                    if not self.dry_run:
+                        await self._remove_points(doc["_id"], extras, report)
+                # chunks_total keeps the original count once chunks_count has been corrected
+                total = len(hashes) if hashes else doc.get("chunks_total", doc["chunks_count"])
+                # Repeated passages within a document share one point
+                distinct = len(set(hashes)) if hashes else total
+                indexed = len(point_ids) - len(extras) + references[doc["_id"]]
+                missing = max(0, distinct - indexed)
+                if missing:
+                    report.documents_missing_chunks += 1
+                    report.chunks_missing += missing
+                expected = total - missing
+                if expected != doc["chunks_count"]:
+                    report.counts_fixed += 1
+                    if not self.dry_run:
+                        await db.documents.update_one(
+                            {"_id": doc["_id"]},
+                            {"$set": {"chunks_count": expected, "chunks_total": total}}
+                        )
+
+    @staticmethod
+    def _extra_points(document_id: str, hashes: List[str], points: List, fingerprints: Dict[str, str]) -> List[str]:
+        """Ids of points whose content is not among the document's chunk hashes
+
+        Points stored within INGEST_GRACE are left alone: an update stores the
+        new version's points before it records the new hashes.
+        """
+        expected = set(hashes)
+        derived = {chunk_point_id(document_id, content_hash) for content_hash in expected}
+        recent = (datetime.utcnow() - INGEST_GRACE).isoformat()
+        return [
+            str(point.id) for point in points
+            if str(point.id) not in derived
+            and fingerprints.get(str(point.id)) not in expected
+            and (point.payload.get("created_at") or "") < recent
+        ]
+
+    async def _pages(self, cursor) -> AsyncIterator[List[Dict[str, Any]]]:
+        page = []
+        async for doc in cursor:
+            page.append(doc)
+            if len(page) >= self.page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+async def acquire_lease(name: str, seconds: float) -> bool:
+    """Cluster-wide lease so only one worker runs a periodic job"""
+    from pymongo.errors import DuplicateKeyError
+
+    db = await get_database()
+    now = datetime.utcnow()
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+    try:
+        result = await db[LOCKS].update_one(
+            {"_id": name, "$or": [{"expires_at": {"$lt": now}}, {"holder": holder}]},
+            {"$set": {"holder": holder, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Held by another worker: the filter missed and the upsert collided
+        return False
+    return result.matched_count > 0 or result.upserted_id is not None
+
+async def run_reconciler(interval: float):
+    """Periodic reconciliation; one worker per interval does the work"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await acquire_lease("reconcile", interval * 0.9):
+                await Reconciler().run()
+        except Exception as e:
+            logger.warning("Reconciliation failed: %s", e)
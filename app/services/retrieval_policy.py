@@ -0,0 +1,104 @@
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+@dataclass
+class RetrievalDecision:
+    """How many of the fetched chunks were kept and why; stored with the query log"""
+    fetched: int
+    kept: int
+    min_score: float
+    top_score: Optional[float] = None
+    # Lowest kept score
+    cutoff_score: Optional[float] = None
+    # fixed | empty | all | relative | gap | min_chunks
+    reason: str = "fixed"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+def parse_min_scores(value: str) -> Dict[str, float]:
+    """Parse "model=score,model=score" pairs (RETRIEVAL_MIN_SCORES)"""
+    scores = {}
+    for item in value.split(","):
+        model, _, score = item.partition("=")
+        if model.strip() and score.strip():
+            scores[model.strip()] = float(score)
+    return scores
+
+class RetrievalPolicy:
+    """
+    Picks how many retrieved chunks go to the LLM from their score distribution
+
+    The search fetches up to `max_chunks` above a per-model minimum score.
+    Chunks scoring below `relative_threshold` of the top one are dropped, and
+    the context ends at the largest drop between consecutive scores if that
+    drop is at least `min_gap`. One clear answer then travels alone. A flat
+    distribution, typical of hard or broad questions, keeps its full depth.
+    """
+
+    def __init__(
+        self,
+        adaptive: bool,
+        max_chunks: int,
+        min_chunks: int,
+        relative_threshold: float,
+        min_gap: float,
+        default_min_score: float,
+        min_scores: Dict[str, float]
+    ):
+        self.adaptive = adaptive
+        self.max_chunks = max_chunks
+        self.min_chunks = min_chunks
+        self.relative_threshold = relative_threshold
+        self.min_gap = min_gap
+        self.default_min_score = default_min_score
+        self.min_scores = min_scores
+
+    @property
+    def fetch_limit(self) -> int:
+        # The fixed policy keeps the original depth of 5
+        return self.max_chunks if self.adaptive else 5
+
+    def min_score(self, model: str) -> float:
+        """Score floor calibrated for the embedding model (see benchmarks.retrieval.evaluate)"""
+        return self.min_scores.get(model, self.default_min_score)
+
+    def select(self, chunks: List[Dict[str, Any]], min_score: float) -> Tuple[List[Dict[str, Any]], RetrievalDecision]:
+        """Keep a prefix of `chunks` (sorted by descending score, all above `min_score`)"""
+        decision = RetrievalDecision(fetched=len(chunks), kept=len(chunks), min_score=min_score)
+        if not chunks:
+            decision.reason = "empty"
+            return chunks, decision
+        scores = [chunk["score"] for chunk in chunks]
+        decision.top_score = scores[0]
+        if self.adaptive:
+            # Cosine scores can be <= 0, where a ratio of the top score means nothing
+            floor = scores[0] * self.relative_threshold if scores[0] > 0 else scores[0]
+            kept = sum(1 for score in scores if score >= floor)
+            decision.reason = "relative" if kept < len(scores) else "all"
+
+            # Largest drop between neighbours; never cut below min_chunks
+            drops = [(scores[i] - scores[i + 1], i + 1) for i in range(self.min_chunks - 1, kept - 1)]
+            if drops:
+                drop, position = max(drops)
+                if drop >= self.min_gap:
+                    kept, decision.reason = position, "gap"
+            if kept < self.min_chunks:
+                kept, decision.reason = min(self.min_chunks, len(scores)), "min_chunks"
+            chunks = chunks[:kept]
+        decision.kept = len(chunks)
+        decision.cutoff_score = chunks[-1]["score"]
+        return chunks, decision
+
+# Singleton instance
+retrieval_policy = RetrievalPolicy(
+    adaptive=settings.retrieval_adaptive,
+    max_chunks=settings.retrieval_max_chunks,
+    min_chunks=max(1, settings.retrieval_min_chunks),
+    relative_threshold=settings.retrieval_relative_threshold,
+    min_gap=settings.retrieval_min_gap,
+    default_min_score=settings.retrieval_min_score,
+    min_scores=parse_min_scores(settings.retrieval_min_scores)
+)
@@ -0,0 +1,314 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Optional
+
+from app.config import settings
+from app.services.cache import shared_cache
+from app.utils.deadline import current_deadline
+from app.services.tracing import tracer
+from app.services.metrics import (
+    CACHE_ERRORS, PROVIDER_ERRORS, PROVIDER_RETRIES, PROVIDER_REQUESTS_IN_FLIGHT, PROVIDER_CONCURRENCY_LIMIT
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Scheduling priority for outbound provider calls (lower runs first)"""
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+# Status codes that mean "slow down" as opposed to a plain server failure
+THROTTLE_STATUS_CODES = {429, 503}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for budgeting"""
+    return sum(len(text) // 4 + 1 for text in texts if text)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        response = getattr(error, "response", None)
+        status_code = getattr(response, "status_code", None)
+    return status_code
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Read retry-after hints (seconds) from a provider error response"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def _is_connection_error(error: Exception) -> bool:
+    return isinstance(error, (ConnectionError, asyncio.TimeoutError)) or type(error).__name__ in (
+        "APIConnectionError", "APITimeoutError"
+    )
+
+
+class TokenBucket:
+    """Continuously refilling budget measured per minute"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, amount: float, reserve: float = 0.0) -> float:
+        """Seconds until `amount` can be taken while leaving `reserve` untouched"""
+        now = time.monotonic()
+        self._refill(now)
+        needed = min(amount, self.capacity) + reserve * self.capacity
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def drain(self):
+        """Empty the bucket after the provider told us we are over quota"""
+        self.tokens = min(self.tokens, 0.0)
+
+
+class OutboundScheduler:
+    """
+    Shared gate for calls to a rate-limited provider.
+
+    Requests wait in a priority queue until the request and token budgets
+    allow them through. Concurrency adapts AIMD-style: it is halved on
+    throttling responses (honouring retry-after) and grows back by one slot
+    per window of successful calls. Background work may not use the slots
+    and budget share reserved for interactive traffic.
+
+    With a shared cache backend the request and token budgets are claimed
+    from it instead of the local buckets, so all workers together stay
+    within the provider quota.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_concurrency: int,
+        max_retries: int = 5,
+        interactive_reserve: float = 0.1
+    ):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = float(self.max_concurrency)
+        self.max_retries = max_retries
+        self.interactive_reserve = interactive_reserve
+
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._waiters: list = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._claiming: Optional[asyncio.Task] = None
+        PROVIDER_CONCURRENCY_LIMIT.labels(name).set(self.concurrency)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for entry in self._waiters if not entry[3].done())
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        cost_tokens: int = 1,
+        priority: Priority = Priority.INTERACTIVE
+    ) -> Any:
+        """Run `call` under the budget, retrying throttled and transient failures"""
+
+        deadline = current_deadline.get()
+        attempt = 0
+        while True:
+            with tracer.span(f"{self.name}.queue", priority=priority.name):
+                await self._acquire(cost_tokens, priority)
+            try:
+                with tracer.span(f"{self.name}.request", attempt=attempt):
+                    result = await call()
+            except Exception as e:
+                status_code = _status_code(e)
+                PROVIDER_ERRORS.labels(self.name, str(status_code or "connection")).inc()
+                retryable = status_code in RETRYABLE_STATUS_CODES or (
+                    status_code is None and _is_connection_error(e)
+                )
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                wait = self._on_failure(e, status_code, attempt)
+                if deadline is not None and wait >= deadline.remaining():
+                    # No point queueing a retry the caller will never see
+                    raise
+                PROVIDER_RETRIES.labels(self.name).inc()
+                attempt += 1
+            else:
+                self._on_success()
+                return result
+            finally:
+                self._release()
+
+    async def _acquire(self, cost_tokens: int, priority: Priority):
+        loop = asyncio.get_running_loop()
+        # [priority, sequence, cost, future, budget already claimed from the shared backend]
+        entry = [int(priority), next(self._sequence), cost_tokens, loop.create_future(), False]
+        heapq.heappush(self._waiters, entry)
+        self._dispatch()
+        try:
+            await entry[3]
+        except asyncio.CancelledError:
+            # A slot granted in the same tick the caller was cancelled must be returned
+            if entry[3].done() and not entry[3].cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        self._in_flight -= 1
+        PROVIDER_REQUESTS_IN_FLIGHT.labels(self.name).dec()
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant queued requests in priority order while budgets allow"""
+
+        while self._waiters:
+            entry = self._waiters[0]
+            priority, _, cost_tokens, future, claimed = entry
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            background = priority != Priority.INTERACTIVE
+            slots = int(self.concurrency)
+            if background and slots > 1:
+                slots -= 1  # keep one slot free for interactive callers
+            if self._in_flight >= slots:
+                return
+
+            reserve = self.interactive_reserve if background else 0.0
+            shared = shared_cache.backend.shared
+            delay = self._paused_until - time.monotonic()
+            if shared:
+                if delay <= 0 and not claimed:
+                    # The claim needs a round trip; dispatching resumes once it is done
+                    if self._claiming is None:
+                        self._claiming = asyncio.create_task(self._claim_shared(entry, reserve))
+                    return
+            else:
+                delay = max(delay, self.requests.delay(1, reserve), self.tokens.delay(cost_tokens, reserve))
+            if delay > 0:
+                self._schedule_dispatch(delay)
+                return
+
+            heapq.heappop(self._waiters)
+            if not shared:
+                self.requests.consume(1)
+                self.tokens.consume(cost_tokens)
+            self._in_flight += 1
+            PROVIDER_REQUESTS_IN_FLIGHT.labels(self.name).inc()
+            future.set_result(None)
+
+    async def _claim_shared(self, entry: list, reserve: float):
+        try:
+            delay = await shared_cache.backend.take([
+                (f"{self.name}:requests", 1, self.requests.capacity, reserve),
+                (f"{self.name}:tokens", entry[2], self.tokens.capacity, reserve)
+            ])
+        except Exception as e:
+            # Fail open: throttling responses from the provider still slow us down
+            CACHE_ERRORS.labels("take").inc()
+            logger.warning("Shared %s rate limit unavailable: %s", self.name, e)
+            delay = 0.0
+        finally:
+            self._claiming = None
+        if delay > 0:
+            self._schedule_dispatch(delay)
+            return
+        entry[4] = True
+        self._dispatch()
+
+    async def _drain_shared(self):
+        try:
+            await shared_cache.backend.drain(f"{self.name}:requests")
+        except Exception as e:
+            CACHE_ERRORS.labels("drain").inc()
+            logger.warning("Could not drain shared %s rate limit: %s", self.name, e)
+
+    def _schedule_dispatch(self, delay: float):
+        if self._timer is not None and not self._timer.cancelled():
+            self._timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(delay, self._dispatch)
+
+    def _on_success(self):
+        if self.concurrency < self.max_concurrency:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            PROVIDER_CONCURRENCY_LIMIT.labels(self.name).set(self.concurrency)
+
+    def _on_failure(self, error: Exception, status_code: Optional[int], attempt: int) -> float:
+        backoff = min(60.0, 0.5 * 2 ** attempt) * (0.5 + random.random() / 2)
+        retry_after = _retry_after(error)
+        wait = retry_after if retry_after is not None else backoff
+
+        if status_code in THROTTLE_STATUS_CODES:
+            self.concurrency = max(1.0, self.concurrency / 2)
+            PROVIDER_CONCURRENCY_LIMIT.labels(self.name).set(self.concurrency)
+            self.requests.drain()
+            if shared_cache.backend.shared:
+                # Other workers share the quota the provider just said is spent
+                asyncio.get_running_loop().create_task(self._drain_shared())
+            self._paused_until = max(self._paused_until, time.monotonic() + wait)
+        else:
+            self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+
+        logger.warning(
+            "%s provider call failed (status=%s), retry %d/%d in %.2fs",
+            self.name, status_code, attempt + 1, self.max_retries, wait,
+            extra={"provider": self.name, "concurrency": self.concurrency}
+        )
+        return wait
+
+
+# Shared schedulers, one per provider
+embedding_scheduler = OutboundScheduler(
+    name="embedding",
+    requests_per_minute=settings.embedding_requests_per_minute,
+    tokens_per_minute=settings.embedding_tokens_per_minute,
+    max_concurrency=settings.embedding_max_concurrency,
+    max_retries=settings.provider_max_retries
+)
+
+llm_scheduler = OutboundScheduler(
+    name="llm",
+    requests_per_minute=settings.llm_requests_per_minute,
+    tokens_per_minute=settings.llm_tokens_per_minute,
+    max_concurrency=settings.llm_max_concurrency,
+    max_retries=settings.provider_max_retries
+)
@@ -0,0 +1,56 @@
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from app.database.mongodb import get_database
+from app.schemas.query import DocumentFilter
+from app.services.deduplication import REFERENCES
+
+@dataclass
+class SearchScope:
+    # None searches all of the user's documents
+    document_ids: Optional[List[str]] = None
+    # Points owned by other documents that the selected ones reference (deduplicated chunks)
+    point_ids: List[str] = field(default_factory=list)
+
+def glob_to_regex(pattern: str) -> str:
+    """Anchored regex for a filename glob: * is any run of characters, ? one character"""
+    return "^" + "".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in pattern) + "$"
+
+def _naive_utc(moment: datetime) -> datetime:
+    # Documents store naive UTC timestamps
+    return moment.astimezone(timezone.utc).replace(tzinfo=None) if moment.tzinfo else moment
+
+async def resolve_scope(user_id: str, filters: Optional[DocumentFilter]) -> SearchScope:
+    """Turn request filters into the document and point ids the vector search is limited to
+
+    Filenames and upload dates live in MongoDB (indexed by user), so they are
+    matched there; Qdrant then only needs its keyword index on document_id.
+    """
+    if filters is None or not any(
+        value is not None for value in (filters.document_ids, filters.filenames, filters.uploaded_after, filters.uploaded_before)
+    ):
+        return SearchScope()
+    
+    query: Dict[str, Any] = {"user_id": user_id}
+    if filters.document_ids is not None:
+        query["_id"] = {"$in": filters.document_ids}
+    if filters.filenames is not None:
+        query["$or"] = [{"filename": {"$regex": glob_to_regex(pattern), "$options": "i"}} for pattern in filters.filenames]
+    if filters.uploaded_after or filters.uploaded_before:
+        query["created_at"] = {}
+        if filters.uploaded_after:
+            query["created_at"]["$gte"] = _naive_utc(filters.uploaded_after)
+        if filters.uploaded_before:
+            query["created_at"]["$lt"] = _naive_utc(filters.uploaded_before)
+    
+    db = await get_database()
+    documents = await db.documents.find(query, projection={"_id": 1}).to_list(None)
+    document_ids = [document["_id"] for document in documents]
+    if not document_ids:
+        return SearchScope(document_ids=[])
+    references = await db[REFERENCES].find(
+        {"document_id": {"$in": document_ids}}, projection={"point_id": 1}
+    ).to_list(None)
+    return SearchScope(document_ids=document_ids, point_ids=sorted({ref["point_id"] for ref in references}))
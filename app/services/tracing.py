@@ -0,0 +1,355 @@
+import functools
+import importlib
+import inspect
+import logging
+import random
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.utils.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+TRACE_ID_HEADER = "X-Trace-Id"
+
+# W3C trace context ids; anything else from a client is replaced by a fresh id
+TRACE_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+SPAN_ID_PATTERN = re.compile(r"[0-9a-f]{16}")
+
+
+@dataclass
+class Span:
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    start_time: float
+    end_time: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        if self.end_time is None:
+            return 0.0
+        return (self.end_time - self.start_time) * 1000
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["duration_ms"] = round(self.duration_ms, 3)
+        return data
+
+
+class _NoopSpan:
+    """Stand-in yielded when tracing is disabled"""
+
+    trace_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+@dataclass
+class _Trace:
+    trace_id: str
+    sampled: bool
+    spans: List[Span] = field(default_factory=list)
+    errored: bool = False
+
+
+# Trace and span of the code currently running; copied into tasks and threads
+_current_trace: ContextVar[Optional[_Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+# Set even when tracing is disabled so logs can still be correlated by trace id
+_current_trace_id: ContextVar[Optional[str]] = ContextVar("current_trace_id", default=None)
+
+
+class SpanExporter:
+    """Receives the spans of each finished, sampled trace"""
+
+    def export(self, spans: List[Span]):
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+class NoopSpanExporter(SpanExporter):
+
+    def export(self, spans: List[Span]):
+        pass
+
+
+class InMemorySpanExporter(SpanExporter):
+    """Keeps the most recent spans in memory, for tests and local debugging"""
+
+    def __init__(self, max_spans: int = 10000):
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]):
+        with self._lock:
+            self._spans.extend(spans)
+
+    def get_finished_spans(self, trace_id: Optional[str] = None) -> List[Span]:
+        with self._lock:
+            spans = list(self._spans)
+        if trace_id is not None:
+            spans = [span for span in spans if span.trace_id == trace_id]
+        return spans
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends spans as JSON lines to a local file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]):
+        lines = "".join(dumps(span.to_dict()) + "\n" for span in spans)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+def _new_id(nbytes: int) -> str:
+    return secrets.token_hex(nbytes)
+
+
+class Tracer:
+    """
+    Minimal span tracer with pluggable exporters
+
+    Head sampling decides up front (sample_ratio) whether a trace is exported.
+    Traces that were not head-sampled are still buffered and exported at the
+    end if they were slower than tail_latency_ms or raised an error, so tail
+    latency is always visible.
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        sample_ratio: float = 1.0,
+        tail_latency_ms: float = 0.0,
+        keep_errors: bool = True
+    ):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+        self.tail_latency_ms = tail_latency_ms
+        self.keep_errors = keep_errors
+
+    @property
+    def enabled(self) -> bool:
+        return not isinstance(self.exporter, NoopSpanExporter)
+
+    @contextmanager
+    def start_trace(
+        self,
+        name: str,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        sampled: Optional[bool] = None,
+        **attributes
+    ):
+        """Open the root span of a trace (one per request or background job)"""
+
+        trace_id = trace_id or _new_id(16)
+        trace_id_token = _current_trace_id.set(trace_id)
+        if not self.enabled:
+            try:
+                yield _RootHandle(trace_id)
+            finally:
+                _current_trace_id.reset(trace_id_token)
+            return
+
+        if sampled is None:
+            sampled = random.random() < self.sample_ratio
+        trace = _Trace(trace_id=trace_id, sampled=sampled)
+        trace_token = _current_trace.set(trace)
+        try:
+            with self._span(trace, name, parent_id, attributes) as root:
+                yield root
+        finally:
+            _current_trace.reset(trace_token)
+            _current_trace_id.reset(trace_id_token)
+            self._finish_trace(trace, root)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Open a child span of the current trace; no-op outside a trace"""
+
+        trace = _current_trace.get()
+        if trace is None:
+            yield NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        with self._span(trace, name, parent.span_id if parent else None, attributes) as span:
+            yield span
+
+    @contextmanager
+    def _span(self, trace: _Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        span = Span(
+            trace_id=trace.trace_id,
+            span_id=_new_id(8),
+            parent_id=parent_id,
+            name=name,
+            start_time=time.time(),
+            attributes=dict(attributes)
+        )
+        span_token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.error = f"{type(e).__name__}: {e}"
+            trace.errored = True
+            raise
+        finally:
+            span.end_time = time.time()
+            _current_span.reset(span_token)
+            trace.spans.append(span)
+
+    def _finish_trace(self, trace: _Trace, root: Span):
+        keep = trace.sampled
+        if not keep and self.keep_errors and trace.errored:
+            keep = True
+        if not keep and self.tail_latency_ms > 0 and root.duration_ms >= self.tail_latency_ms:
+            keep = True
+        if not keep:
+            return
+        try:
+            self.exporter.export(trace.spans)
+        except Exception as e:
+            logger.warning("Error exporting spans: %s", e)
+
+
+class _RootHandle(_NoopSpan):
+    """Root handle when tracing is disabled; still carries the trace id"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+
+
+def traced(name: Optional[str] = None, **attributes):
+    """Decorator wrapping a sync or async function in a span"""
+
+    def decorator(func: Callable):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(span_name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def current_trace_id() -> Optional[str]:
+    return _current_trace_id.get()
+
+
+def parse_traceparent(header: Optional[str]):
+    """Parse a W3C traceparent header into (trace_id, parent_id, sampled)"""
+    if not header:
+        return None, None, None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or not TRACE_ID_PATTERN.fullmatch(parts[1]) or not SPAN_ID_PATTERN.fullmatch(parts[2]):
+        return None, None, None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None, None, None
+    return parts[1], parts[2], sampled
+
+
+def create_exporter(name: str) -> SpanExporter:
+    """Build the exporter named in settings ("none", "memory", "file" or "module:Class")"""
+    if name in ("", "none"):
+        return NoopSpanExporter()
+    if name == "memory":
+        return InMemorySpanExporter()
+    if name == "file":
+        return FileSpanExporter(settings.tracing_file_path)
+    module_name, _, class_name = name.partition(":")
+    exporter_class = getattr(importlib.import_module(module_name), class_name)
+    return exporter_class()
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a root span per request and returning its trace id"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        trace_id, parent_id, sampled = parse_traceparent(
+            headers.get(b"traceparent", b"").decode("latin-1")
+        )
+        if trace_id is None:
+            trace_id = headers.get(TRACE_ID_HEADER.lower().encode(), b"").decode("latin-1").lower()
+            if not TRACE_ID_PATTERN.fullmatch(trace_id):
+                trace_id = None
+
+        with tracer.start_trace(
+            f"{scope['method']} {scope['path']}",
+            trace_id=trace_id,
+            parent_id=parent_id,
+            # An upstream decision stands either way; without a traceparent, sample_ratio decides
+            sampled=sampled
+        ) as root:
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (TRACE_ID_HEADER.lower().encode(), root.trace_id.encode())
+                    ]
+                    root.set_attribute("http.status_code", message["status"])
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+            route = scope.get("route")
+            if route is not None and isinstance(root, Span):
+                root.name = f"{scope['method']} {route.path}"
+
+
+tracer = Tracer(
+    exporter=create_exporter(settings.tracing_exporter),
+    sample_ratio=settings.tracing_sample_ratio,
+    tail_latency_ms=settings.tracing_tail_latency_ms,
+    keep_errors=settings.tracing_keep_errors
+)
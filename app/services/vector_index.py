@@ -0,0 +1,391 @@
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.database.mongodb import get_database
+from app.database.qdrant_client import (
+    qdrant_db, chunk_hash, chunk_point_id, collection_exists, create_collection, delete_points,
+    get_alias_target, scroll_document_points, scroll_points, store_embeddings_batch, swap_alias
+)
+from app.services.deduplication import FINGERPRINTS, chunk_deduplicator
+from app.services.embedding_service import embedding_service
+from app.services.scheduler import Priority, TokenBucket, estimate_tokens
+from app.utils.file_parser import text_chunker
+
+logger = logging.getLogger(__name__)
+
+# Registry of versioned Qdrant collections, keyed by collection name
+REGISTRY = "vector_indexes"
+
+BUILDING = "building"
+ACTIVE = "active"
+RETIRED = "retired"
+DROPPED = "dropped"
+
+# Updates are stamped by the app hosts' clocks; those this close to the last sync are synced again
+SYNC_OVERLAP = timedelta(minutes=1)
+
+DOCUMENT_FIELDS = {"user_id": 1, "filename": 1, "original_text": 1, "created_at": 1}
+
+@dataclass
+class IndexSpec:
+    """Embedding model and vector layout of one Qdrant collection"""
+    collection: str
+    model: str
+    dimensions: int
+    index_dimensions: int = 0
+
+    @classmethod
+    def from_settings(cls, collection: str) -> "IndexSpec":
+        return cls(
+            collection=collection,
+            model=settings.embedding_model_name,
+            dimensions=settings.embedding_dimensions,
+            index_dimensions=settings.embedding_index_dimensions
+        )
+
+    @classmethod
+    def from_document(cls, doc: Dict[str, Any]) -> "IndexSpec":
+        return cls(
+            collection=doc["_id"],
+            model=doc["model"],
+            dimensions=doc["dimensions"],
+            index_dimensions=doc.get("index_dimensions", 0)
+        )
+
+async def _registry():
+    db = await get_database()
+    return db[REGISTRY]
+
+async def register_index(spec: IndexSpec, status: str):
+    """Record a collection in the registry (existing entries keep their progress)"""
+    registry = await _registry()
+    await registry.update_one(
+        {"_id": spec.collection},
+        {
+            "$set": {"status": status},
+            "$setOnInsert": {
+                "alias": settings.qdrant_collection_name,
+                "model": spec.model,
+                "dimensions": spec.dimensions,
+                "index_dimensions": spec.index_dimensions,
+                "documents_indexed": 0,
+                "chunks_indexed": 0,
+                "created_at": datetime.utcnow()
+            }
+        },
+        upsert=True
+    )
+
+async def get_index(collection: str) -> Optional[Dict[str, Any]]:
+    registry = await _registry()
+    return await registry.find_one({"_id": collection})
+
+async def list_indexes() -> List[Dict[str, Any]]:
+    registry = await _registry()
+    return await registry.find({}, sort=[("created_at", 1)]).to_list(None)
+
+def next_collection_name(alias: str) -> str:
+    """Next free `{alias}_vN` collection name"""
+    pattern = re.compile(rf"^{re.escape(alias)}_v(\d+)$")
+    versions = [
+        int(match.group(1))
+        for col in qdrant_db.client.get_collections().collections
+        if (match := pattern.match(col.name))
+    ]
+    return f"{alias}_v{max(versions, default=0) + 1}"
+
+def _bootstrap_collection(spec: IndexSpec, alias: str):
+    if not collection_exists(spec.collection):
+        try:
+            create_collection(spec.collection, spec.dimensions, spec.index_dimensions)
+        except Exception:
+            # Another worker created it first
+            if not collection_exists(spec.collection):
+                raise
+    if get_alias_target(alias) is None:
+        swap_alias(alias, spec.collection)
+
+async def resolve_active_index() -> IndexSpec:
+    """Collection behind the configured alias and the model its vectors were built with
+
+    Fresh deployments get a `{alias}_v1` collection behind the alias so that
+    later migrations can swap it. Deployments from before aliases keep using
+    their collection (named like the alias) with the configured model.
+    """
+    alias = settings.qdrant_collection_name
+    target = await asyncio.to_thread(get_alias_target, alias)
+    if target is None:
+        if await asyncio.to_thread(collection_exists, alias):
+            return IndexSpec.from_settings(alias)
+        spec = IndexSpec.from_settings(f"{alias}_v1")
+        await asyncio.to_thread(_bootstrap_collection, spec, alias)
+        await register_index(spec, ACTIVE)
+        logger.info("Created versioned collection behind alias", extra={"collection": spec.collection, "alias": alias})
+        return spec
+
+    doc = await get_index(target)
+    return IndexSpec.from_document(doc) if doc else IndexSpec.from_settings(target)
+
+def activate(spec: IndexSpec):
+    """Serve queries and uploads from `spec`; collection and query model switch together"""
+    if spec.collection != qdrant_db.collection_name:
+        logger.info("Active vector index changed", extra={"collection": spec.collection, "model": spec.model})
+    qdrant_db.collection_name = spec.collection
+    embedding_service.use_model(spec.model, spec.dimensions)
+
+async def refresh_active_index() -> IndexSpec:
+    spec = await resolve_active_index()
+    activate(spec)
+    return spec
+
+async def run_index_refresher(interval: float):
+    """Follow alias swaps made by the re-indexing tool (possibly from another process)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_active_index()
+        except Exception as e:
+            logger.warning("Failed to refresh active vector index: %s", e)
+
+class Reindexer:
+    """
+    Re-embeds every stored document into a new collection
+
+    Documents are scanned in (created_at, _id) order and the position of the
+    last fully indexed document is checkpointed in the registry, so an
+    interrupted run resumes where it stopped. Point ids are derived from the
+    document id and chunk content, which makes re-processing a document after
+    a crash idempotent. Documents updated or deleted after the migration
+    started are re-synced by `sync`, which the tool runs before swapping the
+    alias and again after workers follow the swap. Embedding calls are paced
+    by their own token budget so that a migration only uses part of the
+    provider quota the app relies on.
+    """
+
+    def __init__(self, spec: IndexSpec, tokens_per_minute: int, batch_documents: int = 20):
+        self.spec = spec
+        self.alias = settings.qdrant_collection_name
+        self.budget = TokenBucket(tokens_per_minute)
+        self.batch_documents = max(1, batch_documents)
+
+    async def prepare(self):
+        """Create the target collection and its registry entry"""
+        if self.spec.collection == self.alias:
+            raise ValueError(f"Target collection cannot be named like the alias '{self.alias}'")
+        doc = await get_index(self.spec.collection)
+        if doc and doc["status"] == ACTIVE:
+            raise ValueError(f"'{self.spec.collection}' is the active index")
+        if doc and (doc["model"], doc["dimensions"]) != (self.spec.model, self.spec.dimensions):
+            raise ValueError(
+                f"'{self.spec.collection}' was started for {doc['model']} ({doc['dimensions']} dimensions)"
+            )
+        if not await asyncio.to_thread(collection_exists, self.spec.collection):
+            await asyncio.to_thread(
+                create_collection, self.spec.collection, self.spec.dimensions, self.spec.index_dimensions
+            )
+        await register_index(self.spec, BUILDING)
+
+    async def run(self) -> int:
+        """Index documents after the checkpoint; returns the number indexed"""
+        db = await get_database()
+        registry = await _registry()
+        indexed = 0
+
+        while True:
+            doc = await get_index(self.spec.collection)
+            documents = await db.documents.find(
+                self._after(doc.get("checkpoint")),
+                projection=DOCUMENT_FIELDS,
+                sort=[("created_at", 1), ("_id", 1)]
+            ).limit(self.batch_documents).to_list(None)
+            if not documents:
+                break
+
+            for document in documents:
+                chunks = len(await self._index_document(document))
+                indexed += 1
+                await registry.update_one(
+                    {"_id": self.spec.collection},
+                    {
+                        "$set": {
+                            "checkpoint": {"created_at": document["created_at"], "document_id": document["_id"]},
+                            "updated_at": datetime.utcnow()
+                        },
+                        "$inc": {"documents_indexed": 1, "chunks_indexed": chunks}
+                    }
+                )
+
+        logger.info("Re-indexing pass finished", extra={"collection": self.spec.collection, "documents": indexed})
+        return indexed
+
+    @staticmethod
+    def _after(checkpoint: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if not checkpoint:
+            return {}
+        return {"$or": [
+            {"created_at": {"$gt": checkpoint["created_at"]}},
+            {"created_at": checkpoint["created_at"], "_id": {"$gt": checkpoint["document_id"]}}
+        ]}
+
+    async def sync(self) -> int:
+        """Re-index documents updated since the last sync (or the start of the migration)
+        and remove points of deleted ones; returns the number of documents re-indexed"""
+        db = await get_database()
+        registry = await _registry()
+        doc = await get_index(self.spec.collection)
+        since = (doc.get("synced_at") or doc["created_at"]) - SYNC_OVERLAP
+        started = datetime.utcnow()
+
+        documents = await db.documents.find({"updated_at": {"$gte": since}}, projection=DOCUMENT_FIELDS).to_list(None)
+        updated = [document["_id"] for document in documents]
+        stale = [
+            str(point.id) for point in await asyncio.to_thread(
+                scroll_document_points, updated, None, self.spec.collection
+            )
+        ] if updated else []
+        stale += await self._deleted_document_points()
+
+        # Points whose owner changed or was deleted may have been handed over to a
+        # document that references them; re-indexing the heir rewrites them in its name
+        heirs = {
+            fp["document_id"] for fp in await db[FINGERPRINTS].find(
+                {"_id": {"$in": stale}}, projection={"document_id": 1}
+            ).to_list(None)
+        } - set(updated)
+        if heirs:
+            documents += await db.documents.find({"_id": {"$in": list(heirs)}}, projection=DOCUMENT_FIELDS).to_list(None)
+
+        kept = set()
+        for document in documents:
+            kept.update(await self._index_document(document))
+        removed = [point_id for point_id in stale if point_id not in kept]
+        await asyncio.to_thread(delete_points, removed, self.spec.collection)
+
+        await registry.update_one({"_id": self.spec.collection}, {"$set": {"synced_at": started}})
+        logger.info(
+            "Re-indexing sync finished",
+            extra={"collection": self.spec.collection, "documents": len(documents), "points_removed": len(removed)}
+        )
+        return len(documents)
+
+    async def _deleted_document_points(self) -> List[str]:
+        """Points in the new collection whose document no longer exists"""
+        db = await get_database()
+        stale, offset = [], None
+        while True:
+            points, offset = await asyncio.to_thread(
+                scroll_points, offset, 1000, ["document_id"], self.spec.collection
+            )
+            document_ids = {(point.payload or {}).get("document_id") for point in points}
+            known = {
+                doc["_id"] for doc in await db.documents.find(
+                    {"_id": {"$in": list(document_ids)}}, projection={"_id": 1}
+                ).to_list(None)
+            }
+            stale += [str(point.id) for point in points if (point.payload or {}).get("document_id") not in known]
+            if offset is None:
+                return stale
+
+    async def _index_document(self, document: Dict[str, Any]) -> List[str]:
+        """Embed and store a document's own chunks; returns their point ids"""
+        chunks = text_chunker.chunk_text(document.get("original_text") or "")
+        # Chunks stored as references to another document's point have no vector of their own
+        referenced = {ref["chunk_index"] for ref in await chunk_deduplicator.references_of(document["_id"])}
+        chunks = [chunk for chunk in chunks if chunk["chunk_index"] not in referenced]
+        owned = await chunk_deduplicator.owned_points(document["_id"])
+        created_at = document["created_at"].isoformat()
+        batch_size = max(1, settings.embedding_batch_size)
+        point_ids = []
+
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            texts = [chunk["text"] for chunk in batch]
+            embeddings = await self._embed(texts)
+            metadatas = [
+                {
+                    "user_id": document["user_id"],
+                    "document_id": document["_id"],
+                    "filename": document.get("filename"),
+                    **text_chunker.position(chunk),
+                    "created_at": created_at
+                }
+                for chunk in batch
+            ]
+            batch_ids = [owned.get(chunk_hash(text)) or chunk_point_id(document["_id"], chunk_hash(text)) for text in texts]
+            await asyncio.to_thread(
+                store_embeddings_batch,
+                embeddings,
+                texts,
+                metadatas,
+                point_ids=batch_ids,
+                collection_name=self.spec.collection
+            )
+            point_ids += batch_ids
+        return point_ids
+
+    async def _embed(self, texts: List[str]):
+        cost = estimate_tokens(*texts)
+        while (delay := self.budget.delay(cost)) > 0:
+            await asyncio.sleep(delay)
+        self.budget.consume(cost)
+
+        embeddings = await embedding_service.generate_embeddings_batch(
+            texts, priority=Priority.BACKGROUND, model=self.spec.model
+        )
+        if embeddings.shape[1] != self.spec.dimensions:
+            raise ValueError(
+                f"{self.spec.model} returned {embeddings.shape[1]} dimensions, expected {self.spec.dimensions}"
+            )
+        return embeddings
+
+    async def swap(self, replace_collection: bool = False) -> Optional[str]:
+        """Point the alias at the new collection; returns the previous target
+
+        The alias changes in one Qdrant operation, but workers only follow it
+        at their next refresh, so for up to `vector_index_refresh_seconds`
+        they serve (and write to) different collections.
+        """
+        previous = await asyncio.to_thread(get_alias_target, self.alias)
+        await asyncio.to_thread(swap_alias, self.alias, self.spec.collection, replace_collection)
+
+        registry = await _registry()
+        now = datetime.utcnow()
+        await registry.update_one(
+            {"_id": self.spec.collection},
+            {"$set": {"status": ACTIVE, "activated_at": now}}
+        )
+        if previous and previous != self.spec.collection:
+            await registry.update_one(
+                {"_id": previous},
+                {"$set": {"status": RETIRED, "retired_at": now}}
+            )
+        logger.info(
+            "Alias swapped",
+            extra={"alias": self.alias, "collection": self.spec.collection, "previous": previous}
+        )
+        return previous
+
+    async def catch_up(self, wait: Optional[float] = None) -> int:
+        """Index documents uploaded, updated or deleted while workers were still writing to the previous collection
+
+        Workers poll the alias, so this waits `wait` seconds (by default one
+        refresh interval plus a margin) for all of them to switch first.
+        """
+        await asyncio.sleep(settings.vector_index_refresh_seconds + 5 if wait is None else wait)
+        return await self.run() + await self.sync()
+
+async def drop_index(collection: str):
+    """Delete a retired collection"""
+    doc = await get_index(collection)
+    if await asyncio.to_thread(get_alias_target, settings.qdrant_collection_name) == collection:
+        raise ValueError(f"'{collection}' is still behind the alias")
+    await asyncio.to_thread(qdrant_db.client.delete_collection, collection)
+    qdrant_db.layouts.pop(collection, None)
+    if doc:
+        registry = await _registry()
+        await registry.update_one({"_id": collection}, {"$set": {"status": DROPPED, "dropped_at": datetime.utcnow()}})
@@ -0,0 +1,41 @@
+"""
+Create the MongoDB indexes and drop the obsolete ones
+
+Workers create missing indexes at start-up, concurrently and idempotently.
+One-off migrations such as dropping indexes an earlier version created run
+here instead, once per deploy: start.sh runs this before starting the
+workers.
+
+Usage:
+    python -m app.tools.indexes
+"""
+
+import argparse
+import asyncio
+from typing import List
+
+from app.database.mongodb import connect_to_mongo, close_mongo_connection, drop_obsolete_indexes
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    return parser.parse_args(argv)
+
+
+async def main_async(args: argparse.Namespace) -> List[str]:
+    # Connecting creates the current indexes
+    await connect_to_mongo()
+    try:
+        return await drop_obsolete_indexes()
+    finally:
+        await close_mongo_connection()
+
+
+def main(argv=None) -> List[str]:
+    dropped = asyncio.run(main_async(parse_args(argv)))
+    print(f"Dropped obsolete indexes: {', '.join(dropped)}" if dropped else "No obsolete indexes")
+    return dropped
+
+
+if __name__ == "__main__":
+    main()
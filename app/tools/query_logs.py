@@ -0,0 +1,81 @@
+"""
+Archive, search and re-import query logs
+
+The app archives whole days older than QUERY_LOG_ARCHIVE_AFTER_DAYS every
+hour; `archive` runs the same job now. Archives are JSONL files in
+QUERY_LOG_ARCHIVE_DIR, one per day, compressed with zstd (gzip when
+zstandard is not installed). Restored logs older than
+QUERY_LOG_RETENTION_DAYS are removed again by the TTL index.
+
+Usage:
+    python -m app.tools.query_logs archive [--older-than-days 7]
+    python -m app.tools.query_logs search --user-id <id> --since 2026-01-01 --until 2026-02-01
+    python -m app.tools.query_logs restore --since 2026-01-01 --until 2026-01-02
+"""
+
+import argparse
+import asyncio
+import itertools
+from datetime import datetime
+
+from bson import json_util
+
+from app.config import settings
+from app.database.mongodb import connect_to_mongo, close_mongo_connection
+from app.services.log_archive import LogArchiver, restore_logs, search_archives
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=settings.query_log_archive_dir, help="Archive directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    archive = commands.add_parser("archive", help="Move old days of logs to archive files")
+    archive.add_argument(
+        "--older-than-days", type=int, default=settings.query_log_archive_after_days or None,
+        # Archiving is off by default; then the age must be given explicitly
+        required=not settings.query_log_archive_after_days
+    )
+
+    for name, help_text in (("search", "Print matching archived logs as JSON lines"),
+                            ("restore", "Re-import matching archived logs into MongoDB")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--user-id")
+        command.add_argument("--since", type=datetime.fromisoformat, help="UTC, inclusive")
+        command.add_argument("--until", type=datetime.fromisoformat, help="UTC, exclusive")
+        if name == "search":
+            command.add_argument("--limit", type=int, help="Stop after this many logs")
+    return parser.parse_args(argv)
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    await connect_to_mongo()
+    try:
+        if args.command == "archive":
+            report = await LogArchiver(args.dir, args.older_than_days).run()
+            print(f"Archived {report.logs} logs from {report.days} days")
+            for path in report.files:
+                print(f"  {path}")
+            return report.logs
+        restored = await restore_logs(search_archives(args.dir, args.user_id, args.since, args.until))
+        print(f"Restored {restored} logs")
+        return restored
+    finally:
+        await close_mongo_connection()
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.command == "search":
+        # Reads files only, no database connection needed
+        logs = search_archives(args.dir, args.user_id, args.since, args.until)
+        count = 0
+        for log in itertools.islice(logs, args.limit):
+            print(json_util.dumps(log))
+            count += 1
+        return count
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Reconcile the vector index with MongoDB
+
+Scrolls the active Qdrant collection, deletes points whose document no
+longer exists, drops references and fingerprints of missing points and
+corrects chunks_count where chunks never made it into the index. The app
+runs the same job every RECONCILE_INTERVAL_SECONDS on one worker.
+
+Usage:
+    python -m app.tools.reconcile --dry-run        # report drift only
+    python -m app.tools.reconcile --output reconcile.json
+"""
+
+import argparse
+import asyncio
+import json
+from dataclasses import asdict
+
+from app.database.mongodb import connect_to_mongo, close_mongo_connection
+from app.database.qdrant_client import connect_to_qdrant, close_qdrant_connection
+from app.services.reconciler import ReconcileReport, Reconciler
+from app.services.vector_index import refresh_active_index
+
+
+def print_report(report: ReconcileReport):
+    mode = " (dry run, nothing changed)" if report.dry_run else ""
+    print(f"Reconciled {report.collection} in {report.duration_seconds:.1f}s{mode}")
+    print(f"  points scanned        {report.points_scanned}")
+    print(f"  orphan points         {report.orphan_points} from {report.orphan_documents} deleted documents")
+    print(f"    deleted             {report.points_deleted}")
+    print(f"    handed over         {report.points_handed_over}")
+    print(f"  documents checked     {report.documents_checked}")
+    print(f"  extra points          {report.extra_points} in {report.documents_with_extra_points} documents")
+    print(f"  missing chunks        {report.chunks_missing} in {report.documents_missing_chunks} documents")
+    print(f"  chunk counts fixed    {report.counts_fixed}")
+    print(f"  dangling references   {report.dangling_references}")
+    print(f"  stale fingerprints    {report.stale_fingerprints}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Report drift without changing anything")
+    parser.add_argument("--page-size", type=int, default=1000, help="Points and documents checked per query")
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    return parser.parse_args(argv)
+
+
+async def main_async(args: argparse.Namespace) -> ReconcileReport:
+    await connect_to_mongo()
+    connect_to_qdrant()
+    try:
+        await refresh_active_index()
+        return await Reconciler(page_size=args.page_size, dry_run=args.dry_run).run()
+    finally:
+        await close_mongo_connection()
+        close_qdrant_connection()
+
+
+def main(argv=None) -> ReconcileReport:
+    args = parse_args(argv)
+    report = asyncio.run(main_async(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(asdict(report), f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
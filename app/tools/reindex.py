@@ -0,0 +1,134 @@
+"""
+Re-index all documents for a new embedding model and swap the collection alias
+
+Re-embeds the stored text of every document into a new versioned Qdrant
+collection (documents_v2, documents_v3, ...) while the app keeps serving
+from the current one. Progress is checkpointed in the vector_indexes
+MongoDB collection: re-running the same command resumes an interrupted
+migration. Documents updated or deleted while the migration ran are
+re-synced, then the alias is switched in one Qdrant alias update.
+
+The switch is not atomic for the app: workers poll the alias every
+VECTOR_INDEX_REFRESH_SECONDS and change the collection and the query model
+together (they cannot query through the alias itself, since the model has
+to change with it). Until every worker has refreshed, different workers
+answer from different collections, and uploads, updates and deletions
+made on lagging workers land in the previous collection. After
+--catch-up-wait seconds (the refresh interval plus 5s by default, which
+assumes workers run with the same setting) a final pass indexes those
+changes. Changes from a worker lagging longer than that, e.g. a stalled
+process, are missed; the reconciler reports them as missing chunks.
+
+Embedding calls are paced to --tokens-per-minute (a quarter of
+EMBEDDING_TOKENS_PER_MINUTE by default) so the app keeps most of the
+provider quota while the migration runs.
+
+Usage:
+    python -m app.tools.reindex --model text-embedding-3-large --dimensions 3072
+    python -m app.tools.reindex --collection documents_v2 --model text-embedding-3-large \\
+        --dimensions 3072                                    # resume
+    python -m app.tools.reindex --swap-only --collection documents_v1   # roll back
+    python -m app.tools.reindex --status
+"""
+
+import argparse
+import asyncio
+from typing import Optional
+
+from app.config import settings
+from app.database.mongodb import connect_to_mongo, close_mongo_connection
+from app.database.qdrant_client import connect_to_qdrant, close_qdrant_connection, get_alias_target
+from app.services.vector_index import (
+    IndexSpec, Reindexer, drop_index, get_index, list_indexes, next_collection_name
+)
+
+
+async def print_status():
+    target = await asyncio.to_thread(get_alias_target, settings.qdrant_collection_name)
+    print(f"Alias {settings.qdrant_collection_name} -> {target or '(not an alias)'}")
+    for doc in await list_indexes():
+        checkpoint = doc.get("checkpoint") or {}
+        print(
+            f"  {doc['_id']:<24} {doc['status']:<9} {doc['model']} ({doc['dimensions']}d"
+            f"{', index ' + str(doc['index_dimensions']) + 'd' if doc.get('index_dimensions') else ''})"
+            f"  documents={doc.get('documents_indexed', 0)} chunks={doc.get('chunks_indexed', 0)}"
+            f"  checkpoint={checkpoint.get('created_at', '-')}"
+        )
+
+
+async def reindex(args: argparse.Namespace) -> Optional[str]:
+    collection = args.collection or await asyncio.to_thread(next_collection_name, settings.qdrant_collection_name)
+    existing = await get_index(collection)
+    if args.swap_only:
+        if not existing:
+            raise SystemExit(f"Unknown index {collection}; see --status")
+        spec = IndexSpec.from_document(existing)
+    else:
+        spec = IndexSpec(collection, args.model, args.dimensions, args.index_dimensions)
+
+    reindexer = Reindexer(spec, args.tokens_per_minute, args.batch_documents)
+    if not args.swap_only:
+        await reindexer.prepare()
+        print(f"Indexing into {collection} with {spec.model} ({spec.dimensions} dimensions)")
+        indexed = await reindexer.run()
+        print(f"Indexed {indexed} documents")
+        print(f"Re-synced {await reindexer.sync()} documents updated during the migration")
+        if args.no_swap:
+            return None
+
+    previous = await reindexer.swap(replace_collection=args.replace_legacy_collection)
+    print(f"Alias {settings.qdrant_collection_name} now points at {collection} (was {previous or 'a collection'})")
+
+    if not args.swap_only:
+        print(f"Waiting {args.catch_up_wait:.0f}s for workers to follow the alias, then catching up")
+        print(f"Caught up {await reindexer.catch_up(args.catch_up_wait)} documents")
+
+    if args.drop_old and previous and previous != collection:
+        await drop_index(previous)
+        print(f"Dropped {previous}")
+    return previous
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=settings.embedding_model_name, help="Embedding model of the new index")
+    parser.add_argument("--dimensions", type=int, default=settings.embedding_dimensions)
+    parser.add_argument("--index-dimensions", type=int, default=settings.embedding_index_dimensions,
+                        help="Indexed prefix for two-stage search (0 indexes full vectors)")
+    parser.add_argument("--collection", help="Target collection (default: next {alias}_vN)")
+    parser.add_argument("--batch-documents", type=int, default=20, help="Documents read from MongoDB per query")
+    parser.add_argument("--tokens-per-minute", type=int, default=max(1, settings.embedding_tokens_per_minute // 4),
+                        help="Embedding token budget for the migration")
+    parser.add_argument("--no-swap", action="store_true", help="Build or resume the index without switching to it")
+    parser.add_argument("--swap-only", action="store_true",
+                        help="Point the alias at an existing index (e.g. to roll back) without indexing")
+    parser.add_argument("--replace-legacy-collection", action="store_true",
+                        help="Drop a pre-alias collection named like the alias so the alias can be created. "
+                             "Searches fail until workers follow the swap.")
+    parser.add_argument("--catch-up-wait", type=float, default=settings.vector_index_refresh_seconds + 5,
+                        help="Seconds to wait after the swap before the catch-up pass; must exceed the workers' "
+                             "VECTOR_INDEX_REFRESH_SECONDS, during which they serve different collections")
+    parser.add_argument("--drop-old", action="store_true", help="Delete the previous collection after the swap")
+    parser.add_argument("--status", action="store_true", help="Show the alias and registered indexes")
+    return parser.parse_args(argv)
+
+
+async def main_async(args: argparse.Namespace):
+    await connect_to_mongo()
+    connect_to_qdrant()
+    try:
+        if args.status:
+            await print_status()
+        else:
+            await reindex(args)
+    finally:
+        await close_mongo_connection()
+        close_qdrant_connection()
+
+
+def main(argv=None):
+    asyncio.run(main_async(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
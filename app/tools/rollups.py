@@ -0,0 +1,53 @@
+"""
+Rebuild the query analytics rollups from the query logs
+
+Rollups are maintained as questions are logged; run this after importing
+logs, restoring a backup or changing the latency histogram. Rollups of the
+rebuilt range are overwritten, the query logs are read in timestamp order.
+
+Usage:
+    python -m app.tools.rollups                       # all logs
+    python -m app.tools.rollups --since 2026-10-01    # from a date (UTC)
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+
+from app.database.mongodb import connect_to_mongo, close_mongo_connection, get_database
+from app.services.analytics import analytics_service, bucket_start
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Rebuild from this UTC date/time")
+    return parser.parse_args(argv)
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    await connect_to_mongo()
+    try:
+        db = await get_database()
+        query = {}
+        if args.since:
+            # Start on a day boundary so no daily rollup is rebuilt from part of its logs
+            query["timestamp"] = {"$gte": bucket_start(args.since, "day")}
+        cursor = db.query_logs.find(
+            query,
+            projection={"user_id": 1, "response_time_ms": 1, "retrieved_chunks_count": 1,
+                        "timed_out": 1, "cache_hit": 1, "timestamp": 1},
+            sort=[("timestamp", 1)]
+        )
+        return await analytics_service.rebuild(cursor)
+    finally:
+        await close_mongo_connection()
+
+
+def main(argv=None) -> int:
+    written = asyncio.run(main_async(parse_args(argv)))
+    print(f"Rebuilt {written} rollups")
+    return written
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Optional
+
+from fastapi import Request
+
+# Deadline of the request being served, visible to every stage it awaits
+current_deadline: ContextVar[Optional["Deadline"]] = ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage cannot finish within the request deadline"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        super().__init__(f"Deadline exceeded during {stage}")
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client goes away before the response is ready"""
+
+
+class Deadline:
+    """Absolute time budget for one request"""
+
+    def __init__(self, timeout_seconds: float):
+        self.timeout_seconds = timeout_seconds
+        self.expires_at = time.monotonic() + timeout_seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    async def run(
+        self,
+        awaitable: Awaitable[Any],
+        stage: str,
+        stage_timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Await a stage, bounded by the remaining budget and its own timeout
+
+        The awaitable is cancelled on timeout so abandoned provider calls
+        release their scheduler slot and connection.
+        """
+        timeout = self.remaining()
+        if stage_timeout is not None:
+            timeout = min(timeout, stage_timeout)
+
+        if timeout <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceeded(stage)
+
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(stage)
+
+
+async def cancel_on_disconnect(
+    request: Request,
+    awaitable: Awaitable[Any],
+    poll_interval: float = 0.25
+) -> Any:
+    """Run `awaitable`, cancelling it if the client disconnects first"""
+
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
@@ -1,4 +1,3 @@
-import PyPDF2
 from typing import List, Dict, Any
 import io
 from fastapi import UploadFile
@@ -32,6 +31,8 @@ class FileParser:
     @staticmethod
     async def _extract_from_pdf(file: UploadFile) -> str:
         """Extract text from PDF file"""
+        import PyPDF2
+        
         content = await file.read()
         pdf_file = io.BytesIO(content)
         
@@ -124,6 +125,11 @@ class TextChunker:
                 break
         
         return chunks
+    
+    @staticmethod
+    def position(chunk: Dict[str, Any]) -> Dict[str, int]:
+        """Where a chunk sits in its document: index and character range"""
+        return {"chunk_index": chunk["chunk_index"], "start_char": chunk["start_char"], "end_char": chunk["end_char"]}
 
 # Singleton instances
 file_parser = FileParser()
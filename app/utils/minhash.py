@@ -0,0 +1,66 @@
+import hashlib
+import re
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+NUM_PERMUTATIONS = 128
+# 16 bands of 8 rows: pairs at 0.9 similarity share a band with >99.9% probability,
+# at 0.8 with ~95%, at 0.5 with ~6%
+BANDS = 16
+SHINGLE_WORDS = 5
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(1234567)
+_A = _rng.integers(1, _PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+
+_WORD = re.compile(r"\w+")
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    words = _WORD.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little") % _PRIME for s in shingles],
+        dtype=np.uint64
+    )
+
+
+def signature(text: str) -> List[int]:
+    """MinHash signature of the word shingles of `text`"""
+    shingles = _shingle_hashes(text)
+    # a*x + b stays below 2**62 for 31-bit inputs, so uint64 never overflows
+    hashes = (np.outer(shingles, _A) + _B) % _PRIME
+    return hashes.min(axis=0).tolist()
+
+
+def band_keys(sig: Sequence[int]) -> List[str]:
+    """LSH bucket keys; similar signatures share at least one key with high probability"""
+    rows = len(sig) // BANDS
+    return [
+        f"{band}:" + hashlib.blake2b(
+            np.asarray(sig[band * rows:(band + 1) * rows], dtype=np.uint64).tobytes(), digest_size=8
+        ).hexdigest()
+        for band in range(BANDS)
+    ]
+
+
+def similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+    return float(np.mean(np.asarray(a) == np.asarray(b)))
+
+
+def collapse_duplicates(chunks: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    """Drop chunks that repeat (or nearly repeat) an earlier, higher-ranked one"""
+    kept, signatures = [], []
+    for chunk in chunks:
+        sig = signature(chunk["text"])
+        if any(similarity(sig, other) >= threshold for other in signatures):
+            continue
+        kept.append(chunk)
+        signatures.append(sig)
+    return kept
@@ -0,0 +1,28 @@
+import json
+from typing import Any
+
+import orjson
+from fastapi.responses import Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+def dumps(obj: Any) -> str:
+    """Serialize to a JSON string with orjson; anything it rejects (e.g. >64-bit ints) goes through json"""
+    try:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    except TypeError:
+        return json.dumps(obj, default=str)
+
+class ModelResponse(Response):
+    """
+    JSON response rendered by pydantic-core straight from a response model
+
+    Returning the model itself makes FastAPI dump it to a dict, validate that
+    against `response_model` again and then encode it; for models the
+    endpoint has just built that is all redundant work.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: BaseModel) -> bytes:
+        return to_json(content)
@@ -0,0 +1,56 @@
+import gzip
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.utils.compression import brotli, negotiate_encoding
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison (RFC 9110): W/ prefixes and encoding suffixes are ignored"""
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip().removeprefix("W/").strip('"')
+        if candidate.split("-")[0] == etag:
+            return True
+    return False
+
+@dataclass
+class StaticAsset:
+    """
+    A response body prepared once: content hash for ETags and precompressed variants
+
+    Serving it is a dict lookup, so pages hit by browsers, bots and uptime
+    checkers cost no rendering or compression on the request path.
+    """
+
+    body: bytes
+    media_type: str
+    etag: str
+    # Content-Encoding -> compressed body, at maximum compression since it is done once
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, body: bytes, media_type: str) -> "StaticAsset":
+        asset = cls(body=body, media_type=media_type, etag=hashlib.sha256(body).hexdigest()[:20])
+        if brotli is not None:
+            asset.encoded["br"] = brotli.compress(body, quality=11)
+        asset.encoded["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+        return asset
+
+    def response(self, request: Request, cache_control: str) -> Response:
+        """200 with the best variant the client accepts, or 304 if its cached copy is current"""
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), list(self.encoded))
+        # Each encoding is its own representation, so it gets its own strong ETag
+        etag = f'"{self.etag}-{encoding}"' if encoding else f'"{self.etag}"'
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, self.etag):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return Response(self.encoded[encoding], media_type=self.media_type, headers=headers)
+        return Response(self.body, media_type=self.media_type, headers=headers)
@@ -0,0 +1,39 @@
+import base64
+from typing import List, Sequence, Union
+
+import numpy as np
+
+# A single embedding (1-D) or a batch of embeddings (2-D), always float32
+Vector = np.ndarray
+VectorLike = Union[np.ndarray, Sequence[float], Sequence[Sequence[float]]]
+
+
+def decode_embedding(data: Union[str, Sequence[float]]) -> Vector:
+    """Decode a provider embedding (base64 float32 or JSON list) without boxing floats"""
+    if isinstance(data, str):
+        # frombuffer wraps the decoded bytes without copying them again
+        return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+    return np.asarray(data, dtype=np.float32)
+
+
+def as_matrix(vectors: VectorLike) -> np.ndarray:
+    """View embeddings as a 2-D float32 matrix (copies only if the input isn't one already)"""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix.reshape(1, -1) if matrix.ndim == 1 else matrix
+
+
+def normalize(vectors: VectorLike) -> np.ndarray:
+    """L2-normalize a vector or each row of a matrix; zero vectors are left as they are"""
+    array = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(array, axis=-1, keepdims=True)
+    return array / np.where(norms == 0, 1, norms)
+
+
+def truncate(vectors: VectorLike, dimensions: int) -> np.ndarray:
+    """Matryoshka truncation: keep the leading dimensions and re-normalize"""
+    return normalize(np.asarray(vectors, dtype=np.float32)[..., :dimensions])
+
+
+def to_list(vectors: VectorLike) -> List:
+    """Python floats for JSON/API boundaries"""
+    return vectors.tolist() if isinstance(vectors, np.ndarray) else list(vectors)
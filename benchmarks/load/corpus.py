@@ -0,0 +1,54 @@
+"""Deterministic synthetic documents and questions for benchmarks"""
+
+import random
+from typing import List
+
+_SYLLABLES = (
+    "ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "zo", "pe", "da", "gi",
+    "ho", "ju", "be", "fa", "ri", "mo", "te", "nu", "la", "xe", "qua", "sto"
+)
+
+
+class CorpusGenerator:
+    """Builds pseudo-language text with a Zipf-like word distribution"""
+
+    def __init__(self, seed: int = 42, vocabulary_size: int = 3000):
+        self.rng = random.Random(seed)
+        self.vocabulary = self._build_vocabulary(vocabulary_size)
+        # Zipf-like weights: a few frequent words and a long tail
+        self.weights = [1 / (rank + 1) for rank in range(len(self.vocabulary))]
+
+    def _build_vocabulary(self, size: int) -> List[str]:
+        words = set()
+        while len(words) < size:
+            words.add("".join(self.rng.choice(_SYLLABLES) for _ in range(self.rng.randint(2, 4))))
+        return sorted(words)
+
+    def words(self, count: int) -> List[str]:
+        return self.rng.choices(self.vocabulary, weights=self.weights, k=count)
+
+    def sentence(self) -> str:
+        words = self.words(self.rng.randint(8, 20))
+        return " ".join(words).capitalize() + self.rng.choice((".", ".", ".", "?", "!"))
+
+    def paragraph(self) -> str:
+        return " ".join(self.sentence() for _ in range(self.rng.randint(3, 8)))
+
+    def document(self, size_bytes: int) -> str:
+        paragraphs = []
+        length = 0
+        while length < size_bytes:
+            paragraph = self.paragraph()
+            paragraphs.append(paragraph)
+            length += len(paragraph) + 2
+        return "\n\n".join(paragraphs)[:size_bytes]
+
+    def question(self) -> str:
+        subject = " ".join(self.words(self.rng.randint(2, 4)))
+        template = self.rng.choice((
+            "What does the document say about {}?",
+            "Summarize the section on {}.",
+            "How is {} defined?",
+            "Which rules apply to {}?",
+        ))
+        return template.format(subject)
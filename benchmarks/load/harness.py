@@ -0,0 +1,356 @@
+"""
+End-to-end load test for /ask and /documents/upload
+
+Starts everything it needs locally, so no real provider is paid for:
+  - an OpenAI-compatible stub (separate process) with configurable latency
+  - the FastAPI app (uvicorn, background thread) wired to an in-memory
+    Mongo stand-in and Qdrant in local :memory: mode
+and then drives concurrent mixed traffic, reporting throughput, latency
+percentiles per endpoint and event-loop lag of the app.
+
+Usage:
+    python -m benchmarks.load.harness --duration 30 --concurrency 16
+    python -m benchmarks.load.harness --llm-latency constant:0.2 --output report.json
+    python -m benchmarks.load.harness --cascade    # fast stub model first, escalating when unsure
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.load.corpus import CorpusGenerator
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _serve_stub(port: int, options: Dict[str, Any]):
+    import uvicorn
+    from benchmarks.load.stub_provider import create_stub_app
+    uvicorn.run(create_stub_app(**options), host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_stub_provider(port: int, options: Dict[str, Any]) -> multiprocessing.Process:
+    """Run the provider stub in its own process so it doesn't share our GIL"""
+    process = multiprocessing.get_context("spawn").Process(
+        target=_serve_stub, args=(port, options), daemon=True
+    )
+    process.start()
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/v1/models", timeout=1.0)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Provider stub did not start")
+
+
+def configure_environment(stub_url: str, args: argparse.Namespace):
+    """Point the app at the stub; must run before app modules are imported"""
+    from benchmarks.load.stub_provider import FAST_MODEL
+
+    os.environ.update({
+        "LLM_API_KEY": "stub",
+        "LLM_BASE_URL": stub_url,
+        "EMBEDDING_API_KEY": "stub",
+        "EMBEDDING_BASE_URL": stub_url,
+        "EMBEDDING_DIMENSIONS": str(args.dimensions),
+        "JWT_SECRET_KEY": "load-test-secret",
+        "MONGODB_URL": "memory://",
+        "QDRANT_URL": ":memory:",
+        "LOG_LEVEL": "WARNING",
+        "LLM_REQUESTS_PER_MINUTE": str(args.llm_rpm),
+        "EMBEDDING_REQUESTS_PER_MINUTE": str(args.embedding_rpm),
+        "LLM_FAST_MODEL_NAME": FAST_MODEL if args.cascade else "",
+    })
+
+
+class SerializedClient:
+    """Proxy serializing calls; Qdrant local mode is not safe across threads"""
+
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._client, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return attribute(*args, **kwargs)
+        return call
+
+
+class LoopLagMonitor:
+    """Measures how late the app's event loop wakes up from short sleeps"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - start - self.interval))
+
+
+def build_app(monitor: LoopLagMonitor):
+    """Import the app and swap its storage connections for local stand-ins"""
+    from qdrant_client import QdrantClient
+
+    import app.main as main
+    from app.config import settings
+    from app.database import mongodb as mongodb_module
+    from app.database.qdrant_client import qdrant_db
+    from tests.support.memory_mongo import MemoryMongoClient
+
+    async def connect_memory_mongo():
+        mongodb_module.mongodb.client = MemoryMongoClient()
+        mongodb_module.mongodb.database = mongodb_module.mongodb.client[settings.database_name]
+        await mongodb_module.create_indexes()
+
+    def connect_memory_qdrant():
+        qdrant_db.client = SerializedClient(QdrantClient(location=":memory:"))
+
+    main.connect_to_mongo = connect_memory_mongo
+    main.connect_to_qdrant = connect_memory_qdrant
+
+    original_lifespan = main.app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        monitor.start()
+        async with original_lifespan(app) as state:
+            yield state
+        monitor.stop()
+
+    main.app.router.lifespan_context = lifespan
+    return main.app
+
+
+class AppServer:
+    """Serves the app with uvicorn on a background thread"""
+
+    def __init__(self, app, port: int):
+        import uvicorn
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("App server did not start")
+            time.sleep(0.05)
+        # Load starts once warm-up is done, as behind a load balancer
+        while httpx.get(f"http://127.0.0.1:{self.port}/health/ready", timeout=5.0).status_code != 200:
+            if time.monotonic() > deadline:
+                raise RuntimeError("App server did not become ready")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+class LoadGenerator:
+
+    def __init__(self, base_url: str, args: argparse.Namespace):
+        self.base_url = base_url
+        self.args = args
+        self.corpus = CorpusGenerator(seed=args.seed)
+        self.rng = random.Random(args.seed)
+        self.results: List[Dict[str, Any]] = []
+        self.tokens: List[str] = []
+
+    async def setup(self, client: httpx.AsyncClient):
+        """Register users and give each of them a document corpus"""
+        for index in range(self.args.users):
+            credentials = {"email": f"load{index}@example.com", "password": "load-test-password"}
+            await client.post("/register", json=credentials)
+            response = await client.post("/login", json=credentials)
+            response.raise_for_status()
+            self.tokens.append(response.json()["access_token"])
+
+        uploads = [
+            self._upload(client, token, record=False)
+            for token in self.tokens
+            for _ in range(self.args.documents_per_user)
+        ]
+        await asyncio.gather(*uploads)
+
+    async def _upload(self, client: httpx.AsyncClient, token: str, record: bool = True):
+        text = self.corpus.document(self.args.document_kb * 1024)
+        files = {"file": (f"doc-{self.rng.randrange(10**9)}.txt", text.encode(), "text/plain")}
+        await self._timed(client, "POST /documents/upload", record, "post", "/documents/upload",
+                          files=files, headers={"Authorization": f"Bearer {token}"})
+
+    async def _ask(self, client: httpx.AsyncClient, token: str):
+        await self._timed(client, "POST /ask", True, "post", "/ask",
+                          json={"question": self.corpus.question()},
+                          headers={"Authorization": f"Bearer {token}"})
+
+    async def _timed(self, client: httpx.AsyncClient, endpoint: str, record: bool, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await getattr(client, method)(url, **kwargs)
+            status_code = response.status_code
+        except httpx.HTTPError as e:
+            status_code = type(e).__name__
+        elapsed = time.perf_counter() - start
+        if record:
+            self.results.append({"endpoint": endpoint, "status": status_code, "latency": elapsed})
+
+    async def run(self, client: httpx.AsyncClient):
+        """Closed-loop workers issuing a mix of questions and uploads"""
+        stop_at = time.perf_counter() + self.args.duration
+
+        async def worker(worker_id: int):
+            rng = random.Random(self.args.seed + worker_id)
+            while time.perf_counter() < stop_at:
+                token = rng.choice(self.tokens)
+                if rng.random() < self.args.upload_ratio:
+                    await self._upload(client, token)
+                else:
+                    await self._ask(client, token)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(self.args.concurrency)))
+        return time.perf_counter() - started
+
+
+def summarize(results: List[Dict[str, Any]], elapsed: float, lag_samples: List[float]) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"duration_s": round(elapsed, 2), "endpoints": {}}
+    for endpoint in sorted({result["endpoint"] for result in results}):
+        rows = [result for result in results if result["endpoint"] == endpoint]
+        ok = [row["latency"] for row in rows if row["status"] in (200, 201)]
+        report["endpoints"][endpoint] = {
+            "requests": len(rows),
+            "errors": len(rows) - len(ok),
+            "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(ok, 50) * 1000, 1),
+            "p95_ms": round(percentile(ok, 95) * 1000, 1),
+            "p99_ms": round(percentile(ok, 99) * 1000, 1),
+            "max_ms": round(max(ok, default=0.0) * 1000, 1),
+        }
+    report["event_loop_lag"] = {
+        "samples": len(lag_samples),
+        "p50_ms": round(percentile(lag_samples, 50) * 1000, 2),
+        "p99_ms": round(percentile(lag_samples, 99) * 1000, 2),
+        "max_ms": round(max(lag_samples, default=0.0) * 1000, 2),
+    }
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\nLoad test finished in {report['duration_s']}s")
+    print(f"{'endpoint':<26}{'reqs':>7}{'errs':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for endpoint, stats in report["endpoints"].items():
+        print(
+            f"{endpoint:<26}{stats['requests']:>7}{stats['errors']:>6}{stats['throughput_rps']:>9}"
+            f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['max_ms']:>9}"
+        )
+    lag = report["event_loop_lag"]
+    print(f"event loop lag: p50={lag['p50_ms']}ms p99={lag['p99_ms']}ms max={lag['max_ms']}ms")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of mixed traffic")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent closed-loop clients")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--documents-per-user", type=int, default=3)
+    parser.add_argument("--document-kb", type=int, default=20, help="Size of each generated document")
+    parser.add_argument("--upload-ratio", type=float, default=0.05, help="Fraction of operations that are uploads")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--embedding-latency", default="lognormal:0.05,0.3")
+    parser.add_argument("--llm-latency", default="lognormal:0.8,0.5")
+    parser.add_argument("--fast-llm-latency", default="lognormal:0.2,0.5", help="Latency of the fast cascade tier")
+    parser.add_argument("--cascade", action="store_true", help="Answer with the fast stub model first")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Fraction of stub responses that are 429")
+    parser.add_argument("--llm-rpm", type=int, default=100000)
+    parser.add_argument("--embedding-rpm", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> Dict[str, Any]:
+    args = parse_args(argv)
+
+    stub_port = _free_port()
+    stub = start_stub_provider(stub_port, {
+        "dimensions": args.dimensions,
+        "embedding_latency": args.embedding_latency,
+        "llm_latency": args.llm_latency,
+        "fast_llm_latency": args.fast_llm_latency,
+        "rate_limit_ratio": args.rate_limit_ratio,
+        "seed": args.seed,
+    })
+    try:
+        configure_environment(f"http://127.0.0.1:{stub_port}/v1", args)
+        monitor = LoopLagMonitor()
+        app = build_app(monitor)
+
+        with AppServer(app, _free_port()) as server:
+            base_url = f"http://127.0.0.1:{server.port}"
+
+            async def drive():
+                limits = httpx.Limits(max_connections=args.concurrency * 2)
+                async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+                    generator = LoadGenerator(base_url, args)
+                    await generator.setup(client)
+                    monitor.samples.clear()
+                    elapsed = await generator.run(client)
+                    return summarize(generator.results, elapsed, list(monitor.samples))
+
+            report = asyncio.run(drive())
+    finally:
+        stub.terminate()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Local OpenAI-compatible stub for embeddings and chat completions
+
+Embeddings are deterministic (seeded from a hash of the input) so repeated
+runs retrieve the same chunks. Response latency is drawn from configurable
+distributions (a separate one for FAST_MODEL, the cascade's fast tier),
+chat answers carry the confidence line when the prompt asks for it, and a fraction of requests can be answered with 429 to
+exercise the outbound scheduler.
+"""
+
+import asyncio
+import base64
+import functools
+import hashlib
+import random
+import time
+from dataclasses import dataclass
+from typing import List, Union
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Chat model name answered with `fast_llm_latency`
+FAST_MODEL = "stub-fast"
+
+
+@dataclass
+class LatencyDistribution:
+    """Latency model parsed from "constant:0.1", "uniform:0.05,0.2" or "lognormal:0.8,0.5" (median, sigma)"""
+
+    kind: str
+    a: float
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        kind, _, params = spec.partition(":")
+        values = [float(value) for value in params.split(",") if value]
+        if kind not in ("constant", "uniform", "lognormal") or not values:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        return cls(kind, values[0], values[1] if len(values) > 1 else 0.0)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "constant":
+            return self.a
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        return rng.lognormvariate(np.log(self.a), self.b)
+
+
+@functools.lru_cache(maxsize=50000)
+def _word_vector(word: str, dimensions: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+
+
+def deterministic_embedding(text: str, dimensions: int) -> np.ndarray:
+    """Unit-length pseudo-embedding; texts sharing words land close together"""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in text.lower().split():
+        vector += _word_vector(word, dimensions)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return vector / norm
+
+
+def create_stub_app(
+    dimensions: int = 1536,
+    embedding_latency: str = "lognormal:0.05,0.3",
+    llm_latency: str = "lognormal:0.8,0.5",
+    fast_llm_latency: str = "lognormal:0.2,0.5",
+    rate_limit_ratio: float = 0.0,
+    seed: int = 42
+) -> FastAPI:
+    app = FastAPI(title="OpenAI-compatible stub")
+    rng = random.Random(seed)
+    embedding_delay = LatencyDistribution.parse(embedding_latency)
+    llm_delay = LatencyDistribution.parse(llm_latency)
+    fast_llm_delay = LatencyDistribution.parse(fast_llm_latency)
+    app.state.requests = {"embeddings": 0, "chat": 0, "rate_limited": 0}
+
+    def rate_limited() -> bool:
+        if rate_limit_ratio and rng.random() < rate_limit_ratio:
+            app.state.requests["rate_limited"] += 1
+            return True
+        return False
+
+    def too_many_requests():
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+            headers={"retry-after-ms": "200"}
+        )
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        app.state.requests["embeddings"] += 1
+        if rate_limited():
+            return too_many_requests()
+
+        inputs: Union[str, List[str]] = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dims = body.get("dimensions") or dimensions
+        await asyncio.sleep(embedding_delay.sample(rng))
+
+        data = []
+        for index, text in enumerate(inputs):
+            vector = deterministic_embedding(text, dims)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+
+        tokens = sum(len(text.split()) for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "stub-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests["chat"] += 1
+        if rate_limited():
+            return too_many_requests()
+
+        delay = fast_llm_delay if body.get("model") == FAST_MODEL else llm_delay
+        await asyncio.sleep(delay.sample(rng))
+        prompt = body["messages"][-1]["content"]
+        question = prompt.rsplit("QUESTION:", 1)[-1].strip().splitlines()[0]
+        words = max(8, min(body.get("max_tokens") or 200, 200) // 2)
+        answer = f"Based on the provided context, the answer to '{question}' is " + " ".join(
+            rng.choice(("policy", "document", "section", "value", "report", "result")) for _ in range(words)
+        ) + "."
+        if "CONFIDENCE:" in prompt:
+            answer += f"\nCONFIDENCE: {rng.uniform(0.4, 1.0):.2f}"
+        prompt_tokens = sum(len(message["content"]) // 4 for message in body["messages"])
+        return {
+            "id": f"chatcmpl-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub-llm"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": words,
+                "total_tokens": prompt_tokens + words
+            }
+        }
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "stub-llm", "object": "model"}]}
+
+    return app
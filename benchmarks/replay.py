@@ -0,0 +1,329 @@
+"""
+Replay recorded /ask traffic from query_logs against a deployment
+
+Samples historical questions from the query_logs collection (or a JSONL
+export of it), re-issues them with the original inter-arrival timing -
+optionally compressed by --speedup - and compares the replayed latency
+distribution and answer lengths with what was recorded.
+
+Authentication either uses one bearer token for every request (--token)
+or mints a short-lived JWT per recorded user (--jwt-secret), which needs
+the users collection to map user_id to email. Minted tokens make each
+question run against its original user's documents.
+
+Usage:
+    python -m benchmarks.replay --target http://localhost:8000 --token $TOKEN \\
+        --since 2024-05-01T09:00 --until 2024-05-01T10:00 --speedup 4
+    python -m benchmarks.replay --target https://staging.example.com \\
+        --jwt-secret $JWT_SECRET_KEY --sample 0.25 --limit 2000 --output replay.json
+    python -m benchmarks.replay --input query_logs.jsonl --target http://localhost:8000 --token $TOKEN
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.load.harness import percentile
+
+
+def _parse_timestamp(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, dict) and "$date" in value:  # mongoexport extended JSON
+        value = value["$date"]
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def _normalize(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "user_id": str(record.get("user_id")),
+        "question": record["question"],
+        "timestamp": _parse_timestamp(record["timestamp"]),
+        "response_time_ms": record.get("response_time_ms"),
+        # Computed server side when read from MongoDB, so answers are never transferred
+        "answer_length": record["answer_length"] if "answer_length" in record else len(record.get("answer") or ""),
+        "timed_out": bool(record.get("timed_out", False)),
+    }
+
+
+def load_from_file(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [_normalize(json.loads(line)) for line in f if line.strip()]
+
+
+async def load_from_mongo(args: argparse.Namespace) -> tuple:
+    """Returns (records, {user_id: email}) sampled from the requested time window
+
+    Sampling runs in MongoDB (`$sample`) and only the replayed fields plus
+    the answer's length are returned, so the client never holds the window.
+    """
+    from bson import ObjectId
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(args.mongodb_url)
+    try:
+        db = client[args.database]
+        query: Dict[str, Any] = {}
+        if args.since or args.until:
+            query["timestamp"] = {}
+            if args.since:
+                query["timestamp"]["$gte"] = _parse_timestamp(args.since)
+            if args.until:
+                query["timestamp"]["$lt"] = _parse_timestamp(args.until)
+
+        pipeline: List[Dict[str, Any]] = [{"$match": query}]
+        if args.sample < 1:
+            size = round(await db.query_logs.count_documents(query) * args.sample)
+            pipeline.append({"$sample": {"size": max(size, 1)}})
+        pipeline.append({"$project": {
+            "_id": 0, "user_id": 1, "question": 1, "timestamp": 1, "response_time_ms": 1, "timed_out": 1,
+            "answer_length": {"$strLenCP": {"$ifNull": ["$answer", ""]}}
+        }})
+        pipeline.append({"$sort": {"timestamp": 1}})
+        if args.limit:
+            pipeline.append({"$limit": args.limit})
+        cursor = db.query_logs.aggregate(pipeline, allowDiskUse=True)
+        records = [_normalize(doc) async for doc in cursor]
+
+        emails: Dict[str, str] = {}
+        if args.jwt_secret:
+            user_ids = [ObjectId(uid) for uid in {r["user_id"] for r in records} if ObjectId.is_valid(uid)]
+            async for user in db.users.find({"_id": {"$in": user_ids}}, {"email": 1}):
+                emails[str(user["_id"])] = user["email"]
+        return records, emails
+    finally:
+        client.close()
+
+
+def sample_records(records: List[Dict[str, Any]], ratio: float, limit: Optional[int], seed: int) -> List[Dict[str, Any]]:
+    """Bernoulli-sample records, keeping their chronological order"""
+    rng = random.Random(seed)
+    records = sorted(records, key=lambda record: record["timestamp"])
+    if ratio < 1:
+        records = [record for record in records if rng.random() < ratio]
+    return records[:limit] if limit else records
+
+
+def schedule(records: List[Dict[str, Any]], speedup: float, max_gap: Optional[float] = None) -> List[float]:
+    """Send offsets in seconds, preserving inter-arrival gaps scaled by `speedup`
+
+    Idle gaps longer than `max_gap` (recorded seconds) are cut so that a
+    window spanning a quiet night does not stall the replay.
+    """
+    offsets = []
+    offset = 0.0
+    previous = None
+    for record in records:
+        if previous is not None:
+            gap = (record["timestamp"] - previous).total_seconds()
+            if max_gap is not None:
+                gap = min(gap, max_gap)
+            offset += gap / speedup if speedup > 0 else 0.0
+        offsets.append(offset)
+        previous = record["timestamp"]
+    return offsets
+
+
+class TokenProvider:
+    """Bearer tokens for replayed requests, fixed or minted per recorded user"""
+
+    def __init__(self, token: Optional[str], jwt_secret: Optional[str], algorithm: str, emails: Dict[str, str]):
+        self.token = token
+        self.jwt_secret = jwt_secret
+        self.algorithm = algorithm
+        self.emails = emails
+        self._minted: Dict[str, str] = {}
+
+    def for_user(self, user_id: str) -> Optional[str]:
+        if self.token:
+            return self.token
+        email = self.emails.get(user_id)
+        if not email:
+            return None
+        if user_id not in self._minted:
+            from jose import jwt
+            expire = datetime.utcnow() + timedelta(hours=2)
+            self._minted[user_id] = jwt.encode({"sub": email, "exp": expire}, self.jwt_secret, algorithm=self.algorithm)
+        return self._minted[user_id]
+
+
+async def replay(
+    records: List[Dict[str, Any]],
+    offsets: List[float],
+    tokens: TokenProvider,
+    args: argparse.Namespace
+) -> tuple:
+    """Fire each recorded question at its scheduled offset (open loop); returns (results, elapsed)"""
+    results: List[Dict[str, Any]] = []
+    in_flight = asyncio.Semaphore(args.max_in_flight)
+    limits = httpx.Limits(max_connections=args.max_in_flight)
+
+    async with httpx.AsyncClient(base_url=args.target, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+
+        async def fire(record: Dict[str, Any], offset: float):
+            await asyncio.sleep(max(0.0, started + offset - time.perf_counter()))
+            token = tokens.for_user(record["user_id"])
+            result = {"recorded_ms": record["response_time_ms"], "recorded_answer_length": record["answer_length"],
+                      "recorded_timed_out": record["timed_out"]}
+            if token is None:
+                results.append({**result, "status": "no_token"})
+                return
+
+            async with in_flight:
+                # Lateness shows when the client itself could not keep up with the schedule
+                sent = time.perf_counter()
+                result["send_lag_ms"] = (sent - started - offset) * 1000
+                try:
+                    response = await client.post(
+                        "/ask", json={"question": record["question"]},
+                        headers={"Authorization": f"Bearer {token}"}
+                    )
+                    result["status"] = response.status_code
+                    if response.status_code == 200:
+                        body = response.json()
+                        result["answer_length"] = len(body.get("answer") or "")
+                        result["timed_out"] = bool(body.get("timed_out", False))
+                except httpx.HTTPError as e:
+                    result["status"] = type(e).__name__
+                result["replay_ms"] = (time.perf_counter() - sent) * 1000
+            results.append(result)
+
+        await asyncio.gather(*(fire(record, offset) for record, offset in zip(records, offsets)))
+        elapsed = time.perf_counter() - started
+    return results, elapsed
+
+
+def _distribution(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(values, 50), 1),
+        "p95_ms": round(percentile(values, 95), 1),
+        "p99_ms": round(percentile(values, 99), 1),
+        "max_ms": round(max(values, default=0.0), 1),
+    }
+
+
+def compare(rows: List[Dict[str, Any]], elapsed: float, recorded_span_s: float) -> Dict[str, Any]:
+    ok = [row for row in rows if row.get("status") == 200]
+
+    recorded = [row["recorded_ms"] for row in ok if row["recorded_ms"] is not None]
+    replayed = [row["replay_ms"] for row in ok]
+    recorded_dist = _distribution(recorded)
+    replayed_dist = _distribution(replayed)
+
+    # Per-question answer length change; recorded timeouts have no answer to compare with
+    length_ratios = [
+        row["answer_length"] / row["recorded_answer_length"]
+        for row in ok if row["recorded_answer_length"] and not row.get("timed_out")
+    ]
+
+    statuses: Dict[str, int] = {}
+    for row in rows:
+        statuses[str(row.get("status"))] = statuses.get(str(row.get("status")), 0) + 1
+
+    return {
+        "requests": len(rows),
+        "ok": len(ok),
+        "statuses": statuses,
+        "duration_s": round(elapsed, 2),
+        "recorded_span_s": round(recorded_span_s, 2),
+        "throughput_rps": round(len(rows) / elapsed, 2) if elapsed else 0.0,
+        "latency": {
+            "recorded": recorded_dist,
+            "replayed": replayed_dist,
+            "delta": {key: round(replayed_dist[key] - recorded_dist[key], 1) for key in recorded_dist},
+        },
+        "send_lag_p99_ms": round(percentile([row["send_lag_ms"] for row in rows if "send_lag_ms" in row], 99), 1),
+        "answer_length": {
+            "recorded_mean": round(statistics.mean([row["recorded_answer_length"] for row in ok]), 1) if ok else 0.0,
+            "replayed_mean": round(statistics.mean([row["answer_length"] for row in ok]), 1) if ok else 0.0,
+            "median_ratio": round(statistics.median(length_ratios), 3) if length_ratios else None,
+        },
+        "timed_out": {
+            "recorded": sum(1 for row in rows if row["recorded_timed_out"]),
+            "replayed": sum(1 for row in ok if row.get("timed_out")),
+        },
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\nReplayed {report['requests']} questions ({report['ok']} ok) in {report['duration_s']}s "
+          f"- recorded span {report['recorded_span_s']}s, {report['throughput_rps']} req/s")
+    print(f"statuses: {report['statuses']}")
+    print(f"{'latency':<10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name in ("recorded", "replayed", "delta"):
+        dist = report["latency"][name]
+        print(f"{name:<10}{dist['p50_ms']:>10}{dist['p95_ms']:>10}{dist['p99_ms']:>10}{dist['max_ms']:>10}")
+    lengths = report["answer_length"]
+    print(f"answer length: recorded mean={lengths['recorded_mean']} replayed mean={lengths['replayed_mean']} "
+          f"median per-question ratio={lengths['median_ratio']}")
+    print(f"timed out: recorded={report['timed_out']['recorded']} replayed={report['timed_out']['replayed']}")
+    if report["send_lag_p99_ms"] > 100:
+        print(f"warning: p99 send lag {report['send_lag_p99_ms']}ms - the replay client fell behind schedule, "
+              f"raise --max-in-flight or lower --speedup")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", required=True, help="Base URL of the deployment to replay against")
+    parser.add_argument("--input", help="JSONL export of query_logs instead of reading MongoDB")
+    parser.add_argument("--mongodb-url", default=os.getenv("MONGODB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--database", default=os.getenv("DATABASE_NAME", "twerlo_db"))
+    parser.add_argument("--since", help="Only replay questions asked at or after this ISO timestamp")
+    parser.add_argument("--until", help="Only replay questions asked before this ISO timestamp")
+    parser.add_argument("--sample", type=float, default=1.0, help="Fraction of recorded questions to replay")
+    parser.add_argument("--limit", type=int, help="Replay at most this many questions")
+    parser.add_argument("--speedup", type=float, default=1.0,
+                        help="Compress inter-arrival gaps by this factor; 0 sends everything at once")
+    parser.add_argument("--max-gap", type=float, default=60.0, help="Cap recorded idle gaps at this many seconds")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Client-side cap on concurrent requests")
+    parser.add_argument("--timeout", type=float, default=180.0)
+    parser.add_argument("--token", help="Bearer token used for every request")
+    parser.add_argument("--jwt-secret", help="Mint a token per recorded user with this signing key")
+    parser.add_argument("--jwt-algorithm", default=os.getenv("JWT_ALGORITHM", "HS256"))
+    parser.add_argument("--seed", type=int, default=42, help="Sampling seed for --input (MongoDB samples unseeded)")
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args(argv)
+    if not args.token and not args.jwt_secret:
+        parser.error("one of --token or --jwt-secret is required")
+    if args.input and args.jwt_secret and not args.token:
+        parser.error("--jwt-secret needs the users collection; use --token with --input")
+    return args
+
+
+def main(argv=None) -> Dict[str, Any]:
+    args = parse_args(argv)
+
+    if args.input:
+        records, emails = sample_records(load_from_file(args.input), args.sample, args.limit, args.seed), {}
+    else:
+        records, emails = asyncio.run(load_from_mongo(args))
+
+    if not records:
+        raise SystemExit("No recorded questions matched the selection")
+
+    offsets = schedule(records, args.speedup, args.max_gap)
+    recorded_span = (records[-1]["timestamp"] - records[0]["timestamp"]).total_seconds()
+    print(f"Replaying {len(records)} questions over ~{offsets[-1]:.1f}s against {args.target}")
+
+    tokens = TokenProvider(args.token, args.jwt_secret, args.jwt_algorithm, emails)
+    results, elapsed = asyncio.run(replay(records, offsets, tokens, args))
+    report = compare(results, elapsed, recorded_span)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Labelled retrieval datasets
+
+A dataset is a JSON file with the documents to index and questions
+labelled with what should be retrieved for them:
+
+    {
+      "documents": [{"id": "handbook", "filename": "handbook.txt", "text": "..."}],
+      "questions": [
+        {"id": "q1", "question": "How many vacation days ...?",
+         "relevant": [{"document_id": "handbook", "start_char": 1200, "end_char": 1480}]},
+        {"id": "q2", "question": "...", "relevant": [{"document_id": "faq"}]}
+      ]
+    }
+
+A relevant entry with character offsets marks a passage; without offsets
+the whole document counts. A retrieved chunk is relevant when it belongs
+to a labelled document and overlaps the labelled passage.
+"""
+
+import json
+import random
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from benchmarks.load.corpus import CorpusGenerator
+
+
+@dataclass
+class Relevant:
+    document_id: str
+    start_char: Optional[int] = None
+    end_char: Optional[int] = None
+
+    def matches(self, document_id: str, start_char: int, end_char: int) -> bool:
+        if document_id != self.document_id:
+            return False
+        if self.start_char is None or self.end_char is None:
+            return True
+        return start_char < self.end_char and end_char > self.start_char
+
+
+@dataclass
+class Question:
+    id: str
+    question: str
+    relevant: List[Relevant] = field(default_factory=list)
+
+
+@dataclass
+class Document:
+    id: str
+    filename: str
+    text: str
+
+
+@dataclass
+class Dataset:
+    documents: List[Document]
+    questions: List[Question]
+
+    @classmethod
+    def load(cls, path: str) -> "Dataset":
+        with open(path) as f:
+            raw = json.load(f)
+        return cls(
+            documents=[Document(d["id"], d.get("filename", d["id"]), d["text"]) for d in raw["documents"]],
+            questions=[
+                Question(q["id"], q["question"], [Relevant(**r) for r in q["relevant"]])
+                for q in raw["questions"]
+            ]
+        )
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({
+                "documents": [vars(d) for d in self.documents],
+                "questions": [
+                    {"id": q.id, "question": q.question, "relevant": [vars(r) for r in q.relevant]}
+                    for q in self.questions
+                ]
+            }, f, indent=2)
+
+
+def synthesize(documents: int = 20, document_kb: int = 20, questions: int = 100, seed: int = 42) -> Dataset:
+    """Generated dataset for smoke-testing the harness without labelled data
+
+    Each question is a handful of words lifted from one sentence, and that
+    sentence is the labelled passage. Good enough to compare configurations
+    against each other, not to judge absolute quality.
+    """
+    corpus = CorpusGenerator(seed=seed)
+    rng = random.Random(seed)
+    docs = [
+        Document(f"doc-{i}", f"doc-{i}.txt", corpus.document(document_kb * 1024))
+        for i in range(documents)
+    ]
+
+    labelled: List[Question] = []
+    for index in range(questions):
+        doc = rng.choice(docs)
+        start = rng.randrange(0, max(1, len(doc.text) - 400))
+        previous_stop = doc.text.rfind(". ", 0, start)
+        sentence_start = previous_stop + 2 if previous_stop >= 0 else 0
+        sentence_end = doc.text.find(".", sentence_start + 1)
+        sentence_end = len(doc.text) if sentence_end < 0 else sentence_end + 1
+        words = doc.text[sentence_start:sentence_end].split()
+        picked = rng.sample(words, k=min(len(words), rng.randint(4, 7)))
+        labelled.append(Question(
+            f"q-{index}",
+            " ".join(word.strip(".?!").lower() for word in picked),
+            [Relevant(doc.id, sentence_start, sentence_end)]
+        ))
+    return Dataset(docs, labelled)
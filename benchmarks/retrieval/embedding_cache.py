@@ -0,0 +1,62 @@
+"""
+On-disk embedding cache so evaluation runs are reproducible offline
+
+Vectors are keyed by a hash of (model, dimensions, text) and stored in a
+single compressed .npz file. The first run against a real provider fills
+the cache; later runs with --offline never touch the network and fail
+loudly on a miss instead.
+"""
+
+import hashlib
+import os
+from typing import Awaitable, Callable, Dict, List
+
+import numpy as np
+
+Embedder = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+class EmbeddingCache:
+
+    def __init__(self, path: str, model: str, dimensions: int):
+        self.path = path
+        self.namespace = f"{model}:{dimensions}"
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(path):
+            with np.load(path) as data:
+                self._vectors = dict(zip(data["keys"].tolist(), data["vectors"]))
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}:{text}".encode()).hexdigest()
+
+    async def embed(self, texts: List[str], embedder: Embedder, offline: bool, batch_size: int = 64) -> np.ndarray:
+        keys = [self._key(text) for text in texts]
+        missing = sorted({key: text for key, text in zip(keys, texts) if key not in self._vectors}.items())
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing and offline:
+            raise RuntimeError(
+                f"{len(missing)} texts are not in the embedding cache {self.path}; "
+                f"run once without --offline to fill it"
+            )
+
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            vectors = await embedder([text for _, text in batch])
+            for (key, _), vector in zip(batch, vectors):
+                self._vectors[key] = np.asarray(vector, dtype=np.float32)
+            self._dirty = True
+
+        return np.stack([self._vectors[key] for key in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+    def save(self):
+        if not self._dirty:
+            return
+        keys = sorted(self._vectors)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        np.savez_compressed(self.path, keys=np.array(keys), vectors=np.stack([self._vectors[key] for key in keys]))
+        self._dirty = False
@@ -0,0 +1,313 @@
+"""
+Offline retrieval evaluation for search_similar_chunks
+
+Indexes a labelled dataset under each chunking configuration, runs every
+question through the app's own search_similar_chunks for each
+(limit, score_threshold) pair and for the adaptive /ask retrieval policy
+("auto"), and reports recall@k, MRR and nDCG@k with search latency and the
+prompt tokens the retrieved context would cost. It also suggests a per-model
+minimum score (RETRIEVAL_MIN_SCORES) that keeps 95% of relevant chunks.
+
+Embeddings come from an on-disk cache, so after one run that fills it
+(--embedder provider) every later run with --offline is reproducible and
+makes no network calls. --embedder stub uses deterministic lexical
+pseudo-embeddings and needs no provider at all.
+
+Qdrant runs in local :memory: mode by default, which is brute force; pass
+--qdrant-url to measure latency against a real server (a temporary
+collection is created and dropped).
+
+Usage:
+    python -m benchmarks.retrieval.evaluate --synthesize --embedder stub
+    python -m benchmarks.retrieval.evaluate --dataset labelled.json --embedder provider \\
+        --cache .cache/embeddings.npz --chunking 1000:200,500:100,1500:300 \\
+        --limits 3,5,10 --thresholds 0,0.1,0.3
+    python -m benchmarks.retrieval.evaluate --dataset labelled.json --cache .cache/embeddings.npz --offline
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import statistics
+import time
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.load.harness import percentile
+from benchmarks.retrieval.dataset import Dataset, Question, synthesize
+from benchmarks.retrieval.embedding_cache import EmbeddingCache
+
+EVAL_USER_ID = "retrieval-eval"
+
+
+def _configure_offline_environment():
+    """Placeholder credentials so app settings load; nothing is sent anywhere"""
+    for name, value in {
+        "LLM_API_KEY": "offline",
+        "EMBEDDING_API_KEY": "offline",
+        "JWT_SECRET_KEY": "offline",
+        "MONGODB_URL": "memory://",
+        "QDRANT_URL": ":memory:",
+        "LOG_LEVEL": "WARNING",
+    }.items():
+        os.environ.setdefault(name, value)
+
+
+def _chunk_is_relevant(question: Question, chunk: Dict[str, Any]) -> bool:
+    return any(r.matches(chunk["document_id"], chunk["start_char"], chunk["end_char"]) for r in question.relevant)
+
+
+def score_question(question: Question, retrieved: List[Dict[str, Any]], relevant_in_index: int) -> Dict[str, float]:
+    """recall@k over labelled units, reciprocal rank and binary nDCG@k"""
+    k = len(retrieved)
+    hits = [_chunk_is_relevant(question, chunk) for chunk in retrieved]
+
+    covered = sum(
+        1 for unit in question.relevant
+        if any(unit.matches(c["document_id"], c["start_char"], c["end_char"]) for c in retrieved)
+    )
+    first_hit = next((rank for rank, hit in enumerate(hits, 1) if hit), None)
+    dcg = sum(1 / math.log2(rank + 1) for rank, hit in enumerate(hits, 1) if hit)
+    ideal = sum(1 / math.log2(rank + 1) for rank in range(1, min(k, relevant_in_index) + 1))
+
+    return {
+        "recall": covered / len(question.relevant) if question.relevant else 0.0,
+        "mrr": 1 / first_hit if first_hit else 0.0,
+        "ndcg": dcg / ideal if ideal else 0.0,
+    }
+
+
+def _embedder(kind: str):
+    if kind == "stub":
+        from app.config import settings
+        from benchmarks.load.stub_provider import deterministic_embedding
+
+        async def embed(texts: List[str]) -> List[List[float]]:
+            return [deterministic_embedding(text, settings.embedding_dimensions) for text in texts]
+        return embed, "stub"
+
+    from app.config import settings
+    from app.services.embedding_service import embedding_service
+    from app.services.scheduler import Priority
+
+    async def embed(texts: List[str]) -> List[List[float]]:
+        return await embedding_service.generate_embeddings_batch(texts, priority=Priority.BACKGROUND)
+    return embed, settings.embedding_model_name
+
+
+def _connect_qdrant(args: argparse.Namespace, collection_name: str):
+    from qdrant_client import QdrantClient
+
+    from app.database.qdrant_client import qdrant_db
+
+    if args.qdrant_url:
+        qdrant_db.client = QdrantClient(url=args.qdrant_url, api_key=args.qdrant_api_key, timeout=30.0)
+    else:
+        qdrant_db.client = QdrantClient(location=":memory:")
+    qdrant_db.collection_name = collection_name
+    return qdrant_db
+
+
+def _index(dataset: Dataset, chunk_size: int, overlap: int) -> Tuple[List[Dict[str, Any]], Dict]:
+    """Chunk all documents with the app's chunker; returns chunk rows and a lookup by (document, index)"""
+    from app.utils.file_parser import text_chunker
+
+    rows = []
+    for document in dataset.documents:
+        for chunk in text_chunker.chunk_text(document.text, chunk_size=chunk_size, overlap=overlap):
+            rows.append({
+                "document_id": document.id,
+                "filename": document.filename,
+                "chunk_index": chunk["chunk_index"],
+                "start_char": chunk["start_char"],
+                "end_char": chunk["end_char"],
+                "text": chunk["text"],
+            })
+    lookup = {(row["document_id"], row["chunk_index"]): row for row in rows}
+    return rows, lookup
+
+
+async def evaluate(dataset: Dataset, args: argparse.Namespace) -> Tuple[List[Dict[str, Any]], List[float], str]:
+    """Result rows, scores of the relevant chunks found, and the embedding model"""
+    from app.config import settings
+    from app.database.qdrant_client import search_similar_chunks, store_embeddings_batch
+    from app.services.llm_service import llm_service
+    from app.services.retrieval_policy import retrieval_policy
+    from app.services.scheduler import estimate_tokens
+
+    embed, model = _embedder(args.embedder)
+    cache = EmbeddingCache(args.cache, model, settings.embedding_dimensions)
+
+    questions = dataset.questions
+    query_vectors = await cache.embed([q.question for q in questions], embed, args.offline)
+    system_prompt = llm_service._get_system_prompt()
+    min_score = retrieval_policy.min_score(model)
+
+    results, relevant_scores = [], []
+    try:
+        for chunk_size, overlap in args.chunking:
+            rows, lookup = _index(dataset, chunk_size, overlap)
+            chunk_vectors = await cache.embed([row["text"] for row in rows], embed, args.offline)
+
+            db = _connect_qdrant(args, f"retrieval_eval_{chunk_size}_{overlap}_{os.getpid()}")
+            try:
+                for start in range(0, len(rows), 256):
+                    batch = rows[start:start + 256]
+                    store_embeddings_batch(
+                        chunk_vectors[start:start + 256],
+                        [row["text"] for row in batch],
+                        [{**row, "user_id": EVAL_USER_ID} for row in batch]
+                    )
+                relevant_in_index = {
+                    q.id: sum(1 for row in rows if _chunk_is_relevant(q, row)) for q in questions
+                }
+
+                def measure(search) -> Dict[str, Any]:
+                    scores, latencies, tokens, returned = [], [], [], []
+                    for question, vector in zip(questions, query_vectors):
+                        started = time.perf_counter()
+                        hits = search(vector)
+                        latencies.append(time.perf_counter() - started)
+
+                        retrieved = [
+                            lookup[(hit["metadata"]["document_id"], hit["metadata"]["chunk_index"])]
+                            for hit in hits
+                        ]
+                        scores.append(score_question(question, retrieved, relevant_in_index[question.id]))
+                        context = llm_service._prepare_context(hits)
+                        tokens.append(estimate_tokens(
+                            system_prompt, llm_service._create_user_prompt(question.question, context)
+                        ))
+                        returned.append(len(hits))
+                    return {
+                        "recall": round(statistics.mean(s["recall"] for s in scores), 4),
+                        "mrr": round(statistics.mean(s["mrr"] for s in scores), 4),
+                        "ndcg": round(statistics.mean(s["ndcg"] for s in scores), 4),
+                        "search_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                        "search_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                        "prompt_tokens": round(statistics.mean(tokens), 1),
+                        "chunks_returned": round(statistics.mean(returned), 2),
+                    }
+
+                def adaptive_search(vector):
+                    hits = search_similar_chunks(
+                        vector, EVAL_USER_ID, limit=retrieval_policy.fetch_limit, score_threshold=min_score
+                    )
+                    return retrieval_policy.select(hits, min_score)[0]
+
+                configuration = {"chunk_size": chunk_size, "overlap": overlap, "chunks": len(rows)}
+                for limit in args.limits:
+                    for threshold in args.thresholds:
+                        results.append({
+                            **configuration,
+                            "limit": limit,
+                            "score_threshold": threshold,
+                            **measure(lambda vector: search_similar_chunks(
+                                vector, EVAL_USER_ID, limit=limit, score_threshold=threshold
+                            )),
+                        })
+                # The /ask retrieval policy as configured (RETRIEVAL_* settings)
+                results.append({**configuration, "limit": "auto", "score_threshold": min_score, **measure(adaptive_search)})
+
+                # Scores of relevant chunks in the deepest, least filtered search, to calibrate the minimum
+                for question, vector in zip(questions, query_vectors):
+                    hits = search_similar_chunks(
+                        vector, EVAL_USER_ID, limit=max(args.limits), score_threshold=min(args.thresholds)
+                    )
+                    relevant_scores.extend(
+                        hit["score"] for hit in hits
+                        if _chunk_is_relevant(question, lookup[(hit["metadata"]["document_id"], hit["metadata"]["chunk_index"])])
+                    )
+            finally:
+                db.client.delete_collection(db.collection_name)
+                db.client.close()
+    finally:
+        cache.save()
+    return results, relevant_scores, model
+
+
+def calibrate_min_score(relevant_scores: List[float], keep: float = 0.95) -> float:
+    """Highest score floor that still keeps `keep` of the relevant chunks"""
+    return percentile(relevant_scores, (1 - keep) * 100)
+
+
+def recommend(results: List[Dict[str, Any]], tolerance: float) -> Dict[str, Any]:
+    """Cheapest configuration whose recall and nDCG are within `tolerance` of the best
+
+    Prompt tokens come first in the ordering because LLM time and cost grow
+    with them and dwarf the search itself; search p95 breaks ties.
+    """
+    best_recall = max(r["recall"] for r in results)
+    best_ndcg = max(r["ndcg"] for r in results)
+    candidates = [
+        r for r in results
+        if r["recall"] >= best_recall - tolerance and r["ndcg"] >= best_ndcg - tolerance
+    ]
+    return min(candidates, key=lambda r: (r["prompt_tokens"], r["search_p95_ms"]))
+
+
+def print_report(results: List[Dict[str, Any]], recommended: Dict[str, Any], questions: int):
+    print(f"\nRetrieval evaluation over {questions} questions")
+    header = f"{'chunk':>7}{'ovl':>5}{'k':>4}{'thr':>6}{'recall':>8}{'mrr':>8}{'ndcg':>8}{'p50ms':>8}{'p95ms':>8}{'tokens':>8}{'ret':>6}"
+    print(header)
+    for r in results:
+        marker = "  <- recommended" if r is recommended else ""
+        print(
+            f"{r['chunk_size']:>7}{r['overlap']:>5}{r['limit']:>4}{r['score_threshold']:>6}"
+            f"{r['recall']:>8.3f}{r['mrr']:>8.3f}{r['ndcg']:>8.3f}{r['search_p50_ms']:>8}"
+            f"{r['search_p95_ms']:>8}{r['prompt_tokens']:>8}{r['chunks_returned']:>6}{marker}"
+        )
+
+
+def _pairs(value: str) -> List[Tuple[int, int]]:
+    return [tuple(int(part) for part in item.split(":")) for item in value.split(",")]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dataset", help="Labelled dataset JSON (see benchmarks/retrieval/dataset.py)")
+    source.add_argument("--synthesize", action="store_true", help="Generate a synthetic labelled dataset")
+    parser.add_argument("--save-dataset", help="Write the dataset used for this run to this path")
+    parser.add_argument("--embedder", choices=("provider", "stub"), default="provider")
+    parser.add_argument("--cache", default=".cache/retrieval_embeddings.npz", help="Embedding cache file")
+    parser.add_argument("--offline", action="store_true", help="Fail on cache misses instead of calling the provider")
+    parser.add_argument("--chunking", type=_pairs, default=_pairs("1000:200,500:100"),
+                        help="Comma-separated chunk_size:overlap pairs")
+    parser.add_argument("--limits", type=lambda v: [int(x) for x in v.split(",")], default=[3, 5, 10])
+    parser.add_argument("--thresholds", type=lambda v: [float(x) for x in v.split(",")], default=[0.0, 0.1, 0.3])
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="Quality loss (absolute recall/nDCG) accepted for a cheaper configuration")
+    parser.add_argument("--qdrant-url", help="Evaluate against this Qdrant server instead of :memory:")
+    parser.add_argument("--qdrant-api-key")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON results to this path")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    if args.offline or args.embedder == "stub":
+        _configure_offline_environment()
+
+    dataset = Dataset.load(args.dataset) if args.dataset else synthesize(seed=args.seed)
+    if args.save_dataset:
+        dataset.save(args.save_dataset)
+
+    results, relevant_scores, model = asyncio.run(evaluate(dataset, args))
+    recommended = recommend(results, args.tolerance)
+    print_report(results, recommended, len(dataset.questions))
+
+    report = {"questions": len(dataset.questions), "results": results, "recommended": recommended}
+    if relevant_scores:
+        report["calibrated_min_score"] = round(calibrate_min_score(relevant_scores), 3)
+        print(f"\nRETRIEVAL_MIN_SCORES entry (keeps 95% of relevant chunks): {model}={report['calibrated_min_score']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
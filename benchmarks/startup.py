@@ -0,0 +1,110 @@
+"""
+Import-time profile of the app (cold start)
+
+Imports the target module in fresh interpreters with `python -X importtime`
+and reports the total, the slowest top-level packages (cumulative time of
+their outermost import) and the slowest individual modules (self time).
+Heavy client libraries are meant to load on first use or in the lifespan;
+the report flags any of DEFERRED that the import pulled in.
+
+Usage:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 5 --top 15 --output startup.json
+    python -m benchmarks.startup --max-ms 1500    # exit 1 when slower or a deferred module loads
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List
+
+# Client libraries that `import app.main` must not load
+DEFERRED = ("qdrant_client", "openai", "motor", "pymongo", "PyPDF2")
+
+
+@dataclass
+class ImportProfile:
+    target: str
+    total_ms: float
+    # Top-level package -> cumulative ms of its outermost import
+    packages: Dict[str, float] = field(default_factory=dict)
+    # Module -> self ms
+    modules: Dict[str, float] = field(default_factory=dict)
+    deferred_loaded: List[str] = field(default_factory=list)
+
+
+def parse_importtime(stderr: str) -> List[tuple]:
+    """(module, self_us, cumulative_us, depth) rows of `-X importtime` output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def profile_once(target: str) -> ImportProfile:
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True, text=True, env=env, check=True
+    )
+    rows = parse_importtime(result.stderr)
+    profile = ImportProfile(target=target, total_ms=0.0)
+    top_depth = min((depth for *_, depth in rows), default=0)
+    for name, self_us, cumulative_us, depth in rows:
+        profile.modules[name] = self_us / 1000
+        package = name.split(".")[0]
+        if depth == top_depth and name == target:
+            profile.total_ms = cumulative_us / 1000
+        # An import nested under another package's import is counted there
+        profile.packages[package] = max(profile.packages.get(package, 0.0), cumulative_us / 1000)
+    profile.deferred_loaded = sorted(package for package in DEFERRED if package in profile.packages)
+    return profile
+
+
+def profile_imports(target: str = "app.main", repeat: int = 3) -> ImportProfile:
+    """Best of `repeat` fresh-interpreter imports (bytecode caches warm)"""
+    return min((profile_once(target) for _ in range(repeat)), key=lambda profile: profile.total_ms)
+
+
+def print_report(profile: ImportProfile, top: int):
+    print(f"import {profile.target}: {profile.total_ms:.0f} ms")
+    print("\nslowest packages (cumulative)")
+    for package, ms in sorted(profile.packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<32} {ms:8.1f} ms")
+    print("\nslowest modules (self)")
+    for module, ms in sorted(profile.modules.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {module:<48} {ms:8.1f} ms")
+    if profile.deferred_loaded:
+        print(f"\nloaded at import time but meant to be deferred: {', '.join(profile.deferred_loaded)}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="app.main", help="Module to import")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters; the fastest is reported")
+    parser.add_argument("--top", type=int, default=10, help="Rows per table")
+    parser.add_argument("--max-ms", type=float, help="Fail when the import takes longer")
+    parser.add_argument("--output", help="Write the JSON profile to this path")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    profile = profile_imports(args.target, args.repeat)
+    print_report(profile, args.top)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(asdict(profile), f, indent=2)
+    too_slow = args.max_ms is not None and profile.total_ms > args.max_ms
+    return 1 if too_slow or profile.deferred_loaded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,9 +4,24 @@
 # Set default port if not provided by Railway
 export PORT=${PORT:-8000}
 
-echo "Starting Twerlo on port $PORT"
+# One worker per core unless WEB_CONCURRENCY says otherwise
+WORKERS=${WEB_CONCURRENCY:-$(nproc)}
+
+if [ "$WORKERS" -gt 1 ]; then
+    # Share the question embedding cache and provider rate limits between workers
+    export CACHE_URL=${CACHE_URL:-sqlite:////dev/shm/twerlo-cache.db}
+    # Combine Prometheus metrics of all workers; stale files from a previous run are removed
+    export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/twerlo-metrics}
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+# Index migrations run once here rather than racing in every worker;
+# a failure is not fatal, the workers still create the indexes they need
+python -m app.tools.indexes || echo "Index migration failed, continuing"
+
+echo "Starting Twerlo on port $PORT with $WORKERS worker(s)"
 echo "LLM Provider: ${LLM_BASE_URL}"
 echo "Embedding Provider: ${EMBEDDING_BASE_URL}"
 
 # Start the application
-exec uvicorn app.main:app --host 0.0.0.0 --port $PORT --workers 1
+exec uvicorn app.main:app --host 0.0.0.0 --port $PORT --workers $WORKERS
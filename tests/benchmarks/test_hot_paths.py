@@ -0,0 +1,134 @@
+"""
+Benchmarks for CPU-bound hot paths
+Covers chunking, PDF extraction, context assembly, JWT verification and
+response model construction; run with RUN_BENCHMARKS=1
+"""
+
+import asyncio
+import io
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import UploadFile
+
+from tests.benchmarks.conftest import ENABLED, MAX_BYTES
+from tests.benchmarks.pdf_factory import build_pdf, text_to_pages
+
+pytestmark = pytest.mark.skipif(not ENABLED, reason="set RUN_BENCHMARKS=1 to run benchmarks")
+
+CHUNK_SIZES = [size for size in (4 * 1024, 256 * 1024, 4 * 1024 * 1024, 32 * 1024 * 1024) if size <= MAX_BYTES]
+PDF_PAGES = [1, 20, 200]
+
+
+def test_chunk_text_scaling(bench, corpus):
+    """chunk_text stays linear from KB to tens of MB"""
+    from app.utils.file_parser import text_chunker
+
+    timings = []
+    for size in CHUNK_SIZES:
+        text = corpus(size)
+        chunks = text_chunker.chunk_text(text, chunk_size=1000, overlap=200)
+        assert chunks[-1]["end_char"] >= len(text.rstrip()) - 1
+
+        timings.append(bench.run(
+            f"chunk_text[{size // 1024}KB]",
+            lambda: text_chunker.chunk_text(text, chunk_size=1000, overlap=200),
+            repeat=5 if size < 1024 * 1024 else 2
+        ))
+
+    bench.check_scaling("chunk_text", CHUNK_SIZES, timings)
+
+
+def test_extract_from_pdf_scaling(bench, corpus):
+    """PDF text extraction cost grows linearly with page count"""
+    from app.utils.file_parser import FileParser
+
+    pages = text_to_pages(corpus(4 * 1024 * 1024))
+    loop = asyncio.new_event_loop()
+    try:
+        timings = []
+        for count in PDF_PAGES:
+            pdf = build_pdf(pages[:count])
+            extract = lambda: loop.run_until_complete(
+                FileParser._extract_from_pdf(UploadFile(file=io.BytesIO(pdf)))
+            )
+            assert pages[0][0].split()[0] in extract()
+
+            timings.append(bench.run(f"extract_from_pdf[{count}p]", extract, repeat=5 if count < 100 else 2))
+    finally:
+        loop.close()
+
+    bench.check_scaling("extract_from_pdf", PDF_PAGES, timings)
+
+
+@pytest.mark.parametrize("count", [5, 50])
+def test_prepare_context(bench, corpus, count):
+    from app.services.llm_service import llm_service
+
+    text = corpus(count * 1000)
+    chunks = [
+        {"text": text[i * 1000:(i + 1) * 1000], "score": 0.5, "metadata": {"filename": f"doc{i}.txt"}}
+        for i in range(count)
+    ]
+    assert "[Context 1 from doc0.txt]" in llm_service._prepare_context(chunks)
+
+    bench.run(f"prepare_context[{count}]", lambda: llm_service._prepare_context(chunks))
+
+
+def test_verify_token(bench):
+    from app.utils.security import create_access_token, verify_token
+
+    token = create_access_token({"sub": "bench@example.com"}, expires_delta=timedelta(hours=1))
+    assert verify_token(token) == "bench@example.com"
+
+    bench.run("verify_token", lambda: verify_token(token))
+
+
+@pytest.mark.parametrize("count", [5, 100])
+def test_answer_response(bench, corpus, count):
+    from app.schemas.query import AnswerResponse, chunk_fields
+    from app.utils.serialization import ModelResponse
+
+    text = corpus(count * 1000)
+    chunks = [
+        {"text": text[i * 1000:(i + 1) * 1000], "score": 0.5, "metadata": {"filename": "doc.txt", "chunk_index": i}}
+        for i in range(count)
+    ]
+
+    # As /ask builds and renders it
+    def build():
+        return ModelResponse(AnswerResponse(
+            question="What does the document say?",
+            answer=text[:800],
+            **chunk_fields(chunks, "text"),
+            response_time_ms=120
+        )).body
+
+    bench.run(f"answer_response[{count}]", build)
+
+
+@pytest.mark.parametrize("count", [10, 1000])
+def test_document_list_response(bench, count):
+    from app.schemas.document import DocumentListResponse
+
+    created_at = datetime(2024, 1, 1)
+    docs = [
+        {"_id": f"{i:024x}", "filename": f"doc{i}.pdf", "content_type": "application/pdf",
+         "file_size": 1024 * i, "chunks_count": i, "created_at": created_at}
+        for i in range(count)
+    ]
+
+    def build():
+        return [
+            DocumentListResponse(
+                id=str(doc["_id"]),
+                filename=doc["filename"],
+                content_type=doc["content_type"],
+                file_size=doc["file_size"],
+                chunks_count=doc["chunks_count"],
+                created_at=doc["created_at"].isoformat()
+            ).model_dump()
+            for doc in docs
+        ]
+
+    bench.run(f"document_list_response[{count}]", build)
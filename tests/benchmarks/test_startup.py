@@ -0,0 +1,19 @@
+"""
+Cold-start benchmark: import time of the app and deferred client libraries
+Run with RUN_BENCHMARKS=1; `python -m benchmarks.startup` prints the full report
+"""
+
+import pytest
+
+from tests.benchmarks.conftest import ENABLED
+
+pytestmark = pytest.mark.skipif(not ENABLED, reason="set RUN_BENCHMARKS=1 to run benchmarks")
+
+
+def test_import_app_main(bench):
+    """`import app.main` stays fast and leaves heavy client libraries for first use"""
+    from benchmarks.startup import profile_imports
+
+    profile = profile_imports("app.main", repeat=3)
+    assert not profile.deferred_loaded, f"imported at startup: {profile.deferred_loaded}"
+    bench.record("import_app_main", profile.total_ms / 1000)
@@ -56,6 +56,28 @@ def auth_headers(auth_token):
     """HTTP headers with authentication for API testing"""
     return {"Authorization": f"Bearer {auth_token}"}
 
+@pytest.fixture
+def memory_qdrant(monkeypatch):
+    """Point the app's Qdrant client at a fresh in-memory instance"""
+    from qdrant_client import QdrantClient
+    from app.config import settings
+    from app.database.qdrant_client import qdrant_db
+    
+    monkeypatch.setattr(qdrant_db, "client", QdrantClient(location=":memory:"))
+    monkeypatch.setattr(qdrant_db, "collection_name", settings.qdrant_collection_name)
+    monkeypatch.setattr(qdrant_db, "layouts", {})
+    return qdrant_db
+
+@pytest.fixture
+def memory_mongo(monkeypatch):
+    """Point the app's MongoDB database at a fresh in-memory one"""
+    from app.database import mongodb as mongodb_module
+    from tests.support.memory_mongo import MemoryMongoClient
+    
+    database = MemoryMongoClient()["twerlo_test"]
+    monkeypatch.setattr(mongodb_module.mongodb, "database", database)
+    return database
+
 # Test markers for categorization
 pytest.mark.unit = pytest.mark.unit
 pytest.mark.api = pytest.mark.api
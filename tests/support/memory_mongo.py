@@ -0,0 +1,297 @@
+"""
+In-memory stand-in for the subset of the Motor API the app uses
+
+Backs the tests and the load harness, which drive the request paths
+without a MongoDB server. Not a general Mongo emulator: only equality, $in/$nin, range and
+$regex operators in filters, and $set/$inc/$push/$pull/$setOnInsert in updates.
+"""
+
+import asyncio
+import copy
+import re
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+
+def _get_path(doc: Dict[str, Any], path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _set_path(doc: Dict[str, Any], path: str, value: Any):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _matches_condition(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        for op, operand in condition.items():
+            if op == "$in":
+                if isinstance(value, list):
+                    if not any(item in operand for item in value):
+                        return False
+                elif value not in operand:
+                    return False
+            elif op == "$nin" and value in operand:
+                return False
+            elif op == "$ne" and value == operand:
+                return False
+            elif op == "$exists" and (value is not None) != bool(operand):
+                return False
+            elif op == "$regex":
+                flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+                if not isinstance(value, str) or not re.search(operand, value, flags):
+                    return False
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > operand:
+                    return False
+                if op == "$gte" and not value >= operand:
+                    return False
+                if op == "$lt" and not value < operand:
+                    return False
+                if op == "$lte" and not value <= operand:
+                    return False
+        return True
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+def _matches(doc: Dict[str, Any], query: Optional[Dict[str, Any]]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(_matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(_matches(doc, sub) for sub in condition):
+                return False
+        elif not _matches_condition(_get_path(doc, key), condition):
+            return False
+    return True
+
+
+def _project(doc: Dict[str, Any], projection: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    if not projection:
+        return copy.deepcopy(doc)
+    included = {key for key, flag in projection.items() if flag and key != "_id"}
+    if included:
+        result = {key: copy.deepcopy(doc[key]) for key in included if key in doc}
+        if projection.get("_id", 1):
+            result["_id"] = doc["_id"]
+        return result
+    return {key: copy.deepcopy(value) for key, value in doc.items() if projection.get(key, 1)}
+
+
+class MemoryCursor:
+
+    def __init__(self, docs: List[Dict[str, Any]]):
+        self._docs = docs
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self._docs.sort(key=lambda doc: (_get_path(doc, field) is None, _get_path(doc, field)), reverse=order < 0)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _window(self) -> List[Dict[str, Any]]:
+        docs = self._docs[self._skip:]
+        return docs[:self._limit] if self._limit else docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._window():
+            yield doc
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        docs = self._window()
+        return docs[:length] if length else docs
+
+
+class MemoryCollection:
+
+    def __init__(self, name: str):
+        self.name = name
+        self._docs: Dict[Any, Dict[str, Any]] = {}
+        self._lock = asyncio.Lock()
+        # Index definitions are only recorded (so they can be listed), never used
+        self._indexes: Dict[str, Dict[str, Any]] = {"_id_": {"key": [("_id", 1)]}}
+
+    async def create_indexes(self, indexes):
+        names = []
+        for index in indexes:
+            spec = dict(index.document)
+            name = spec.pop("name")
+            self._indexes[name] = {**spec, "key": list(spec["key"].items())}
+            names.append(name)
+        return names
+
+    async def create_index(self, keys, **kwargs):
+        return (await self.create_indexes([IndexModel(keys, **kwargs)]))[0]
+
+    async def index_information(self):
+        return copy.deepcopy(self._indexes)
+
+    async def drop_index(self, name):
+        if self._indexes.pop(name, None) is None:
+            raise OperationFailure(f"index not found with name [{name}]", code=27)
+
+    async def insert_one(self, document: Dict[str, Any]):
+        document.setdefault("_id", ObjectId())
+        self._docs[document["_id"]] = copy.deepcopy(document)
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    async def insert_many(self, documents: List[Dict[str, Any]], ordered: bool = True):
+        ids = [(await self.insert_one(document)).inserted_id for document in documents]
+        return SimpleNamespace(inserted_ids=ids)
+
+    async def find_one(self, query: Optional[Dict[str, Any]] = None, projection=None, **kwargs):
+        if query and set(query) == {"_id"} and not isinstance(query["_id"], dict):
+            doc = self._docs.get(query["_id"])
+            return _project(doc, projection) if doc else None
+        for doc in self._docs.values():
+            if _matches(doc, query):
+                return _project(doc, projection)
+        return None
+
+    def find(self, query: Optional[Dict[str, Any]] = None, projection=None, sort=None, **kwargs):
+        docs = [_project(doc, projection) for doc in self._docs.values() if _matches(doc, query)]
+        cursor = MemoryCursor(docs)
+        if sort:
+            cursor.sort(sort)
+        return cursor
+
+    async def count_documents(self, query: Dict[str, Any], **kwargs) -> int:
+        return sum(1 for doc in self._docs.values() if _matches(doc, query))
+
+    async def delete_one(self, query: Dict[str, Any]):
+        for key, doc in list(self._docs.items()):
+            if _matches(doc, query):
+                del self._docs[key]
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    async def delete_many(self, query: Dict[str, Any]):
+        keys = [key for key, doc in self._docs.items() if _matches(doc, query)]
+        for key in keys:
+            del self._docs[key]
+        return SimpleNamespace(deleted_count=len(keys))
+
+    async def update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        async with self._lock:
+            for doc in self._docs.values():
+                if _matches(doc, query):
+                    self._apply_update(doc, update, inserting=False)
+                    return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            doc = {key: value for key, value in query.items() if not key.startswith("$") and not isinstance(value, dict)}
+            self._apply_update(doc, update, inserting=True)
+            doc.setdefault("_id", ObjectId())
+            self._docs[doc["_id"]] = doc
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+
+    async def update_many(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        matched = [doc for doc in self._docs.values() if _matches(doc, query)]
+        for doc in matched:
+            self._apply_update(doc, update, inserting=False)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched), upserted_id=None)
+
+    async def bulk_write(self, requests, ordered: bool = True):
+        for request in requests:
+            # pymongo UpdateOne stores its arguments in private attributes
+            await self.update_one(request._filter, request._doc, upsert=bool(request._upsert))
+        return SimpleNamespace(acknowledged=True)
+
+    @staticmethod
+    def _apply_update(doc: Dict[str, Any], update: Dict[str, Any], inserting: bool):
+        for op, fields in update.items():
+            for path, value in fields.items():
+                if op == "$set" or (op == "$setOnInsert" and inserting):
+                    _set_path(doc, path, copy.deepcopy(value))
+                elif op == "$inc":
+                    _set_path(doc, path, (_get_path(doc, path) or 0) + value)
+                elif op == "$max":
+                    current = _get_path(doc, path)
+                    _set_path(doc, path, value if current is None else max(current, value))
+                elif op == "$push":
+                    current = _get_path(doc, path) or []
+                    _set_path(doc, path, current + [value])
+                elif op == "$pull":
+                    current = _get_path(doc, path) or []
+                    _set_path(doc, path, [item for item in current if item != value])
+                elif op == "$unset":
+                    parent = doc
+                    parts = path.split(".")
+                    for part in parts[:-1]:
+                        parent = parent.get(part, {})
+                    parent.pop(parts[-1], None)
+
+
+class MemoryDatabase:
+
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+    async def command(self, command, *args, **kwargs):
+        # collMod changing an index's expiry, as sync_ttl_index sends it
+        if command == "collMod" and "index" in kwargs:
+            spec = kwargs["index"]
+            for index in self[args[0]]._indexes.values():
+                if index["key"] == list(spec["keyPattern"].items()):
+                    index["expireAfterSeconds"] = spec["expireAfterSeconds"]
+                    return {"ok": 1.0}
+            raise OperationFailure("index not found", code=27)
+        return {"ok": 1.0}
+
+    async def list_collection_names(self):
+        return list(self._collections)
+
+
+class MemoryMongoClient:
+
+    def __init__(self):
+        self._databases: Dict[str, MemoryDatabase] = {}
+        self.admin = MemoryDatabase("admin")
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(name)
+        return self._databases[name]
+
+    def close(self):
+        pass
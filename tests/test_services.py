@@ -84,7 +84,7 @@ async def test_document_processor_validation():
             assert not filename.lower().endswith(('.pdf', '.txt')) or '/' in filename
 
 
-@patch('app.services.embedding_service.openai')
+@patch('openai.AsyncOpenAI')
 def test_embedding_service(mock_openai):
     """Test embedding service with mocked OpenAI"""
     from app.services.embedding_service import EmbeddingService
@@ -140,3 +140,1098 @@ def test_file_type_validation():
     
     for content_type in unsupported_types:
         assert content_type not in ["text/plain", "application/pdf"]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_prioritizes_interactive_calls():
+    """Test that queued interactive calls run before background calls"""
+    import asyncio
+    from app.services.scheduler import OutboundScheduler, Priority
+    
+    scheduler = OutboundScheduler("test", requests_per_minute=6000, tokens_per_minute=10**6, max_concurrency=1)
+    order = []
+    release = asyncio.Event()
+    
+    async def blocker():
+        await release.wait()
+    
+    def recorder(name):
+        async def call():
+            order.append(name)
+        return call
+    
+    first = asyncio.create_task(scheduler.run(blocker))
+    await asyncio.sleep(0)
+    background = asyncio.create_task(scheduler.run(recorder("background"), priority=Priority.BACKGROUND))
+    interactive = asyncio.create_task(scheduler.run(recorder("interactive")))
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(first, background, interactive)
+    
+    assert order == ["interactive", "background"]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_backs_off_on_rate_limit():
+    """Test that 429 responses are retried and shrink concurrency"""
+    from app.services.scheduler import OutboundScheduler
+    
+    class RateLimited(Exception):
+        status_code = 429
+        response = Mock(headers={"retry-after-ms": "10"})
+    
+    scheduler = OutboundScheduler("test", requests_per_minute=6000, tokens_per_minute=10**6, max_concurrency=8)
+    attempts = []
+    
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimited()
+        return "ok"
+    
+    assert await scheduler.run(flaky) == "ok"
+    assert len(attempts) == 3
+    assert scheduler.concurrency < 8
+
+
+@pytest.mark.asyncio
+async def test_deadline_cancels_slow_stage():
+    """Test that a stage exceeding the request deadline is cancelled"""
+    import asyncio
+    from app.utils.deadline import Deadline, DeadlineExceeded
+    
+    cancelled = asyncio.Event()
+    
+    async def slow_stage():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+    
+    deadline = Deadline(0.05)
+    with pytest.raises(DeadlineExceeded) as exc_info:
+        await deadline.run(slow_stage(), stage="generating the answer")
+    
+    assert exc_info.value.stage == "generating the answer"
+    assert cancelled.is_set()
+    
+    # An expired deadline fails fast without starting the stage
+    with pytest.raises(DeadlineExceeded):
+        await deadline.run(slow_stage(), stage="searching documents")
+
+
+@pytest.mark.asyncio
+async def test_ask_deadline_outcomes(monkeypatch):
+    """Test /ask on timeouts: chunks without an answer, 504 before retrieval is done, 499 on disconnect"""
+    import asyncio
+    import json
+    import time
+    from types import SimpleNamespace
+    import numpy as np
+    from fastapi import HTTPException
+    from app.config import settings
+    from app.endpoints import ask
+    from app.schemas.query import QuestionRequest
+    from app.services.embedding_service import embedding_service
+    from app.services.llm_service import llm_service
+    from app.services.logging_service import logging_service
+    from app.services.model_cascade import model_cascade
+    from app.services.search_scope import SearchScope
+    
+    delays = {"embed": 0.0, "search": 0.0, "llm": 0.0}
+    llm_cancelled = asyncio.Event()
+    
+    async def embed(text, priority=None):
+        await asyncio.sleep(delays["embed"])
+        return np.ones(8, dtype=np.float32), False
+    
+    def search(**kwargs):
+        time.sleep(delays["search"])
+        return [{"text": "Prime the pump first.", "score": 0.9, "metadata": {"document_id": "d1", "chunk_index": 0}}]
+    
+    async def scope(user_id, filters):
+        return SearchScope()
+    
+    async def generate(question, context_chunks, model=None, report_confidence=False, priority=None):
+        try:
+            await asyncio.sleep(delays["llm"])
+        except asyncio.CancelledError:
+            llm_cancelled.set()
+            raise
+        return "Prime it first."
+    
+    monkeypatch.setattr(embedding_service, "generate_embedding_cached", embed)
+    monkeypatch.setattr(ask, "search_similar_chunks", search)
+    monkeypatch.setattr(ask, "resolve_scope", scope)
+    monkeypatch.setattr(llm_service, "generate_answer", generate)
+    monkeypatch.setattr(logging_service, "log_query", AsyncMock())
+    monkeypatch.setattr(model_cascade, "fast", None)
+    monkeypatch.setattr(settings, "embedding_timeout_seconds", 0.1)
+    monkeypatch.setattr(settings, "search_timeout_seconds", 0.1)
+    user = SimpleNamespace(id="u1")
+    
+    class ClientRequest:
+        def __init__(self, disconnect_after=None):
+            self.disconnect_at = time.monotonic() + disconnect_after if disconnect_after is not None else None
+        
+        async def is_disconnected(self):
+            return self.disconnect_at is not None and time.monotonic() >= self.disconnect_at
+    
+    async def post(timeout_seconds=1.0, request=None):
+        question = QuestionRequest(question="How do I start the pump?", timeout_seconds=timeout_seconds)
+        response = await ask.ask_question(question, request or ClientRequest(), user)
+        return json.loads(response.body)
+    
+    body = await post()
+    assert body["answer"] == "Prime it first." and body["timed_out"] is False
+    
+    # Generation running out of time still returns what was retrieved
+    delays["llm"] = 5
+    body = await post(timeout_seconds=0.3)
+    assert body["answer"] is None and body["timed_out"] is True
+    assert [chunk["text"] for chunk in body["retrieved_chunks"]] == ["Prime the pump first."]
+    assert llm_cancelled.is_set()
+    delays["llm"] = 0
+    
+    # Without retrieved chunks there is nothing to return
+    for stage in ("embed", "search"):
+        delays[stage] = 0.5
+        with pytest.raises(HTTPException) as failure:
+            await post()
+        assert failure.value.status_code == 504
+        delays[stage] = 0
+    
+    # A client that goes away cancels the provider call
+    llm_cancelled.clear()
+    delays["llm"] = 5
+    with pytest.raises(HTTPException) as failure:
+        await post(timeout_seconds=10, request=ClientRequest(disconnect_after=0.1))
+    assert failure.value.status_code == ask.CLIENT_CLOSED_REQUEST
+    await asyncio.wait_for(llm_cancelled.wait(), timeout=1)
+
+
+def test_metrics_endpoint_exposes_stage_histograms():
+    """Test that stage timings are exported in Prometheus format"""
+    from app.services.metrics import observe_stage, render_metrics, ASK_ROUTE
+    
+    with observe_stage(ASK_ROUTE, "embedding"):
+        pass
+    
+    output = render_metrics().decode()
+    assert 'twerlo_stage_duration_seconds_count{route="/ask",stage="embedding"}' in output
+    assert "twerlo_http_requests_in_flight" in output
+
+
+@pytest.mark.asyncio
+async def test_tracer_records_nested_spans():
+    """Test that spans nest under the request trace and reach the exporter"""
+    from app.services.tracing import Tracer, InMemorySpanExporter, traced
+    import app.services.tracing as tracing
+    
+    exporter = InMemorySpanExporter()
+    test_tracer = Tracer(exporter=exporter, sample_ratio=0.0, tail_latency_ms=0)
+    
+    @traced("qdrant.search")
+    async def search():
+        return "hits"
+    
+    with patch.object(tracing, "tracer", test_tracer):
+        # Unsampled traces are dropped...
+        with test_tracer.start_trace("POST /ask"):
+            await search()
+        assert exporter.get_finished_spans() == []
+        
+        # ...unless they fail (tail sampling keeps errors)
+        with pytest.raises(RuntimeError):
+            with test_tracer.start_trace("POST /ask") as root:
+                await search()
+                raise RuntimeError("boom")
+    
+    spans = exporter.get_finished_spans(root.trace_id)
+    names = {span.name: span for span in spans}
+    assert set(names) == {"POST /ask", "qdrant.search"}
+    assert names["qdrant.search"].parent_id == names["POST /ask"].span_id
+    assert names["POST /ask"].status == "error"
+
+
+@pytest.mark.asyncio
+async def test_tracing_middleware_follows_upstream_sampling():
+    """Test that an explicit upstream "not sampled" flag is honoured despite a full sample ratio"""
+    import re
+    from app.services.tracing import Tracer, InMemorySpanExporter, TracingMiddleware
+    import app.services.tracing as tracing
+    
+    exporter = InMemorySpanExporter()
+    test_tracer = Tracer(exporter=exporter, sample_ratio=1.0, tail_latency_ms=0)
+    
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+    
+    sent = []
+    
+    async def send(message):
+        sent.append(message)
+    
+    async def request(traceparent=None, trace_id=None):
+        headers = [(b"traceparent", traceparent.encode())] if traceparent else []
+        if trace_id is not None:
+            headers.append((b"x-trace-id", trace_id.encode()))
+        scope = {"type": "http", "method": "GET", "path": "/health", "headers": headers}
+        await TracingMiddleware(app)(scope, None, send)
+        return dict(sent[-2]["headers"])[b"x-trace-id"].decode()
+    
+    with patch.object(tracing, "tracer", test_tracer):
+        await request("00-" + "a" * 32 + "-" + "b" * 16 + "-00")
+        assert exporter.get_finished_spans() == []
+        
+        await request("00-" + "c" * 32 + "-" + "d" * 16 + "-01")
+        await request()
+        assert len(exporter.get_finished_spans()) == 2
+        
+        # Client trace ids are only taken in the traceparent format
+        assert await request(trace_id="e" * 32) == "e" * 32
+        for bogus in ("x" * 5000, "not-hex-" + "0" * 24, "e" * 31):
+            replaced = await request(trace_id=bogus)
+            assert replaced != bogus and re.fullmatch("[0-9a-f]{32}", replaced)
+
+
+def test_structured_logging_samples_debug_records():
+    """Test JSON log rendering and DEBUG sampling"""
+    import json
+    import logging
+    from app.utils.logger import JsonFormatter, SamplingFilter, parse_log_levels
+    
+    record = logging.LogRecord("app.endpoints.ask", logging.INFO, __file__, 1, "Found %d chunks", (3,), None)
+    record.user_id = "user123"
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Found 3 chunks"
+    assert entry["user_id"] == "user123"
+    assert entry["level"] == "INFO"
+    
+    never = SamplingFilter(debug_sample_rate=0.0)
+    debug_record = logging.LogRecord("app", logging.DEBUG, __file__, 1, "noisy", (), None)
+    assert never.filter(debug_record) is False
+    assert never.filter(record) is True  # INFO and above are never sampled
+    
+    assert parse_log_levels("app.endpoints.ask=debug, uvicorn.access=WARNING") == {
+        "app.endpoints.ask": "DEBUG",
+        "uvicorn.access": "WARNING"
+    }
+
+
+def test_retrieval_evaluation_metrics():
+    """Test recall, MRR and nDCG scoring of the retrieval evaluation harness"""
+    from benchmarks.retrieval.dataset import Question, Relevant
+    from benchmarks.retrieval.evaluate import score_question
+    
+    question = Question("q1", "vacation days", [Relevant("handbook", 100, 200), Relevant("faq")])
+    retrieved = [
+        {"document_id": "policy", "start_char": 0, "end_char": 500},
+        {"document_id": "handbook", "start_char": 150, "end_char": 650},
+        {"document_id": "handbook", "start_char": 600, "end_char": 1100},
+    ]
+    
+    scores = score_question(question, retrieved, relevant_in_index=2)
+    assert scores["recall"] == 0.5  # the faq document was never retrieved
+    assert scores["mrr"] == 0.5
+    assert 0 < scores["ndcg"] < 1
+    
+    assert score_question(question, [], relevant_in_index=2) == {"recall": 0.0, "mrr": 0.0, "ndcg": 0.0}
+
+
+def test_two_stage_search_rescores_with_full_vectors(monkeypatch, memory_qdrant):
+    """Test truncated-index candidate search followed by full-vector rescoring"""
+    import numpy as np
+    from app.config import settings
+    from app.database import qdrant_client as qdrant_module
+    from app.database.qdrant_client import qdrant_db, store_embeddings_batch, search_similar_chunks
+    
+    monkeypatch.setattr(settings, "embedding_dimensions", 16)
+    monkeypatch.setattr(settings, "embedding_index_dimensions", 4)
+    monkeypatch.setattr(settings, "embedding_rescore_oversampling", 3.0)
+    
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((40, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    store_embeddings_batch(
+        vectors.tolist(),
+        [f"chunk {i}" for i in range(40)],
+        [{"user_id": "u1", "document_id": "d1", "chunk_index": i} for i in range(40)]
+    )
+    
+    vectors_config = qdrant_db.client.get_collection(qdrant_db.collection_name).config.params.vectors
+    assert set(vectors_config) == {qdrant_module.SHORT_VECTOR, qdrant_module.FULL_VECTOR}
+    assert vectors_config[qdrant_module.SHORT_VECTOR].size == 4
+    
+    query = vectors[7] + 0.05 * rng.standard_normal(16).astype(np.float32)
+    results = search_similar_chunks(query.tolist(), "u1", limit=3, score_threshold=0.0)
+    assert results[0]["metadata"]["chunk_index"] == 7
+    
+    # Scores come from the full vectors, not the truncated prefix
+    expected = float(np.dot(vectors[7], query) / np.linalg.norm(query))
+    assert abs(results[0]["score"] - expected) < 1e-4
+    assert search_similar_chunks(query.tolist(), "other-user", limit=3, score_threshold=0.0) == []
+
+
+@pytest.mark.asyncio
+async def test_embedding_service_decodes_base64_into_float32_arrays():
+    """Test base64 embedding transport, batch matrix decoding and the query cache"""
+    import base64
+    import numpy as np
+    from types import SimpleNamespace
+    from app.services.embedding_service import EmbeddingService
+    
+    vectors = np.arange(12, dtype=np.float32).reshape(3, 4)
+    
+    async def create(model, input, encoding_format):
+        assert encoding_format == "base64"
+        texts = [input] if isinstance(input, str) else input
+        # Rows may arrive out of order; index says where they belong
+        data = [
+            SimpleNamespace(index=i, embedding=base64.b64encode(vectors[i].tobytes()).decode())
+            for i in reversed(range(len(texts)))
+        ]
+        return SimpleNamespace(data=data)
+    
+    service = EmbeddingService()
+    service.client = SimpleNamespace(embeddings=SimpleNamespace(create=AsyncMock(side_effect=create)))
+    
+    matrix = await service.generate_embeddings_batch(["a", "b", "c"])
+    assert matrix.dtype == np.float32 and matrix.shape == (3, 4)
+    np.testing.assert_array_equal(matrix, vectors)
+    
+    # Rows always line up with the inputs: no input, no rows; blank inputs are rejected
+    empty = await service.generate_embeddings_batch([])
+    assert empty.shape == (0, service.dimensions) and empty.dtype == np.float32
+    with pytest.raises(ValueError):
+        await service.generate_embeddings_batch(["a", "  ", "c"])
+    assert service.client.embeddings.create.await_count == 1
+    
+    first = await service.generate_embedding("what is the refund policy?")
+    second = await service.generate_embedding("what is the refund policy?")
+    assert first is second  # served from the query embedding cache
+    assert not first.flags.writeable
+    assert service.client.embeddings.create.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_reindex_resumes_and_swaps_alias(monkeypatch, memory_qdrant, memory_mongo):
+    """Test re-indexing into a versioned collection, checkpoint resume and the alias swap"""
+    import numpy as np
+    from datetime import datetime, timedelta
+    from app.config import settings
+    from app.database.qdrant_client import qdrant_db, get_alias_target, count_document_points
+    from app.services import vector_index
+    from app.services.embedding_service import embedding_service
+    
+    monkeypatch.setattr(settings, "embedding_dimensions", 8)
+    monkeypatch.setattr(settings, "embedding_index_dimensions", 0)
+    monkeypatch.setattr(embedding_service, "model", embedding_service.model)
+    monkeypatch.setattr(embedding_service, "dimensions", embedding_service.dimensions)
+    
+    models_used = []
+    
+    async def embed(texts, priority=None, model=None):
+        models_used.append(model)
+        dimensions = 16 if model == "bigger-model" else 8
+        return np.ones((len(texts), dimensions), dtype=np.float32)
+    
+    monkeypatch.setattr(embedding_service, "generate_embeddings_batch", embed)
+    
+    # Fresh deployment: a v1 collection is created behind the alias
+    active = await vector_index.refresh_active_index()
+    assert active.collection == "documents_v1"
+    assert get_alias_target("documents") == "documents_v1"
+    
+    start = datetime(2024, 1, 1)
+    for i in range(3):
+        await memory_mongo.documents.insert_one({
+            "_id": f"doc-{i}", "user_id": "u1", "filename": f"{i}.txt",
+            "original_text": "Some stored text. " * 80, "created_at": start + timedelta(minutes=i)
+        })
+    
+    spec = vector_index.IndexSpec("documents_v2", "bigger-model", 16)
+    reindexer = vector_index.Reindexer(spec, tokens_per_minute=10**9, batch_documents=2)
+    await reindexer.prepare()
+    assert await reindexer.run() == 3
+    assert set(models_used) == {"bigger-model"}
+    assert count_document_points("doc-2", "documents_v2") == 2
+    
+    # Resuming after completion re-embeds nothing; new uploads are picked up
+    await memory_mongo.documents.insert_one({
+        "_id": "doc-3", "user_id": "u1", "filename": "3.txt",
+        "original_text": "Late upload.", "created_at": start + timedelta(minutes=5)
+    })
+    assert await vector_index.Reindexer(spec, tokens_per_minute=10**9).run() == 1
+    assert count_document_points("doc-0", "documents_v2") == 2  # deterministic ids, no duplicates
+    
+    # Documents updated or deleted after they were indexed are re-synced before the swap
+    await memory_mongo.documents.update_one(
+        {"_id": "doc-1"}, {"$set": {"original_text": "Rewritten text.", "updated_at": datetime.utcnow()}}
+    )
+    await memory_mongo.documents.delete_one({"_id": "doc-2"})
+    assert await reindexer.sync() == 1
+    assert count_document_points("doc-1", "documents_v2") == 1
+    assert count_document_points("doc-2", "documents_v2") == 0
+    assert count_document_points("doc-0", "documents_v2") == 2
+    await reindexer.sync()  # recent updates are synced again, without duplicates
+    assert count_document_points("doc-1", "documents_v2") == 1
+    
+    assert await reindexer.swap() == "documents_v1"
+    assert get_alias_target("documents") == "documents_v2"
+    assert (await vector_index.get_index("documents_v1"))["status"] == vector_index.RETIRED
+    
+    active = await vector_index.refresh_active_index()
+    assert (active.collection, active.model, active.dimensions) == ("documents_v2", "bigger-model", 16)
+    assert qdrant_db.collection_name == "documents_v2"
+    assert embedding_service.model == "bigger-model"
+
+
+@pytest.mark.asyncio
+async def test_document_update_embeds_only_changed_chunks(monkeypatch, memory_qdrant, memory_mongo):
+    """Test PUT-style updates: unchanged chunks keep their points, removed ones are deleted"""
+    import io
+    import numpy as np
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+    from app.config import settings
+    from app.database.qdrant_client import qdrant_db, count_document_points
+    from app.services.document_processor import DocumentProcessor
+    from app.services.embedding_service import embedding_service
+    
+    monkeypatch.setattr(settings, "embedding_dimensions", 8)
+    monkeypatch.setattr(settings, "embedding_index_dimensions", 0)
+    
+    embedded = []
+    
+    async def embed(texts, priority=None, model=None):
+        embedded.extend(texts)
+        return np.random.default_rng(len(embedded)).standard_normal((len(texts), 8)).astype(np.float32)
+    
+    monkeypatch.setattr(embedding_service, "generate_embeddings_batch", embed)
+    
+    def upload(text: str, filename: str = "policy.txt") -> UploadFile:
+        data = text.encode()
+        return UploadFile(io.BytesIO(data), size=len(data), filename=filename,
+                          headers=Headers({"content-type": "text/plain"}))
+    
+    paragraphs = [f"Section {i}. " + f"Clause {i} applies to every employee. " * 20 for i in range(5)]
+    processor = DocumentProcessor()
+    document = await processor.process_and_store_document(upload(" ".join(paragraphs)), "u1")
+    assert count_document_points(document.id) == document.chunks_count
+    
+    embedded.clear()
+    paragraphs[4] = "Section 4. Clause 4 was rewritten entirely. " * 20
+    result = await processor.update_document(document.id, upload(" ".join(paragraphs), "policy-v2.txt"), "u1")
+    
+    assert result.version == 2
+    assert 0 < result.chunks_added < result.chunks_count
+    assert result.chunks_unchanged > 0
+    assert len(embedded) == result.chunks_added
+    assert count_document_points(document.id) == result.chunks_count
+    
+    points, _ = qdrant_db.client.scroll(qdrant_db.collection_name, limit=100)
+    assert {point.payload["filename"] for point in points} == {"policy-v2.txt"}
+    assert sorted(point.payload["chunk_index"] for point in points) == list(range(result.chunks_count))
+    new_text = " ".join(paragraphs)
+    assert all(new_text[point.payload["start_char"]:point.payload["end_char"]].strip() == point.payload["text"] for point in points)
+
+
+@pytest.mark.asyncio
+async def test_upload_with_failed_embedding_batch_is_not_stored(monkeypatch, memory_qdrant, memory_mongo):
+    """Test that an upload missing any chunk's vector fails with 502 and leaves nothing behind"""
+    import io
+    import numpy as np
+    from fastapi import HTTPException, UploadFile
+    from starlette.datastructures import Headers
+    from app.config import settings
+    from app.database.qdrant_client import qdrant_db
+    from app.services.document_processor import DocumentProcessor
+    from app.services.embedding_service import embedding_service
+    
+    monkeypatch.setattr(settings, "embedding_dimensions", 8)
+    monkeypatch.setattr(settings, "embedding_index_dimensions", 0)
+    monkeypatch.setattr(settings, "embedding_batch_size", 1)
+    
+    async def embed(texts, priority=None, model=None):
+        if "Clause 3" in texts[0]:
+            raise RuntimeError("provider down")
+        return np.ones((len(texts), 8), dtype=np.float32)
+    
+    monkeypatch.setattr(embedding_service, "generate_embeddings_batch", embed)
+    
+    data = " ".join(f"Section {i}. " + f"Clause {i} applies to every employee. " * 20 for i in range(5)).encode()
+    upload = UploadFile(io.BytesIO(data), size=len(data), filename="policy.txt",
+                        headers=Headers({"content-type": "text/plain"}))
+    with pytest.raises(HTTPException) as failure:
+        await DocumentProcessor().process_and_store_document(upload, "u1")
+    
+    assert failure.value.status_code == 502
+    assert await memory_mongo.documents.count_documents({}) == 0
+    assert await memory_mongo.chunk_fingerprints.count_documents({}) == 0
+    assert qdrant_db.client.count(qdrant_db.collection_name).count == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_document_update_discards_new_points(monkeypatch, memory_qdrant, memory_mongo):
+    """Test that a 502 (embedding failure) or 409 (lost version race) leaves only the old version searchable"""
+    import io
+    import numpy as np
+    from fastapi import HTTPException, UploadFile
+    from starlette.datastructures import Headers
+    from app.config import settings
+    from app.database.qdrant_client import qdrant_db
+    from app.services.document_processor import DocumentProcessor
+    from app.services.embedding_service import embedding_service
+    
+    monkeypatch.setattr(settings, "embedding_dimensions", 8)
+    monkeypatch.setattr(settings, "embedding_index_dimensions", 0)
+    monkeypatch.setattr(settings, "embedding_batch_size", 1)
+    
+    failure = {}
+    
+    async def embed(texts, priority=None, model=None):
+        if failure.get("embed") and "Clause 4 was rewritten" in texts[0]:
+            raise RuntimeError("provider down")
+        if failure.get("race"):
+            # Another update commits while this one is embedding
+            await memory_mongo.documents.update_one({}, {"$inc": {"version": 1}})
+        return np.random.default_rng(len(texts[0])).standard_normal((len(texts), 8)).astype(np.float32)
+    
+    monkeypatch.setattr(embedding_service, "generate_embeddings_batch", embed)
+    
+    def upload(text: str) -> UploadFile:
+        data = text.encode()
+        return UploadFile(io.BytesIO(data), size=len(data), filename="policy.txt",
+                          headers=Headers({"content-type": "text/plain"}))
+    
+    def stored_texts():
+        points, _ = qdrant_db.client.scroll(qdrant_db.collection_name, limit=100)
+        return sorted(point.payload["text"] for point in points)
+    
+    paragraphs = [f"Section {i}. " + f"Clause {i} applies to every employee. " * 20 for i in range(5)]
+    processor = DocumentProcessor()
+    document = await processor.process_and_store_document(upload(" ".join(paragraphs)), "u1")
+    original = stored_texts()
+    fingerprints = await memory_mongo.chunk_fingerprints.count_documents({})
+    
+    # Section 3 embeds fine, section 4 fails
+    paragraphs[3] = "Section 3. Clause 3 was rewritten entirely. " * 20
+    paragraphs[4] = "Section 4. Clause 4 was rewritten entirely. " * 20
+    for mode, code in (("embed", 502), ("race", 409)):
+        failure.clear()
+        failure[mode] = True
+        with pytest.raises(HTTPException) as error:
+            await processor.update_document(document.id, upload(" ".join(paragraphs)), "u1")
+        assert error.value.status_code == code
+        assert stored_texts() == original
+        assert await memory_mongo.chunk_fingerprints.count_documents({}) == fingerprints
+
+
+@pytest.mark.asyncio
+async def test_duplicate_chunks_become_references(monkeypatch, memory_qdrant, memory_mongo):
+    """Test exact and near-duplicate detection at ingest and hand-over on delete"""
+    import io
+    import numpy as np
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+    from app.config import settings
+    from app.database.qdrant_client import qdrant_db, search_similar_chunks
+    from app.services.deduplication import chunk_deduplicator
+    from app.services.document_processor import DocumentProcessor
+    from app.services.embedding_service import embedding_service
+    
+    monkeypatch.setattr(settings, "embedding_dimensions", 8)
+    monkeypatch.setattr(settings, "embedding_index_dimensions", 0)
+    
+    embedded = []
+    
+    async def embed(texts, priority=None, model=None):
+        embedded.extend(texts)
+        return np.ones((len(texts), 8), dtype=np.float32)
+    
+    monkeypatch.setattr(embedding_service, "generate_embeddings_batch", embed)
+    
+    def upload(text: str) -> UploadFile:
+        data = text.encode()
+        return UploadFile(io.BytesIO(data), size=len(data), filename="report.txt",
+                          headers=Headers({"content-type": "text/plain"}))
+    
+    words = " ".join(f"w{i}" for i in range(150))
+    report = f"Quarterly report. {words}."
+    processor = DocumentProcessor()
+    first = await processor.process_and_store_document(upload(report), "u1")
+    assert len(embedded) == 1
+    
+    # Exact copy and a copy with one word changed: no new vectors
+    copy = await processor.process_and_store_document(upload(report), "u1")
+    near = await processor.process_and_store_document(upload(report.replace("w75 ", "w75b ")), "u1")
+    assert len(embedded) == 1
+    
+    # Other users never share points
+    await processor.process_and_store_document(upload(report), "u2")
+    assert len(embedded) == 2
+    
+    results = search_similar_chunks(np.ones(8, dtype=np.float32), "u1", limit=5, score_threshold=0.0)
+    assert len(results) == 1
+    
+    # Deleting the owner hands the point to a document that references it
+    released = await chunk_deduplicator.release(first.id)
+    assert released == []
+    points, _ = qdrant_db.client.scroll(qdrant_db.collection_name, limit=10)
+    owners = {point.payload["document_id"] for point in points if point.payload["user_id"] == "u1"}
+    assert len(owners) == 1 and owners <= {copy.id, near.id}
+
+
+@pytest.mark.asyncio
+async def test_reconciler_removes_orphans_and_fixes_counts(monkeypatch, memory_qdrant, memory_mongo):
+    """Test orphan point cleanup and chunk count correction"""
+    import numpy as np
+    from datetime import datetime, timedelta
+    from app.config import settings
+    from app.database.qdrant_client import qdrant_db, chunk_hash, chunk_point_id, store_embeddings_batch
+    from app.services.reconciler import Reconciler
+    
+    monkeypatch.setattr(settings, "embedding_dimensions", 4)
+    monkeypatch.setattr(settings, "embedding_index_dimensions", 0)
+    db = memory_mongo
+    
+    def store(document_id, texts):
+        store_embeddings_batch(
+            np.ones((len(texts), 4), dtype=np.float32), texts,
+            [{"user_id": "u1", "document_id": document_id, "chunk_index": i} for i in range(len(texts))],
+            point_ids=[chunk_point_id(document_id, chunk_hash(text)) for text in texts]
+        )
+    
+    created_at = datetime.utcnow() - timedelta(hours=1)
+    # Healthy document, one whose second chunk failed to embed, and a deleted one
+    await db.documents.insert_one({"_id": "ok", "chunks_count": 2, "chunk_hashes": [chunk_hash("a"), chunk_hash("b")], "created_at": created_at})
+    await db.documents.insert_one({"_id": "partial", "chunks_count": 2, "chunk_hashes": [chunk_hash("c"), chunk_hash("d")], "created_at": created_at})
+    store("ok", ["a", "b"])
+    store("partial", ["c"])
+    store("deleted", ["e", "f", "g"])
+    # Left by an update of "ok" that never committed
+    store("ok", ["stale"])
+    
+    report = await Reconciler(page_size=2, dry_run=True).run()
+    assert (report.points_scanned, report.orphan_points, report.chunks_missing) == (7, 3, 1)
+    assert (report.extra_points, report.documents_with_extra_points) == (1, 1)
+    assert qdrant_db.client.count(qdrant_db.collection_name).count == 7
+    
+    report = await Reconciler(page_size=2).run()
+    assert report.points_deleted == 4 and report.counts_fixed == 1
+    assert qdrant_db.client.count(qdrant_db.collection_name).count == 3
+    assert (await db.documents.find_one({"_id": "partial"}))["chunks_count"] == 1
+    
+    # Idempotent once reconciled
+    report = await Reconciler().run()
+    assert (report.orphan_points, report.extra_points, report.counts_fixed) == (0, 0, 0)
+
+
+@pytest.mark.asyncio
+async def test_query_rollups_track_logged_questions(monkeypatch, memory_mongo):
+    """Test that logged questions roll up per user and globally, and that a rebuild matches"""
+    from datetime import datetime, timedelta
+    from app.services.analytics import ROLLUPS, analytics_service, summarize
+    from app.services.logging_service import logging_service
+    
+    db = memory_mongo
+    # Drop increments other tests' logged questions left pending
+    monkeypatch.setattr(analytics_service, "_pending", {})
+    monkeypatch.setattr(analytics_service, "_keys", {})
+    
+    for user_id, response_time_ms, cache_hit in [("u1", 80, False), ("u1", 400, True), ("u1", 1800, True), ("u2", 90, None)]:
+        await logging_service.log_query(user_id, "q", "a", response_time_ms, 5, cache_hit=cache_hit)
+    
+    # Rollups are written by the periodic flush, not by the request
+    assert await db[ROLLUPS].count_documents({}) == 0
+    assert await analytics_service.flush() == await db[ROLLUPS].count_documents({}) >= 9
+    assert await analytics_service.flush() == 0
+    
+    start, end = datetime.utcnow() - timedelta(days=1), datetime.utcnow() + timedelta(minutes=1)
+    mine = summarize(await analytics_service.usage("u1", "hour", start, end))
+    assert mine["requests"] == 3
+    assert mine["chunks_retrieved"] == 15
+    assert mine["cache_hit_ratio"] == round(2 / 3, 4)
+    assert 250 < mine["p50_response_time_ms"] <= 500
+    assert 1000 < mine["p95_response_time_ms"] <= 2000
+    
+    everyone = summarize(await analytics_service.usage(None, "minute", start, end))
+    assert everyone["requests"] == 4
+    # Questions logged without cache information don't count towards the ratio
+    assert everyone["cache_hit_ratio"] == round(2 / 3, 4)
+    
+    incremental = {rollup["_id"]: rollup for rollup in await db[ROLLUPS].find({}).to_list(None)}
+    await db[ROLLUPS].delete_many({})
+    assert await analytics_service.rebuild(db.query_logs.find({})) == len(incremental)
+    rebuilt = {rollup["_id"]: rollup for rollup in await db[ROLLUPS].find({}).to_list(None)}
+    assert rebuilt == incremental
+
+
+@pytest.mark.asyncio
+async def test_index_setup_is_idempotent_across_workers(monkeypatch, memory_mongo):
+    """Test that workers set up indexes concurrently and TTL changes happen in place"""
+    import asyncio
+    from pymongo import ASCENDING
+    from app.config import settings
+    from app.database import mongodb as mongodb_module
+    
+    logs = memory_mongo.query_logs
+    # Indexes of the baseline: plain timestamp and single-field user_id
+    await logs.create_index([("timestamp", ASCENDING)])
+    await logs.create_index([("user_id", ASCENDING)])
+    
+    monkeypatch.setattr(settings, "query_log_retention_days", 90)
+    await asyncio.gather(*(mongodb_module.create_indexes() for _ in range(4)))
+    assert (await logs.index_information())["timestamp_1"]["expireAfterSeconds"] == 90 * 86400
+    assert await mongodb_module.missing_indexes() == []
+    # The obsolete index is only dropped by the migration, once
+    assert "user_id_1" in await logs.index_information()
+    assert await mongodb_module.drop_obsolete_indexes() == ["query_logs.user_id_1"]
+    assert await mongodb_module.drop_obsolete_indexes() == []
+    
+    monkeypatch.setattr(settings, "query_log_retention_days", 0)
+    await asyncio.gather(*(mongodb_module.create_indexes() for _ in range(2)))
+    assert (await logs.index_information())["timestamp_1"]["expireAfterSeconds"] == mongodb_module.TTL_NEVER
+
+
+@pytest.mark.asyncio
+async def test_query_logs_archive_and_restore(monkeypatch, memory_mongo, tmp_path):
+    """Test that old days of query logs move to archive files and can be searched and re-imported"""
+    from datetime import datetime, timedelta
+    from app.services.log_archive import LogArchiver, archive_files, restore_logs, search_archives
+    
+    db = memory_mongo
+    
+    now = datetime(2026, 3, 10, 12, 0)
+    for days_ago, user_id in [(40, "u1"), (40, "u2"), (35, "u1"), (3, "u1")]:
+        await db.query_logs.insert_one({
+            "user_id": user_id, "question": "q", "answer": "a" * 500,
+            "response_time_ms": 100, "retrieved_chunks_count": 5, "timestamp": now - timedelta(days=days_ago)
+        })
+    
+    # A directory that is not mounted: nothing is archived or deleted
+    assert (await LogArchiver(str(tmp_path / "missing"), archive_after_days=30).run(now=now)).logs == 0
+    assert not (tmp_path / "missing").exists()
+    assert await db.query_logs.count_documents({}) == 4
+    
+    report = await LogArchiver(str(tmp_path), archive_after_days=30).run(now=now)
+    assert (report.days, report.logs) == (2, 3)
+    assert await db.query_logs.count_documents({}) == 1
+    # Nothing left to archive on a rerun
+    assert (await LogArchiver(str(tmp_path), archive_after_days=30).run(now=now)).logs == 0
+    
+    start = now - timedelta(days=36)
+    assert len(archive_files(str(tmp_path), start=start)) == 1
+    mine = list(search_archives(str(tmp_path), user_id="u1"))
+    assert [log["timestamp"] for log in mine] == [now - timedelta(days=40), now - timedelta(days=35)]
+    
+    assert await restore_logs(search_archives(str(tmp_path))) == 3
+    assert await restore_logs(search_archives(str(tmp_path))) == 3  # idempotent upserts
+    assert await db.query_logs.count_documents({}) == 4
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_shares_embeddings_and_rate_limits_across_workers(monkeypatch, tmp_path):
+    """Test that two workers on one SQLite cache share query embeddings and the provider budget"""
+    import asyncio
+    import os
+    import numpy as np
+    from types import SimpleNamespace
+    from app.services.cache import SQLiteCache, shared_cache
+    from app.services.embedding_service import EmbeddingService
+    from app.services.scheduler import OutboundScheduler
+    
+    path = str(tmp_path / "cache.db")
+    worker_a, worker_b = SQLiteCache(path, 100, 2**20), SQLiteCache(path, 100, 2**20)
+    
+    async def create(model, input, encoding_format):
+        return SimpleNamespace(data=[SimpleNamespace(index=0, embedding=[0.5, 0.25, 0.0, 1.0])])
+    
+    # Worker A embeds the question, worker B finds it without calling the provider
+    service = EmbeddingService()
+    service.client = SimpleNamespace(embeddings=SimpleNamespace(create=AsyncMock(side_effect=create)))
+    monkeypatch.setattr(shared_cache, "backend", worker_a)
+    first = await service.generate_embedding("what is the refund policy?")
+    
+    other = EmbeddingService()
+    other.client = SimpleNamespace(embeddings=SimpleNamespace(create=AsyncMock(side_effect=create)))
+    monkeypatch.setattr(shared_cache, "backend", worker_b)
+    embedding, cache_hit = await other.generate_embedding_cached("what is the refund policy?")
+    assert cache_hit
+    np.testing.assert_array_equal(embedding, first)
+    other.client.embeddings.create.assert_not_awaited()
+    
+    # Two requests per minute for the whole deployment: worker A spends them, worker B waits
+    async def call():
+        return "ok"
+    
+    monkeypatch.setattr(shared_cache, "backend", worker_a)
+    scheduler_a = OutboundScheduler("shared", requests_per_minute=2, tokens_per_minute=10**6, max_concurrency=4)
+    assert [await scheduler_a.run(call), await scheduler_a.run(call)] == ["ok", "ok"]
+    
+    monkeypatch.setattr(shared_cache, "backend", worker_b)
+    scheduler_b = OutboundScheduler("shared", requests_per_minute=2, tokens_per_minute=10**6, max_concurrency=4)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(scheduler_b.run(call), timeout=0.3)
+    
+    await worker_a.close()
+    await worker_b.close()
+    
+    # The cache stays within max_bytes (and its file cap) while the buckets keep working
+    small = SQLiteCache(str(tmp_path / "small.db"), max_entries=10**6, max_bytes=64 * 1024)
+    small.TRIM_EVERY = 10**9  # only the file cap triggers trimming
+    for i in range(200):
+        await small.set(f"key{i}", bytes(6144))
+    assert await small.get("key199") is not None and await small.get("key0") is None
+    assert os.path.getsize(tmp_path / "small.db") < 64 * 1024 * small.SIZE_HEADROOM + 64 * 4096
+    assert await small.take([("requests", 1, 10, 0.0)]) == 0
+    await small.close()
+
+
+@pytest.mark.asyncio
+async def test_readiness_waits_for_indexes_and_providers(monkeypatch, memory_qdrant, memory_mongo):
+    """Test /health/ready fails until warm-up has checked storage and providers"""
+    import asyncio
+    from app.config import settings
+    from app.database import mongodb as mongodb_module
+    from app.database.qdrant_client import qdrant_db
+    from app.endpoints import health as health_endpoints
+    from app.services.embedding_service import embedding_service
+    from app.services.health import readiness, warm_up
+    from app.services.llm_service import llm_service
+    
+    monkeypatch.setattr(settings, "warm_up_providers", "connect")
+    monkeypatch.setattr(settings, "health_retry_seconds", 0.01)
+    provider = Mock()
+    provider.models.list = AsyncMock()
+    monkeypatch.setattr(embedding_service, "_client", provider)
+    monkeypatch.setattr(llm_service, "_client", provider)
+    readiness.reset()
+    
+    task = asyncio.create_task(warm_up())
+    try:
+        await asyncio.sleep(0.1)
+        assert (await health_endpoints.ready()).status_code == 503
+        assert readiness.checks["mongodb"].startswith("error: missing indexes")
+        
+        await mongodb_module.create_indexes()
+        await asyncio.wait_for(task, timeout=5)
+        assert readiness.checks == {"mongodb": "ok", "qdrant": "ok", "embedding": "ok", "llm": "ok"}
+        assert qdrant_db.client.collection_exists(qdrant_db.collection_name)
+        assert (await health_endpoints.ready()).status_code == 200
+        
+        readiness.draining = True
+        assert (await health_endpoints.ready()).status_code == 503
+        assert await health_endpoints.live() == {"status": "alive"}
+    finally:
+        task.cancel()
+        readiness.reset()
+
+
+def test_chunk_references_and_response_compression():
+    """Test reference-mode chunks and br/gzip negotiation"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.schemas.query import AnswerResponse, chunk_fields
+    from app.utils.compression import CompressionMiddleware, negotiate_encoding
+    from app.utils.serialization import ModelResponse
+    
+    chunks = [
+        {"text": "Refunds take 30 days. " * 50, "score": 0.9,
+         "metadata": {"document_id": "d1", "filename": "policy.txt", "chunk_index": 3, "start_char": 2000, "end_char": 3100}}
+    ]
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, encodings=["br", "gzip"], minimum_size=500)
+    
+    @app.get("/answer/{chunk_format}")
+    async def answer(chunk_format: str):
+        return ModelResponse(AnswerResponse(
+            question="q", answer="a", **chunk_fields(chunks, chunk_format), response_time_ms=1
+        ))
+    
+    client = TestClient(app)
+    full = client.get("/answer/text", headers={"Accept-Encoding": "gzip"})
+    assert full.headers["content-encoding"] in ("gzip", "br")
+    assert int(full.headers["content-length"]) < len(chunks[0]["text"]) / 4
+    assert full.json()["retrieved_chunks"][0]["text"] == chunks[0]["text"]
+    
+    reference = client.get("/answer/reference", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in reference.headers  # below minimum_size
+    assert reference.json()["retrieved_chunks"] == []
+    assert reference.json()["chunk_references"] == [
+        {"document_id": "d1", "chunk_index": 3, "score": 0.9, "start_char": 2000, "end_char": 3100}
+    ]
+    
+    assert negotiate_encoding("gzip;q=0, br", ["gzip"]) is None
+    assert negotiate_encoding("br;q=0.5, gzip;q=1", ["br", "gzip"]) == "br"
+    assert negotiate_encoding("*", ["gzip"]) == "gzip"
+
+
+def test_index_page_is_prerendered_with_etag():
+    """Test the HTML index: compressed variant, strong ETag and 304 on revalidation"""
+    from fastapi.testclient import TestClient
+    from app.main import app, index_page
+    
+    client = TestClient(app)
+    page = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert page.status_code == 200
+    assert page.headers["content-encoding"] == "gzip"
+    assert page.headers["etag"] == f'"{index_page().etag}-gzip"'
+    assert "max-age" in page.headers["cache-control"]
+    assert "<html" in page.text
+    
+    cached = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": page.headers["etag"]})
+    assert cached.status_code == 304 and cached.content == b""
+    # Any encoding of the same content is still current
+    assert client.get("/", headers={"Accept-Encoding": "identity", "If-None-Match": page.headers["etag"]}).status_code == 304
+    assert client.get("/", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_search_scope_filters_documents(monkeypatch, memory_qdrant, memory_mongo):
+    """Test document id, filename and upload date filters, including deduplicated chunks"""
+    import io
+    from datetime import datetime, timedelta, timezone
+    import numpy as np
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+    from app.config import settings
+    from app.database.qdrant_client import qdrant_db, search_similar_chunks
+    from app.schemas.query import DocumentFilter
+    from app.services.document_processor import DocumentProcessor
+    from app.services.embedding_service import embedding_service
+    from app.services.search_scope import resolve_scope
+    
+    monkeypatch.setattr(settings, "embedding_dimensions", 8)
+    monkeypatch.setattr(settings, "embedding_index_dimensions", 0)
+    
+    async def embed(texts, priority=None, model=None):
+        return np.ones((len(texts), 8), dtype=np.float32)
+    
+    monkeypatch.setattr(embedding_service, "generate_embeddings_batch", embed)
+    
+    def upload(text: str, filename: str) -> UploadFile:
+        data = text.encode()
+        return UploadFile(io.BytesIO(data), size=len(data), filename=filename,
+                          headers=Headers({"content-type": "text/plain"}))
+    
+    processor = DocumentProcessor()
+    manual = await processor.process_and_store_document(upload("Pump manual. Prime before use.", "Pump-Manual.txt"), "u1")
+    notes = await processor.process_and_store_document(upload("Meeting notes. Budget approved.", "notes.txt"), "u1")
+    # Same text as the manual: its only chunk references the manual's point
+    copy = await processor.process_and_store_document(upload("Pump manual. Prime before use.", "copy.txt"), "u1")
+    
+    def search(scope):
+        results = search_similar_chunks(np.ones(8, dtype=np.float32), "u1", limit=10, score_threshold=0.0,
+                                        document_ids=scope.document_ids, point_ids=scope.point_ids)
+        return {chunk["metadata"]["document_id"] for chunk in results}
+    
+    assert (await resolve_scope("u1", None)).document_ids is None
+    assert search(await resolve_scope("u1", DocumentFilter(filenames=["pump-*.TXT"]))) == {manual.id}
+    assert search(await resolve_scope("u1", DocumentFilter(document_ids=[notes.id]))) == {notes.id}
+    assert search(await resolve_scope("u1", DocumentFilter(document_ids=[copy.id]))) == {manual.id}
+    # Other users' ids never widen the scope
+    assert search(await resolve_scope("u2", DocumentFilter(document_ids=[notes.id]))) == set()
+    
+    future = datetime.now(timezone.utc) + timedelta(days=1)
+    assert search(await resolve_scope("u1", DocumentFilter(uploaded_after=future))) == set()
+    assert search(await resolve_scope("u1", DocumentFilter(uploaded_before=future, filenames=["notes.txt"]))) == {notes.id}
+
+def test_retrieval_policy_cuts_at_score_gap():
+    """Adaptive depth keeps a clear winner alone and a flat distribution whole"""
+    from app.services.retrieval_policy import RetrievalPolicy, parse_min_scores
+    
+    policy = RetrievalPolicy(adaptive=True, max_chunks=8, min_chunks=1, relative_threshold=0.75,
+                             min_gap=0.08, default_min_score=0.1, min_scores=parse_min_scores("model-a=0.3, bad"))
+    assert policy.min_score("model-a") == 0.3
+    assert policy.min_score("model-b") == 0.1
+    
+    def chunks(*scores):
+        return [{"content": str(score), "score": score} for score in scores]
+    
+    kept, decision = policy.select(chunks(0.82, 0.51, 0.49, 0.47), 0.1)
+    assert len(kept) == 1 and decision.reason == "relative"
+    kept, decision = policy.select(chunks(0.80, 0.78, 0.66, 0.65), 0.1)
+    assert len(kept) == 2 and decision.reason == "gap" and decision.cutoff_score == 0.78
+    kept, decision = policy.select(chunks(0.70, 0.69, 0.68, 0.66, 0.65), 0.1)
+    assert len(kept) == 5 and decision.reason == "all"
+    assert policy.select([], 0.1)[1].to_dict()["reason"] == "empty"
+    
+    # Never fewer than min_chunks, however steep the drop
+    policy.min_chunks = 2
+    kept, decision = policy.select(chunks(0.9, 0.3, 0.2), 0.1)
+    assert len(kept) == 2 and decision.reason == "min_chunks"
+    
+    policy.adaptive = False
+    assert policy.fetch_limit == 5
+    assert len(policy.select(chunks(0.9, 0.3, 0.2), 0.1)[0]) == 3
+
+@pytest.mark.asyncio
+async def test_model_cascade_escalates_on_low_confidence(monkeypatch):
+    """The fast tier answers unless retrieval, its answer or its confidence say otherwise"""
+    import asyncio
+    from app.services.llm_service import llm_service
+    from app.services.model_cascade import CascadeTimeout, LLMTier, ModelCascade
+    from app.utils.deadline import Deadline
+    
+    replies = {}
+    calls = []
+    
+    async def generate(question, context_chunks, model=None, report_confidence=False, priority=None):
+        calls.append(model)
+        if model == "slow-small":
+            await asyncio.sleep(1)
+        return replies.get(model, "The strong answer.")
+    
+    monkeypatch.setattr(llm_service, "generate_answer", generate)
+    cascade = ModelCascade(fast=LLMTier("fast", "small", 5.0), strong=LLMTier("strong", "large", 5.0),
+                           min_retrieval_score=0.3, confidence_check=True, min_confidence=0.7)
+    chunks = [{"text": "Prime the pump first.", "score": 0.8}]
+    
+    async def ask(chunks):
+        calls.clear()
+        return await cascade.answer("How do I start the pump?", chunks, Deadline(10))
+    
+    replies["small"] = "Prime it first.\nCONFIDENCE: 0.9"
+    answer, decision = await ask(chunks)
+    assert answer == "Prime it first." and calls == ["small"]
+    assert (decision.tier, decision.confidence, decision.escalation_reason) == ("fast", 0.9, None)
+    
+    replies["small"] = "Prime it first.\nCONFIDENCE: 0.4"
+    answer, decision = await ask(chunks)
+    assert answer == "The strong answer." and calls == ["small", "large"]
+    assert decision.to_dict()["escalation_reason"] == "low_confidence" and decision.tier == "strong"
+    
+    replies["small"] = "The context does not contain enough information to answer this."
+    assert (await ask(chunks))[1].escalation_reason == "insufficient_context"
+    # Without chunks the strong tier cannot do better
+    assert (await ask([]))[1].tier == "fast"
+    
+    decision = (await ask([{"text": "Unrelated.", "score": 0.1}]))[1]
+    assert decision.escalation_reason == "low_retrieval_score" and calls == ["large"]
+    
+    cascade.fast = LLMTier("fast", "slow-small", 0.05)
+    decision = (await ask(chunks))[1]
+    assert decision.escalation_reason == "fast_tier_failed" and decision.fast_tier_ms >= 40
+    
+    # Escalating past the deadline falls back to the fast answer, flagged as unconfirmed
+    cascade.fast = LLMTier("fast", "small", 5.0)
+    cascade.strong = LLMTier("strong", "slow-small", 5.0)
+    replies["small"] = "Prime it first.\nCONFIDENCE: 0.4"
+    answer, decision = await cascade.answer("How do I start the pump?", chunks, Deadline(0.1))
+    assert answer == "Prime it first."
+    assert (decision.tier, decision.timed_out, decision.low_confidence) == ("fast", True, True)
+    assert decision.escalation_reason == "low_confidence"
+    
+    # Without a fast answer the partial decision comes with the timeout
+    with pytest.raises(CascadeTimeout) as timeout:
+        await cascade.answer("How do I start the pump?", [{"text": "Unrelated.", "score": 0.1}], Deadline(0.1))
+    assert timeout.value.decision.to_dict()["escalation_reason"] == "low_retrieval_score"
+    assert timeout.value.decision.timed_out and timeout.value.decision.tier == "strong"
+    cascade.strong = LLMTier("strong", "large", 5.0)
+    
+    cascade.fast = None
+    assert (await ask(chunks))[1].tier == "strong" and calls == ["large"]